@@ -0,0 +1,99 @@
+"""Stand-ins for the parts of discord.py the order handlers touch.
+
+Only what the cog, the modal and the monitor actually call is implemented.
+Every "network" call returns immediately and is counted, so the benchmark
+measures our code and not Discord.
+"""
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str = None):
+        self.id = user_id
+        self.name = name or f"user{user_id}"
+        self.discriminator = "0"
+        self.mention = f"<@{user_id}>"
+
+    def __str__(self):
+        return f"{self.name}#{self.discriminator}"
+
+
+class FakeResponse:
+    def __init__(self):
+        self._done = False
+        self.sent = []
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        self.sent.append((content, kwargs))
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def send_modal(self, modal):
+        self._done = True
+        self.sent.append((None, {"modal": modal}))
+
+    async def edit_message(self, **kwargs):
+        self._done = True
+        self.sent.append((None, kwargs))
+
+
+class FakeFollowup:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append((content, kwargs))
+
+
+class FakeInteraction:
+    def __init__(self, client, user: FakeUser):
+        self.client = client
+        self.user = user
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+        self.extras = {}
+
+
+class FakeDM:
+    """Same surface as `core.dm.DMDispatcher`; nothing is delivered."""
+
+    def __init__(self):
+        self.stats = {"queued": 0}
+
+    def send(self, user_id: int, content: str) -> bool:
+        self.stats["queued"] += 1
+        return True
+
+
+class FakeOutbox:
+    """Same surface as `core.outbox.Outbox`; posts are only counted."""
+
+    def __init__(self):
+        self.stats = {"posted": 0}
+
+    def post(self, channel_id: int, content: str = None, embed=None) -> str:
+        self.stats["posted"] += 1
+        return str(self.stats["posted"])
+
+
+class FakeBot:
+    def __init__(self):
+        self.dm = FakeDM()
+        self.outbox = FakeOutbox()
+        self.user = FakeUser(0, "bench-bot")
+
+    def is_closed(self) -> bool:
+        return False
+
+    async def wait_until_ready(self):
+        return None
+
+    def get_user(self, user_id: int):
+        return FakeUser(user_id)
+
+    def get_channel(self, channel_id: int):
+        return None
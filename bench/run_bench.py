@@ -0,0 +1,271 @@
+"""Offline benchmark for the order commands, persistence and deadline monitor.
+
+    python -m bench.run_bench --sizes 1000,10000,100000 --backend json --out bench_results.json
+
+Each size runs in a fresh process inside a scratch directory (its own
+config.json, orders and logs), seeded with synthetic orders. The real
+`OrderCommands` handlers, `DonHang.on_submit` and the monitor's `_fire` are
+driven with the fakes from `bench.fakes`. The output file is plain JSON, so
+two revisions can be compared with any diff tool.
+"""
+import argparse, asyncio, itertools, json, os, platform, random, re, resource, subprocess, sys, tempfile, time
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+ADMIN_ID = 1
+WORKERS = range(100, 150)
+# Share of each status in the synthetic set (OrderStatus names)
+STATUS_MIX = (("CHO_DUYET", 0.40), ("DA_DUYET", 0.10), ("DANG_XU_LY", 0.30),
+              ("HOAN_THANH", 0.15), ("QUA_HAN", 0.05))
+
+
+def summarize(samples: list) -> dict:
+    """n, p50, p99, mean and max in milliseconds."""
+    s = sorted(samples)
+    if not s:
+        return {"n": 0}
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))] * 1000
+    return {"n": len(s), "p50_ms": round(pick(0.50), 3), "p99_ms": round(pick(0.99), 3),
+            "mean_ms": round(sum(s) / len(s) * 1000, 3), "max_ms": round(s[-1] * 1000, 3)}
+
+
+def _size(*paths) -> int:
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+def make_orders(n: int, rng: random.Random) -> list:
+    from core.models import Order, OrderStatus
+    now = int(time.time())
+    weights = [w for _, w in STATUS_MIX]
+    statuses = [OrderStatus[name] for name, _ in STATUS_MIX]
+    customers = max(1, n // 10)
+    out = []
+    for i, status in enumerate(rng.choices(statuses, weights, k=n)):
+        o = Order(
+            ma_don=f"{i:08x}",
+            user=f"khach{i % customers}#0",
+            user_id=1000 + i % customers,
+            hinh_thuc=rng.choice(("SL", "RP", "Event", "Modul")),
+            loai=rng.choice(("", "Tank", "Air", "Heli", "Ship")),
+            so_luong=str(rng.randint(1, 20)),
+            ghi_chu="",
+            trang_thai=status,
+            thoi_gian=now - rng.randint(0, 180 * 86400),
+        )
+        if status in (OrderStatus.DANG_XU_LY, OrderStatus.HOAN_THANH, OrderStatus.QUA_HAN):
+            worker = rng.choice(WORKERS)
+            o.nguoi_nhan, o.nguoi_nhan_id = f"tho{worker}#0", worker
+            o.thoi_han = now + rng.randint(3600, 7 * 86400) if status == OrderStatus.DANG_XU_LY else o.thoi_gian + 86400
+            o.qua_han = status == OrderStatus.QUA_HAN
+        out.append(o)
+    return out
+
+
+def seed(items: list, backend: str) -> dict:
+    """Write the synthetic set the way the bot would find it on disk."""
+    t = perf_counter()
+    if backend == "json":
+        orders_mod = sys.modules["core.orders"]
+        orders_mod.orders.clear()
+        orders_mod.orders.update((o.ma_don, o) for o in items)
+        orders_mod.save_orders()
+        orders_mod.orders.clear()
+        written = _size(orders_mod.order_file)
+    else:
+        from core.store import SqliteOrderStore
+        db = SqliteOrderStore("orders.db")
+        db.meta("migrated_from_json", "bench")
+        db.put_many(items)
+        db.db.close()
+        written = _size("orders.db", "orders.db-wal")
+    return {"seed_ms": round((perf_counter() - t) * 1000, 1), "seed_bytes": written}
+
+
+async def _timed(samples: dict, name: str, coro):
+    t = perf_counter()
+    await coro
+    samples.setdefault(name, []).append(perf_counter() - t)
+
+
+async def run_commands(cog, bot, store, rng: random.Random, iterations: int) -> dict:
+    """One order's full life cycle per iteration, plus the read-only commands."""
+    from discord import app_commands
+    from cogs.order_commands import DonHang
+    from core.models import OrderStatus
+    from bench.fakes import FakeInteraction, FakeUser
+
+    admin, samples = FakeUser(ADMIN_ID, "admin"), {}
+    choice = app_commands.Choice(name=OrderStatus.DANG_XU_LY.value, value=OrderStatus.DANG_XU_LY.code)
+    existing = [mid for mid, _ in itertools.islice(store.keys(), 10000)]
+    done = [o.ma_don for o in store.find(trang_thai=OrderStatus.HOAN_THANH, limit=iterations)]
+
+    async def submit(customer):
+        modal = DonHang()
+        # TextInput.value reads the submitted text from _value
+        for item, value in ((modal.hinh_thuc, "SL"), (modal.loai, "Tank"), (modal.so_luong, "3"), (modal.ghi_chu, "")):
+            item._value = value
+        inter = FakeInteraction(bot, customer)
+        await _timed(samples, "donhang_submit", modal.on_submit(inter))
+        return re.search(r"`(\w+)`", inter.response.sent[-1][0]).group(1)
+
+    def call(name, user, *args):
+        cmd = getattr(cog, name)
+        return _timed(samples, name, cmd.callback(cog, FakeInteraction(bot, user), *args))
+
+    for i in range(iterations):
+        customer, worker = FakeUser(1000 + rng.randrange(100)), FakeUser(rng.choice(WORKERS))
+        mid = await submit(customer)
+        await call("trangthai", customer, rng.choice(existing))
+        await call("duyetdon", admin, mid)
+        await call("nhancay", worker, mid, 2)
+        await call("giahan", admin, mid, 30)
+        await call("suadon", customer, mid, f"ghi chú {i}")
+        await call("hoanthanh", worker, mid)
+        await call("huydon", customer, await submit(customer))
+        if done:
+            await call("xoadon", admin, done.pop())
+        await call("thongke", worker)
+        await call("danhsachdon", admin)
+        await call("danhsachdon", admin, choice)
+        inter = FakeInteraction(bot, admin)
+        await _timed(samples, "autocomplete", cog.trangthai_ma_don(inter, f"{rng.randrange(256):02x}"))
+    return {name: summarize(s) for name, s in samples.items()}
+
+
+async def run_monitor(bot, store, due: int) -> dict:
+    """Cost of seeding the deadline heap and of one tick that fires `due` orders."""
+    from core.models import OrderStatus
+    from core.scheduler import scheduler
+    from tasks.order_monitor import load_deadlines, _fire
+
+    t = perf_counter()
+    seeded = load_deadlines(store)
+    seed_ms = (perf_counter() - t) * 1000
+
+    t = perf_counter()
+    scheduler.pop_due(time.time())
+    idle_ms = (perf_counter() - t) * 1000
+
+    past = int(time.time()) - 1
+    for o in store.find(trang_thai=OrderStatus.DANG_XU_LY, limit=due):
+        o.thoi_han = past
+        store.put(o)
+        scheduler.schedule(o.ma_don, past)
+    t = perf_counter()
+    fired = scheduler.pop_due(time.time())
+    for mid, kind in fired:
+        await _fire(bot, store, 1, mid, kind)
+    tick_ms = (perf_counter() - t) * 1000
+    return {"seeded": seeded, "seed_ms": round(seed_ms, 3), "idle_tick_ms": round(idle_ms, 4),
+            "fired": len(fired), "tick_ms": round(tick_ms, 3),
+            "per_fire_us": round(tick_ms * 1000 / len(fired), 2) if fired else None}
+
+
+async def run_one(n: int, backend: str, iterations: int, due: int) -> dict:
+    rng = random.Random(42)
+    result = {"orders": n, "backend": backend, "iterations": iterations}
+    items = make_orders(n, rng)
+    result.update(seed(items, backend))
+    del items
+
+    from core.store import get_store
+    t = perf_counter()
+    store = get_store()
+    store.start()
+    result["load_ms"] = round((perf_counter() - t) * 1000, 1)
+
+    from cogs.order_commands import OrderCommands
+    from bench.fakes import FakeBot
+    bot = FakeBot()
+    cog = OrderCommands(bot)
+    result["commands"] = await run_commands(cog, bot, store, rng, iterations)
+    result["monitor"] = await run_monitor(bot, store, due)
+
+    persist = {}
+    if backend == "json":
+        orders_mod = sys.modules["core.orders"]
+        t = perf_counter()
+        await store.close()
+        persist["flush_ms"] = round((perf_counter() - t) * 1000, 2)
+        persist["journal_bytes"] = _size(orders_mod.journal_file)
+        persist["writer"] = dict(orders_mod.writer.stats)
+        t = perf_counter()
+        orders_mod.save_orders()
+        persist["save_orders_ms"] = round((perf_counter() - t) * 1000, 1)
+        persist["save_orders_bytes"] = _size(orders_mod.order_file)
+    else:
+        await store.close()
+        persist["db_bytes"] = _size("orders.db", "orders.db-wal")
+    result["persistence"] = persist
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+def _child(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        os.chdir(tmp)
+        with open("config.json", "w", encoding="utf-8") as f:
+            json.dump({"TOKEN": "bench", "GUILD_ID": "1", "ADMIN_ID": [ADMIN_ID],
+                       "LOG_CHANNEL_ID": "2", "ADMIN_CHANNEL_ID": "3",
+                       "STORE_BACKEND": args.backend, "STORE_PATH": "orders.db"}, f)
+        # Imported after chdir: every path in core is relative
+        from core.logger import flush_logs
+        result = asyncio.run(run_one(args.one, args.backend, args.iterations, args.due))
+        flush_logs()
+        os.chdir(ROOT)
+    return result
+
+
+def _revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline benchmark for the order bot")
+    ap.add_argument("--sizes", default="1000,10000,100000", help="comma separated order counts (up to 1000000)")
+    ap.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    ap.add_argument("--iterations", type=int, default=200, help="order life cycles per size")
+    ap.add_argument("--due", type=int, default=1000, help="orders expiring in the measured monitor tick")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--one", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.one is not None:
+        print(json.dumps(_child(args), ensure_ascii=False))
+        return
+
+    results = []
+    for n in (int(s) for s in args.sizes.split(",") if s.strip()):
+        cmd = [sys.executable, "-m", "bench.run_bench", "--one", str(n), "--backend", args.backend,
+               "--iterations", str(args.iterations), "--due", str(args.due)]
+        proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            sys.exit(f"Benchmark {n} đơn thất bại")
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(r)
+        slowest = max(r["commands"].items(), key=lambda kv: kv[1].get("p99_ms", 0))
+        print(f"{n:>8} đơn: load {r['load_ms']}ms, chậm nhất /{slowest[0]} p99 {slowest[1]['p99_ms']}ms, "
+              f"tick {r['monitor']['tick_ms']}ms, RSS {r['peak_rss_mb']}MB")
+
+    report = {
+        "revision": _revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"Đã ghi {args.out}")
+
+
+if __name__ == "__main__":
+    main()
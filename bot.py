@@ -1,7 +1,9 @@
-
 import os
 import sys
+import json
+import time
 import asyncio
+import hashlib
 from typing import List
 
 # Ensure current directory is on the Python path
@@ -13,35 +15,93 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 
-from core.config import load_config
-from core.logger import log
+from core.config import get_config
+from core.logger import log, configure_logger, flush_logs
 # orders helpers are imported for side effects / use by cogs
-from core.orders import orders, save_orders, generate_order_id  # noqa: F401
+from core.store import get_store, OrderConflict
+from core.dm import DMDispatcher
+from core.outbox import Outbox
+from core.journal import write_atomic
+from core import metrics
+from core.admission import TooManyPending
+
+# Startup stage timings in ms, reported once the gateway is ready
+_started = time.perf_counter()
+startup_times = {}
 
 # -----------------------------
 # Configuration
 # -----------------------------
-config = load_config()
-TOKEN = config.get("TOKEN")
-GUILD_ID_RAW = config.get("GUILD_ID")
+config = get_config()
+TOKEN = config.token
 
 if not TOKEN:
     raise RuntimeError("Missing TOKEN in config")
-if not GUILD_ID_RAW:
+if not config.guild_id:
     raise RuntimeError("Missing GUILD_ID in config")
 
-GUILD_ID = int(GUILD_ID_RAW)
-PREFIX = config.get("PREFIX", "!")
+GUILD_ID = config.guild_id
+PREFIX = config.prefix
+# Fingerprint of the last synced command tree; sync is skipped while it matches
+SYNC_STATE_FILE = ".command_sync.json"
+# `python bot.py --force-sync` (or FORCE_SYNC=1) syncs even if nothing changed
+FORCE_SYNC = "--force-sync" in sys.argv or os.environ.get("FORCE_SYNC") == "1"
+
+configure_logger(
+    json=config.get("LOG_FORMAT", "text") == "json",
+    max_bytes=int(config.get("LOG_MAX_BYTES", 0)),
+    rotate=config.get("LOG_ROTATE") or None,
+    backups=int(config.get("LOG_BACKUPS", 14)),
+)
+metrics.configure_metrics(bool(config.get("METRICS_ENABLED", False)))
 
 # -----------------------------
 # Bot setup
 # -----------------------------
 intents = discord.Intents.all()
 
-bot = commands.Bot(
+
+class MetricsTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Start of the handler, read back in on_app_command_completion / the error handler
+        interaction.extras["t0"] = time.perf_counter()
+        return True
+
+
+def _command_ms(interaction: discord.Interaction):
+    t0 = interaction.extras.get("t0")
+    return None if t0 is None else (time.perf_counter() - t0) * 1000
+
+
+class CaveBot(commands.Bot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Every DM (approvals, extensions, reminders) goes through this queue
+        self.dm = DMDispatcher(self)
+        # Channel posts (new-order embeds, overdue broadcasts), persisted until sent
+        self.outbox = Outbox(self)
+        # With MULTI_INSTANCE: the leader lease this process holds while connected
+        self.lease = None
+
+    async def close(self):
+        # Let queued DMs go out while the HTTP session is still open
+        await self.dm.stop()
+        await self.outbox.stop()
+        await super().close()
+        if self.lease is not None:
+            # Hand over to a standby right away instead of after the TTL
+            self.lease.release()
+        # Anything still waiting in the debounce window goes to disk now
+        await get_store().close()
+        log("Đã ghi toàn bộ đơn hàng trước khi tắt.")
+        flush_logs()
+
+
+bot = CaveBot(
     command_prefix=PREFIX,
     intents=intents,
     help_command=None,
+    tree_cls=MetricsTree,
 )
 
 print(">>> Đã tạo bot, chuẩn bị khởi động…")
@@ -55,6 +115,56 @@ async def _print_registered_commands(cmds: List[app_commands.AppCommand]) -> Non
         print(f"  /{cmd.name} - {cmd.description}")
 
 
+def _stage(name: str, since: float) -> float:
+    now = time.perf_counter()
+    startup_times[name] = round((now - since) * 1000, 1)
+    return now
+
+
+def _command_payload(cmd) -> dict:
+    # discord.py >= 2.4 needs the tree to build the payload
+    try:
+        return cmd.to_dict(bot.tree)
+    except TypeError:
+        return cmd.to_dict()
+
+
+def tree_fingerprint(guild: discord.abc.Snowflake) -> str:
+    """Stable hash of everything sync would upload: names, params, descriptions, permissions."""
+    payload = {
+        "app": bot.application_id,
+        "guild": guild.id,
+        "global": sorted((_command_payload(c) for c in bot.tree.get_commands()), key=lambda d: d["name"]),
+        "local": sorted((_command_payload(c) for c in bot.tree.get_commands(guild=guild)), key=lambda d: d["name"]),
+    }
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _last_fingerprint():
+    try:
+        with open(SYNC_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f).get("fingerprint")
+    except (OSError, ValueError):
+        return None
+
+
+async def sync_commands(guild: discord.abc.Snowflake, force: bool = False) -> bool:
+    """Sync the tree only if it differs from the last successful sync. Returns True if it synced."""
+    fingerprint = tree_fingerprint(guild)
+    if not force and fingerprint == _last_fingerprint():
+        print("[Setup] Cây lệnh không đổi, bỏ qua đồng bộ")
+        return False
+    await bot.tree.sync(guild=None)
+    synced = await bot.tree.sync(guild=guild)
+    print(f"[Setup] Đã đồng bộ {len(bot.tree.get_commands())} lệnh chung và {len(synced)} lệnh cho server {guild.id}")
+    # Recorded only after both syncs succeeded, so a failed sync is retried next start
+    write_atomic(SYNC_STATE_FILE, json.dumps(
+        {"fingerprint": fingerprint, "synced_at": int(time.time())}).encode("utf-8"))
+    log(f"[SYNC] Đã đồng bộ cây lệnh ({fingerprint[:12]})")
+    return True
+
+
 @bot.event
 async def on_ready():
     """Runs once the bot is fully connected."""
@@ -82,43 +192,74 @@ async def on_ready():
         traceback.print_exc()
         return
 
+    if "gateway_ready" not in startup_times:
+        _stage("gateway_ready", _started)
+        report = ", ".join(f"{k}={v}ms" for k, v in startup_times.items())
+        print(f"⏱️ Thời gian khởi động: {report}")
+        log(f"[KHỞI ĐỘNG] {report}", **{f"{k}_ms": v for k, v in startup_times.items()})
+
     log("Bot đã sẵn sàng.")
 
-    # Start background order monitoring task (if available)
-    try:
-        from tasks.order_monitor import don_giam_sat  # imported here to avoid import at module load
-        # Prefer asyncio.create_task over the deprecated loop.create_task
+
+def start_background_jobs(store):
+    """Deadline monitor and archiver. With MULTI_INSTANCE this process already holds the leader lease."""
+    from tasks.order_monitor import don_giam_sat
+    if store.archive is not None:
+        # Moves finished orders out of the live store once they are old enough
+        from core.archive import run_archiver
+        asyncio.create_task(run_archiver(store, float(config.get("ARCHIVE_AFTER_DAYS"))))
+    if bot.lease is not None:
+        from core.cluster import follow_changes
+        # Picks up writes a previous leader made during the handover
+        asyncio.create_task(follow_changes(store))
+        asyncio.create_task(don_giam_sat(bot, bot.lease))
+    else:
         asyncio.create_task(don_giam_sat(bot))
-        print("✅ Đã khởi động giám sát đơn hàng")
-    except Exception as e:
-        print(f"❌ Lỗi khi khởi động giám sát: {e}")
+    print("✅ Đã khởi động giám sát đơn hàng")
 
 
 @bot.event
 async def setup_hook():
     """Discord.py 2.x lifecycle hook for async setup before connecting."""
     try:
+        # Open the order store (JSON journal or SQLite, per STORE_BACKEND);
+        # JSON changes are group-committed off the event loop from here on
+        t = time.perf_counter()
+        store = get_store()
+        store.start()
+        bot.dm.start()
+        bot.outbox.start()
+        t = _stage("store_load", t)
+        start_background_jobs(store)
+
+        if metrics.enabled:
+            from core.orders import writer
+            from core.scheduler import scheduler
+            metrics.gauge("dm_queue_depth", bot.dm.queue.qsize)
+            metrics.gauge("outbox_pending", lambda: len(bot.outbox.pending))
+            metrics.gauge("persist_pending", lambda: writer.pending)
+            metrics.gauge("scheduled_events", lambda: len(scheduler))
+            asyncio.create_task(metrics.watch_loop_lag())
+            port = int(config.get("METRICS_PORT", 0) or 0)
+            if port:
+                # Kept on the bot so the server is not garbage collected
+                bot.metrics_server = await metrics.serve_metrics(port)
+
         print("[Setup] Đang tải extensions…")
 
         # Load cogs/extensions
         await bot.load_extension("cogs.order_commands")
         print("[Setup] Đã tải order_commands thành công")
+        t = _stage("extension_load", t)
 
         print("[Setup] Đang đồng bộ lệnh…")
         guild_obj = discord.Object(id=GUILD_ID)
+        # No clear_commands() here: that left the guild without commands until
+        # the sync finished. Syncing uploads the whole tree anyway.
+        await sync_commands(guild_obj, force=FORCE_SYNC)
+        _stage("sync", t)
 
-        # Clear and resync only for the target guild for faster iteration
-        print("[Setup] Xóa lệnh cũ ở guild mục tiêu…")
-        bot.tree.clear_commands(guild=guild_obj)
-
-        # First, ensure global cache is up-to-date (optional but harmless)
-        await bot.tree.sync(guild=None)
-
-        print("[Setup] Đồng bộ lệnh mới cho guild mục tiêu…")
-        synced = await bot.tree.sync(guild=guild_obj)
-        print(f"[Setup] Đã đồng bộ {len(synced)} lệnh cho server {GUILD_ID}")
-
-        if len(synced) == 0:
+        if not bot.tree.get_commands():
             print("⚠️ CẢNH BÁO: Không có lệnh nào được đồng bộ!")
             print("👉 Kiểm tra:")
             print("  1. Bot có quyền applications.commands")
@@ -136,10 +277,22 @@ async def setup_hook():
 # -----------------------------
 # App command error handling
 # -----------------------------
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    ms = _command_ms(interaction)
+    if ms is not None:
+        metrics.observe("command_ms", ms, command=command.qualified_name)
+
+
 @bot.tree.error
 async def on_app_command_error(
     interaction: discord.Interaction, error: app_commands.AppCommandError
 ):
+    name = interaction.command.qualified_name if interaction.command else "unknown"
+    metrics.inc("command_errors", command=name, error=type(error).__name__)
+    ms = _command_ms(interaction)
+    if ms is not None:
+        metrics.observe("command_ms", ms, command=name)
     try:
         if isinstance(error, app_commands.CommandOnCooldown):
             await interaction.response.send_message(
@@ -148,6 +301,22 @@ async def on_app_command_error(
             )
             return
 
+        if isinstance(error, TooManyPending):
+            await interaction.response.send_message(
+                f"⛔ Bạn đang có {error.pending} đơn chờ xử lý (tối đa {error.limit}).",
+                ephemeral=True,
+            )
+            return
+
+        if isinstance(getattr(error, "original", None), OrderConflict):
+            # Another instance changed the order first; nothing from this command was saved
+            text = "⚠️ Đơn vừa được cập nhật ở nơi khác, chưa có gì được lưu. Vui lòng thử lại."
+            if interaction.response.is_done():
+                await interaction.followup.send(text, ephemeral=True)
+            else:
+                await interaction.response.send_message(text, ephemeral=True)
+            return
+
         if isinstance(error, app_commands.MissingPermissions):
             await interaction.response.send_message(
                 "⛔ Bạn không có quyền sử dụng lệnh này!",
@@ -172,5 +341,37 @@ async def on_app_command_error(
         print(f"❌ Lỗi trong error handler: {inner}")
 
 
+async def run_standby():
+    """MULTI_INSTANCE: stay off the gateway until this process holds the leader lease.
+
+    Every instance would otherwise receive every interaction and post every
+    DM/outbox message, so exactly one is connected at a time; the others
+    wait as standbys and one of them connects once the leader's lease lapses.
+    """
+    from core.cluster import Lease, wait_for_lease, hold, INSTANCE_ID
+    lease = Lease(get_store(), "leader", float(config.get("LEADER_LEASE_TTL", 6)))
+    print(f"⏳ Chế độ nhiều instance ({INSTANCE_ID}): chờ lease, chưa kết nối Discord…")
+    await wait_for_lease(lease)
+    print(f"✅ {INSTANCE_ID} giữ lease, đang kết nối Discord")
+    log(f"[CLUSTER] {INSTANCE_ID} giữ lease {lease.name}, kết nối gateway")
+    bot.lease = lease
+    async with bot:
+        # Renewed from before login on
+        keeper = asyncio.create_task(hold(lease))
+        gateway = asyncio.create_task(bot.start(TOKEN))
+        await asyncio.wait((keeper, gateway), return_when=asyncio.FIRST_COMPLETED)
+        if keeper.done() and not lease.released:
+            # A standby may take over now: disconnect rather than serve twice
+            print(f"⚠️ {INSTANCE_ID} mất lease, ngắt kết nối")
+            await bot.close()
+        else:
+            keeper.cancel()
+        await gateway
+
+
 print(">>> Bot đã sẵn sàng, đang khởi động…")
-bot.run(TOKEN)
\ No newline at end of file
+if config.get("MULTI_INSTANCE"):
+    discord.utils.setup_logging()
+    asyncio.run(run_standby())
+else:
+    bot.run(TOKEN)
\ No newline at end of file
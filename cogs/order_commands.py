@@ -1,9 +1,10 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-from datetime import datetime, timezone, timedelta
+import asyncio
 import os
 import sys
+from datetime import datetime, timezone
 
 # Add the parent directory to sys.path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -12,7 +13,16 @@ if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
 # Now import from core as a package
-from core import orders, save_orders, generate_order_id, log
+from core import get_store, get_config, reload_config, generate_order_id, log
+from core.models import Order, OrderStatus, now_ts, fmt_time
+from core.stats import stats
+from core.index import autocomplete
+from core.search import search_index
+from core.admission import admission, TooManyPending
+from core.store import OrderConflict
+from core.analytics import analytics
+from core import export
+from core import metrics
 
 class DonHang(discord.ui.Modal, title="Đặt đơn Cave Store"):
     def __init__(self):
@@ -26,23 +36,27 @@ class DonHang(discord.ui.Modal, title="Đặt đơn Cave Store"):
 
     async def on_submit(self, interaction: discord.Interaction):
         user   = interaction.user
+        # Checked again here: several forms may have been opened before the first was sent
+        try:
+            admission.check_pending(user.id)
+        except TooManyPending as e:
+            return await interaction.response.send_message(
+                f"⛔ Bạn đang có {e.pending} đơn chờ xử lý (tối đa {e.limit}).", ephemeral=True)
         ma_don = generate_order_id()
-        orders[ma_don] = {
-            "user": f"{user.name}#{user.discriminator}",
-            "user_id": user.id,
-            "hinh_thuc": self.hinh_thuc.value,
-            "loai": self.loai.value,
-            "so_luong": self.so_luong.value,
-            "ghi_chu": self.ghi_chu.value,
-            "trang_thai": "⏳ Chờ duyệt",
-            "nguoi_nhan": None,
-            "nguoi_nhan_id": None,
-            "thoi_han": None,
-            "thoi_gian": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC"),
-            "da_nhac_het_gio": False,
-            "qua_han": False
-        }
-        save_orders()
+        order = Order(
+            ma_don=ma_don,
+            user=f"{user.name}#{user.discriminator}",
+            user_id=user.id,
+            hinh_thuc=self.hinh_thuc.value,
+            loai=self.loai.value,
+            so_luong=self.so_luong.value,
+            ghi_chu=self.ghi_chu.value,
+            trang_thai=OrderStatus.CHO_DUYET,
+            thoi_gian=now_ts(),
+        )
+        # Stamped once: later rule changes don't reprice existing orders
+        order.gia = get_config().pricing.price_of(order)
+        get_store().put(order)
         embed = discord.Embed(title="📥 Đơn hàng mới", color=0x00ffcc)
         embed.add_field(name="Mã đơn", value=f"`{ma_don}`", inline=True)
         embed.add_field(name="Khách",      value=user.mention, inline=True)
@@ -50,28 +64,100 @@ class DonHang(discord.ui.Modal, title="Đặt đơn Cave Store"):
         if self.loai.value:     embed.add_field(name="Loại",      value=self.loai.value, inline=True)
         if self.so_luong.value: embed.add_field(name="Số lượng",  value=self.so_luong.value, inline=True)
         if self.ghi_chu.value:  embed.add_field(name="Ghi chú",   value=self.ghi_chu.value, inline=False)
+        if order.gia is not None: embed.add_field(name="Giá tạm tính", value=f"{order.gia:,} VNĐ", inline=True)
         embed.set_footer(text="Đơn đang chờ duyệt...")
-        
-        # Import locally to avoid circular imports
-        from core import load_config
-        config = load_config()
-        for cid in (int(config["LOG_CHANNEL_ID"]), int(config["ADMIN_CHANNEL_ID"])):
-            ch = interaction.client.get_channel(cid)
-            if ch: 
-                await ch.send(embed=embed)
-            else:
-                log(f"⚠️ Không tìm thấy kênh {cid}")
-        log(f"[ĐƠN MỚI] {ma_don} từ {user}")
+
+        # Acknowledge first: channel fan-out must not eat the 3s interaction window
         await interaction.response.send_message(f"✅ Đã gửi đơn `{ma_don}`!", ephemeral=True)
 
+        config = get_config()
+        for cid in (config.log_channel_id, config.admin_channel_id):
+            if cid:
+                interaction.client.outbox.post(cid, embed=embed)
+        log(f"[ĐƠN MỚI] {ma_don} từ {user}", ma_don=ma_don, command="donhang", user=user.id)
+
+PAGE_SIZE = 10
+# Most orders one /hangloat call may touch
+BATCH_LIMIT = 500
+
+class DanhSachView(discord.ui.View):
+    """Next/previous buttons for /danhsachdon.
+
+    Pages are fetched with cursors from the store's creation-time index, so
+    each click reads one page instead of re-sorting every order.
+    """
+
+    def __init__(self, store, owner_id: int, filters: dict):
+        super().__init__(timeout=300)
+        self.store = store
+        self.owner_id = owner_id
+        self.filters = filters
+        self.page_no = 1
+        self.rows = []
+        self.has_next = False
+
+    def load(self, before=None, after=None) -> list:
+        # One extra row tells whether another page exists past this one
+        rows = self.store.list_orders(**self.filters, before=before, after=after, limit=PAGE_SIZE + 1)
+        if after is not None:
+            self.rows = rows[-PAGE_SIZE:]
+            self.has_next = True
+        else:
+            self.rows = rows[:PAGE_SIZE]
+            self.has_next = len(rows) > PAGE_SIZE
+        self.prev_page.disabled = self.page_no <= 1
+        self.next_page.disabled = not self.has_next
+        return self.rows
+
+    def embed(self) -> discord.Embed:
+        embed = discord.Embed(title="📋 Danh sách đơn hàng", color=0x3498db)
+        for o in self.rows:
+            embed.add_field(
+                name=f"`{o.ma_don}` - {o.trang_thai.value}",
+                value=f"👤 {o.user}\n⏰ {o.thoi_gian_str}",
+                inline=False
+            )
+        embed.set_footer(text=f"Trang {self.page_no}")
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.owner_id
+
+    @discord.ui.button(label="◀ Trước", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        first = self.rows[0]
+        self.page_no -= 1
+        if not self.load(after=(first.thoi_gian, first.ma_don)) or self.page_no <= 1:
+            # Orders may have come or gone meanwhile; page 1 is always the newest
+            self.page_no = 1
+            self.load()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="Sau ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        last = self.rows[-1]
+        self.page_no += 1
+        if not self.load(before=(last.thoi_gian, last.ma_don)):
+            self.page_no = 1
+            self.load()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
 class OrderCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        # Import config with correct path
-        from core.config import load_config
-        self.config = load_config()
-        self.guild_obj = discord.Object(id=int(self.config["GUILD_ID"]))
-        self.admin_ids = [int(id) for id in self.config["ADMIN_ID"]]
+        self.guild_obj = discord.Object(id=get_config().guild_id)
+        self.store = get_store()
+
+    @staticmethod
+    def is_admin(user_id: int) -> bool:
+        # Read through get_config() so ADMIN_ID edits apply without a restart
+        return get_config().is_admin(user_id)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Runs before every command of this cog; rejections are answered by bot.tree.error
+        if interaction.type is discord.InteractionType.application_command and interaction.command:
+            admission.admit(interaction.command.name, interaction.user.id)
+        return True
 
     @app_commands.command(name="donhang", description="Mở form để đặt đơn hàng mới")
     async def donhang(self, interaction: discord.Interaction):
@@ -80,37 +166,35 @@ class OrderCommands(commands.Cog):
     @app_commands.command(name="duyetdon", description="✅ Duyệt đơn hàng")
     @app_commands.describe(ma_don="Mã đơn cần duyệt")
     async def duyetdon(self, interaction: discord.Interaction, ma_don: str):
-        if interaction.user.id not in self.admin_ids:
+        if not self.is_admin(interaction.user.id):
             return await interaction.response.send_message("⛔ Không có quyền!", ephemeral=True)
-        if ma_don not in orders:
+        o = self.store.get(ma_don)
+        if o is None:
             return await interaction.response.send_message("❌ Không tìm thấy đơn.", ephemeral=True)
-        orders[ma_don]["trang_thai"] = "✅ Đã duyệt"
-        save_orders()
-        try:
-            u = await self.bot.fetch_user(orders[ma_don]["user_id"])
-            await u.send(f"📢 Đơn `{ma_don}` đã được duyệt.")
-        except: 
-            log(f"⚠️ Không thể gửi DM cho user {orders[ma_don]['user_id']}")
-        log(f"[DUYỆT] {ma_don} bởi {interaction.user}")
+        o.trang_thai = OrderStatus.DA_DUYET
+        self.store.put(o)
+        self.bot.dm.send(o.user_id, f"📢 Đơn `{ma_don}` đã được duyệt.")
+        log(f"[DUYỆT] {ma_don} bởi {interaction.user}", ma_don=ma_don, command="duyetdon", user=interaction.user.id)
         await interaction.response.send_message(f"✅ Đã duyệt `{ma_don}`", ephemeral=True)
 
     @app_commands.command(name="trangthai", description="🔍 Xem trạng thái đơn")
     @app_commands.describe(ma_don="Mã đơn")
     async def trangthai(self, interaction: discord.Interaction, ma_don: str):
-        if ma_don not in orders:
+        o = await self.store.lookup(ma_don)
+        if o is None:
             return await interaction.response.send_message("❌ Không tìm thấy đơn.", ephemeral=True)
-        o = orders[ma_don]
         try:
             e = discord.Embed(title=f"📦 Đơn `{ma_don}`", color=0x00ffcc)
-            e.add_field(name="👤 Khách",       value=f"<@{o['user_id']}>", inline=True)
-            e.add_field(name="📦 Hình thức",   value=o["hinh_thuc"], inline=True)
-            if o.get("loai"):     e.add_field(name="📚 Loại",     value=o["loai"],     inline=True)
-            if o.get("so_luong"): e.add_field(name="🔢 Số lượng", value=o["so_luong"], inline=True)
-            if o.get("ghi_chu"):  e.add_field(name="📝 Ghi chú",  value=o["ghi_chu"],  inline=False)
-            e.add_field(name="📌 Trạng thái", value=o["trang_thai"], inline=False)
-            if o.get("nguoi_nhan_id"): e.add_field(name="⚙️ Người nhận", value=f"<@{o['nguoi_nhan_id']}>", inline=False)
-            if o.get("thoi_han"):      e.add_field(name="⏳ Hạn chót",    value=o["thoi_han"], inline=False)
-            if o.get("thoi_gian"):     e.set_footer(text=f"🕒 Đặt lúc: {o['thoi_gian']}")
+            e.add_field(name="👤 Khách",       value=f"<@{o.user_id}>", inline=True)
+            e.add_field(name="📦 Hình thức",   value=o.hinh_thuc, inline=True)
+            if o.loai:     e.add_field(name="📚 Loại",     value=o.loai,     inline=True)
+            if o.so_luong: e.add_field(name="🔢 Số lượng", value=o.so_luong, inline=True)
+            if o.ghi_chu:  e.add_field(name="📝 Ghi chú",  value=o.ghi_chu,  inline=False)
+            e.add_field(name="📌 Trạng thái", value=o.trang_thai.value, inline=False)
+            if o.nguoi_nhan_id: e.add_field(name="⚙️ Người nhận", value=f"<@{o.nguoi_nhan_id}>", inline=False)
+            if o.thoi_han:      e.add_field(name="⏳ Hạn chót",    value=o.thoi_han_str, inline=False)
+            if o.thoi_gian:     e.set_footer(text=f"🕒 Đặt lúc: {o.thoi_gian_str}"
+                                              + (" · 📦 Đã lưu trữ" if ma_don not in self.store else ""))
             await interaction.response.send_message(embed=e, ephemeral=True)
         except Exception as err:
             await interaction.response.send_message(f"❌ Lỗi khi hiển thị đơn: {err}", ephemeral=True)
@@ -118,14 +202,15 @@ class OrderCommands(commands.Cog):
     @app_commands.command(name="huydon", description="❌ Huỷ đơn của bạn")
     @app_commands.describe(ma_don="Mã đơn")
     async def huydon(self, interaction: discord.Interaction, ma_don: str):
-        if ma_don not in orders:
+        o = self.store.get(ma_don)
+        if o is None:
             return await interaction.response.send_message("❌ Không tìm thấy đơn.", ephemeral=True)
-        if interaction.user.id != orders[ma_don]["user_id"]:
+        if interaction.user.id != o.user_id:
             return await interaction.response.send_message("⛔ Không thể huỷ đơn của người khác.", ephemeral=True)
-        if orders[ma_don]["trang_thai"] != "⏳ Chờ duyệt":
+        if o.trang_thai != OrderStatus.CHO_DUYET:
             return await interaction.response.send_message("❌ Đơn đã được duyệt, không thể huỷ.", ephemeral=True)
-        del orders[ma_don]; save_orders()
-        log(f"[HUỶ] {ma_don} bởi {interaction.user}")
+        self.store.delete(ma_don)
+        log(f"[HUỶ] {ma_don} bởi {interaction.user}", ma_don=ma_don, command="huydon", user=interaction.user.id)
         await interaction.response.send_message(f"✅ Đã huỷ `{ma_don}`", ephemeral=True)
 
     @app_commands.command(name="nhancay", description="📥 Nhận đơn (chốt đơn)")
@@ -135,34 +220,19 @@ class OrderCommands(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         try:
-            # Validate order exists
-            if ma_don not in orders:
-                await interaction.followup.send("❌ Không tìm thấy đơn.", ephemeral=True)
-                return
+            u = interaction.user
+            deadline = now_ts() + thoi_han * 3600
+            han_chot_str = fmt_time(deadline)
 
-            # Check if order is already taken
-            if orders[ma_don].get("nguoi_nhan_id"):
-                await interaction.followup.send("⛔ Đơn đã có người nhận.", ephemeral=True)
+            # Compare-and-set: of two workers (on any instance) only one gets the order
+            o = self.store.claim(ma_don, f"{u.name}#{u.discriminator}", u.id, deadline)
+            if o is None:
+                if ma_don not in self.store:
+                    await interaction.followup.send("❌ Không tìm thấy đơn.", ephemeral=True)
+                else:
+                    await interaction.followup.send("⛔ Đơn đã có người nhận.", ephemeral=True)
                 return
-
-            # Process the order
-            u = interaction.user
-            deadline_dt = datetime.now(timezone.utc) + timedelta(hours=thoi_han)
-            han_chot_str = deadline_dt.strftime("%Y-%m-%d %H:%M:%S UTC")
-            
-            # Update order info
-            orders[ma_don].update({
-                "nguoi_nhan": f"{u.name}#{u.discriminator}",
-                "nguoi_nhan_id": u.id,
-                "trang_thai": "🚀 Đang xử lý",
-                "thoi_han": han_chot_str,
-                "da_nhac_het_gio": False,
-                "qua_han": False
-            })
-            
-            # Save changes
-            save_orders()
-            log(f"[NHẬN] {ma_don} bởi {u.name}#{u.discriminator}")
+            log(f"[NHẬN] {ma_don} bởi {u.name}#{u.discriminator}", ma_don=ma_don, command="nhancay", user=u.id)
             
             # Send success message
             await interaction.followup.send(
@@ -171,132 +241,403 @@ class OrderCommands(commands.Cog):
             )
             
         except Exception as e:
-            log(f"[LỖI] Trong lệnh /nhancay: {e}")
+            log(f"[LỖI] Trong lệnh /nhancay: {e}", ma_don=ma_don, command="nhancay", user=interaction.user.id)
             await interaction.followup.send("🚨 Đã xảy ra lỗi khi nhận đơn.", ephemeral=True)
 
     @app_commands.command(name="hoanthanh", description="🎉 Đánh dấu hoàn thành")
     @app_commands.describe(ma_don="Mã đơn")
     async def hoanthanh(self, interaction: discord.Interaction, ma_don: str):
-        if ma_don not in orders:
+        o = self.store.get(ma_don)
+        if o is None:
             return await interaction.response.send_message("❌ Không tìm thấy.", ephemeral=True)
-        if orders[ma_don]["nguoi_nhan_id"] != interaction.user.id:
+        if o.nguoi_nhan_id != interaction.user.id:
             return await interaction.response.send_message("⛔ Bạn không nhận đơn này.", ephemeral=True)
-        orders[ma_don]["trang_thai"] = "✅ Đã hoàn thành"
-        save_orders()
-        log(f"[HOÀN THÀNH] {ma_don} bởi {interaction.user}")
+        o.trang_thai = OrderStatus.HOAN_THANH
+        o.thoi_gian_xong = now_ts()
+        self.store.put(o)
+        log(f"[HOÀN THÀNH] {ma_don} bởi {interaction.user}", ma_don=ma_don, command="hoanthanh", user=interaction.user.id)
         await interaction.response.send_message(f"✅ Hoàn thành `{ma_don}`!", ephemeral=True)
 
     @app_commands.command(name="suadon", description="✏️ Chỉnh sửa ghi chú đơn")
     @app_commands.describe(ma_don="Mã đơn", ghichu="Ghi chú mới")
     async def suadon(self, interaction: discord.Interaction, ma_don: str, ghichu: str):
-        if ma_don not in orders:
+        o = self.store.get(ma_don)
+        if o is None:
             return await interaction.response.send_message("❌ Không tìm thấy.", ephemeral=True)
-        if interaction.user.id not in (*self.admin_ids, orders[ma_don]["user_id"]):
+        if interaction.user.id != o.user_id and not self.is_admin(interaction.user.id):
             return await interaction.response.send_message("⛔ Không có quyền.", ephemeral=True)
-        orders[ma_don]["ghi_chu"] = ghichu
-        save_orders()
-        log(f"[SỬA] {ma_don} ghi chú -> {ghichu}")
+        o.ghi_chu = ghichu
+        self.store.put(o)
+        log(f"[SỬA] {ma_don} ghi chú -> {ghichu}", ma_don=ma_don, command="suadon", user=interaction.user.id)
         await interaction.response.send_message(f"✅ Đã cập nhật ghi chú cho `{ma_don}`", ephemeral=True)
 
     @app_commands.command(name="xoadon", description="🗑️ Xoá đơn (Admin)")
     @app_commands.describe(ma_don="Mã đơn")
     async def xoadon(self, interaction: discord.Interaction, ma_don: str):
-        if interaction.user.id not in self.admin_ids:
+        if not self.is_admin(interaction.user.id):
             return await interaction.response.send_message("⛔ Không có quyền!", ephemeral=True)
-        if ma_don not in orders:
+        if ma_don not in self.store:
+            if self.store.archive is not None and ma_don in self.store.archive:
+                return await interaction.response.send_message("📦 Đơn đã được lưu trữ, không thể xoá.", ephemeral=True)
             return await interaction.response.send_message("❌ Không tồn tại.", ephemeral=True)
-        del orders[ma_don]; save_orders()
-        log(f"[XOÁ] {ma_don} bởi {interaction.user}")
+        self.store.delete(ma_don)
+        log(f"[XOÁ] {ma_don} bởi {interaction.user}", ma_don=ma_don, command="xoadon", user=interaction.user.id)
         await interaction.response.send_message(f"🗑️ Đã xóa `{ma_don}`", ephemeral=True)
 
     @app_commands.command(name="giahan", description="🕒 Gia hạn thời gian cày")
     @app_commands.describe(ma_don="Mã đơn", so_phut="Số phút thêm")
     async def giahan(self, interaction: discord.Interaction, ma_don: str, so_phut: int):
-        if ma_don not in orders:
+        don = self.store.get(ma_don)
+        if don is None:
             return await interaction.response.send_message("❌ Không tìm thấy.", ephemeral=True)
-        don = orders[ma_don]
-        if not don.get("nguoi_nhan_id"):
+        if not don.nguoi_nhan_id:
             return await interaction.response.send_message("⚠️ Chưa nhận.", ephemeral=True)
+        if don.trang_thai == OrderStatus.HOAN_THANH:
+            return await interaction.response.send_message("❌ Đơn đã hoàn thành, không thể gia hạn.", ephemeral=True)
         try:
-            old_str = don["thoi_han"]
-            if " UTC" not in old_str:
-                old_str += " UTC"
-            old = datetime.strptime(old_str, "%Y-%m-%d %H:%M:%S %Z").replace(tzinfo=timezone.utc)
-            new = old + timedelta(minutes=so_phut)
-            new_str = new.strftime("%Y-%m-%d %H:%M:%S UTC")
-            don["thoi_han"] = new_str
-            don["da_nhac_het_gio"] = False
-            don["qua_han"] = False
-            save_orders()
-            log(f"[GIA HẠN] {ma_don} +{so_phut}m -> {don['thoi_han']}")
-            try:
-                await self.bot.fetch_user(don["nguoi_nhan_id"]).send(
-                    f"📌 `{ma_don}` được gia hạn +{so_phut} phút. Hạn: {don['thoi_han']}")
-            except:
-                log(f"[LỖI] Không thể gửi DM cho người nhận đơn {ma_don}")
+            don.thoi_han += so_phut * 60
+            don.so_lan_gia_han += 1
+            don.da_nhac_het_gio = False
+            don.qua_han = False
+            self.store.put(don)
+            log(f"[GIA HẠN] {ma_don} +{so_phut}m -> {don.thoi_han_str}", ma_don=ma_don, command="giahan", user=interaction.user.id)
+            self.bot.dm.send(don.nguoi_nhan_id,
+                             f"📌 `{ma_don}` được gia hạn +{so_phut} phút. Hạn: {don.thoi_han_str}")
             await interaction.response.send_message("✅ Gia hạn thành công.", ephemeral=True)
+        except OrderConflict:
+            # Answered by the tree's error handler
+            raise
         except Exception as e:
-            log(f"[ERR] giahan {ma_don}: {e}")
+            log(f"[ERR] giahan {ma_don}: {e}", ma_don=ma_don, command="giahan", user=interaction.user.id)
             await interaction.response.send_message("❌ Lỗi khi gia hạn.", ephemeral=True)
 
+    @app_commands.command(name="hangloat", description="📦 Duyệt / xoá / gia hạn nhiều đơn cùng lúc (Admin)")
+    @app_commands.describe(thao_tac="Việc cần làm", ma_don="Các mã đơn, cách nhau bởi dấu cách hoặc dấu phẩy",
+                           trang_thai="Hoặc: mọi đơn ở trạng thái này", cu_hon_gio="Chỉ đơn đặt cách đây hơn N giờ",
+                           so_phut="Số phút thêm (khi gia hạn)")
+    @app_commands.choices(thao_tac=[app_commands.Choice(name="Duyệt", value="duyet"),
+                                    app_commands.Choice(name="Xoá", value="xoa"),
+                                    app_commands.Choice(name="Gia hạn", value="giahan")],
+                          trang_thai=[app_commands.Choice(name=s.value, value=s.code) for s in OrderStatus])
+    async def hangloat(self, interaction: discord.Interaction, thao_tac: app_commands.Choice[str], ma_don: str = None,
+                       trang_thai: app_commands.Choice[int] = None, cu_hon_gio: int = None, so_phut: int = None):
+        if not self.is_admin(interaction.user.id):
+            return await interaction.response.send_message("⛔ Không có quyền!", ephemeral=True)
+        action = thao_tac.value
+        if action == "giahan" and not so_phut:
+            return await interaction.response.send_message("❌ Cần nhập so_phut để gia hạn.", ephemeral=True)
+        if not ma_don and trang_thai is None and cu_hon_gio is None:
+            return await interaction.response.send_message(
+                "❌ Cần nhập mã đơn hoặc bộ lọc trạng thái / thời gian.", ephemeral=True)
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        status = OrderStatus.from_code(trang_thai.value) if trang_thai else None
+        cutoff = now_ts() - cu_hon_gio * 3600 if cu_hon_gio is not None else None
+        if ma_don:
+            # Filters given alongside ids narrow them down, checked per id below
+            ids = list(dict.fromkeys(ma_don.replace(",", " ").split()))
+        else:
+            before = (cutoff, "") if cutoff is not None else None
+            ids = [o.ma_don for o in self.store.list_orders(status, before=before, limit=BATCH_LIMIT + 1)]
+        if len(ids) > BATCH_LIMIT:
+            return await interaction.followup.send(
+                f"❌ Tối đa {BATCH_LIMIT} đơn mỗi lần, hãy thu hẹp bộ lọc.", ephemeral=True)
+
+        # Check everything first, then apply the accepted orders in one commit
+        ok, failed, accepted = [], [], []
+        for mid in ids:
+            o = self.store.get(mid)
+            if o is None:
+                archived = self.store.archive is not None and mid in self.store.archive
+                failed.append((mid, "đã lưu trữ" if archived else "không tìm thấy"))
+            elif status is not None and o.trang_thai != status:
+                failed.append((mid, f"không khớp bộ lọc ({o.trang_thai.value})"))
+            elif cutoff is not None and o.thoi_gian >= cutoff:
+                failed.append((mid, f"mới hơn {cu_hon_gio} giờ"))
+            elif action == "duyet" and o.trang_thai != OrderStatus.CHO_DUYET:
+                failed.append((mid, f"đang {o.trang_thai.value}"))
+            elif action == "giahan" and not (o.nguoi_nhan_id and o.thoi_han):
+                failed.append((mid, "chưa nhận"))
+            elif action == "giahan" and o.trang_thai == OrderStatus.HOAN_THANH:
+                failed.append((mid, "đã hoàn thành"))
+            else:
+                accepted.append(o)
+
+        dms = []
+        with self.store.batch():
+            for o in accepted:
+                mid = o.ma_don
+                if action == "duyet":
+                    o.trang_thai = OrderStatus.DA_DUYET
+                    self.store.put(o)
+                    dms.append((o.user_id, f"📢 Đơn `{mid}` đã được duyệt."))
+                elif action == "xoa":
+                    self.store.delete(mid)
+                else:
+                    o.thoi_han += so_phut * 60
+                    o.so_lan_gia_han += 1
+                    o.da_nhac_het_gio = False
+                    o.qua_han = False
+                    self.store.put(o)
+                    dms.append((o.nguoi_nhan_id, f"📌 `{mid}` được gia hạn +{so_phut} phút. Hạn: {o.thoi_han_str}"))
+                ok.append(mid)
+        # Queued, not awaited: the DM workers send them in parallel under their rate limits
+        for user_id, text in dms:
+            self.bot.dm.send(user_id, text)
+        for mid in ok:
+            log(f"[HÀNG LOẠT] {thao_tac.name} {mid} bởi {interaction.user}", ma_don=mid,
+                command="hangloat", user=interaction.user.id)
+
+        # Failures first: they are what the admin has to act on
+        lines = [f"✅ {thao_tac.name} {len(ok)}/{len(ids)} đơn"]
+        lines += [f"❌ `{mid}`: {reason}" for mid, reason in failed]
+        if ok:
+            lines.append("✔️ " + " ".join(f"`{mid}`" for mid in ok))
+        text = "\n".join(lines)
+        # Stay under Discord's 2000 character message limit
+        if len(text) > 1900:
+            text = text[:1900].rsplit(None, 1)[0] + " …"
+        await interaction.followup.send(text, ephemeral=True)
+
+    # ---- ma_don autocomplete: each command only suggests orders the user can act on ----
+
+    @staticmethod
+    def _choices(scopes, current: str) -> list:
+        ids = autocomplete.complete(scopes, current.strip().lower())
+        return [app_commands.Choice(name=mid, value=mid) for mid in ids]
+
+    @duyetdon.autocomplete("ma_don")
+    async def duyetdon_ma_don(self, interaction: discord.Interaction, current: str):
+        if not self.is_admin(interaction.user.id):
+            return []
+        return self._choices([("status", OrderStatus.CHO_DUYET)], current)
+
+    @trangthai.autocomplete("ma_don")
+    async def trangthai_ma_don(self, interaction: discord.Interaction, current: str):
+        uid = interaction.user.id
+        scopes = ["all"] if self.is_admin(uid) else [("customer", uid), ("worker", uid)]
+        return self._choices(scopes, current)
+
+    @huydon.autocomplete("ma_don")
+    async def huydon_ma_don(self, interaction: discord.Interaction, current: str):
+        return self._choices([("customer", interaction.user.id, OrderStatus.CHO_DUYET)], current)
+
+    @nhancay.autocomplete("ma_don")
+    async def nhancay_ma_don(self, interaction: discord.Interaction, current: str):
+        return self._choices(["unassigned"], current)
+
+    @hoanthanh.autocomplete("ma_don")
+    async def hoanthanh_ma_don(self, interaction: discord.Interaction, current: str):
+        return self._choices([("worker_active", interaction.user.id)], current)
+
+    @suadon.autocomplete("ma_don")
+    async def suadon_ma_don(self, interaction: discord.Interaction, current: str):
+        uid = interaction.user.id
+        return self._choices(["all"] if self.is_admin(uid) else [("customer", uid)], current)
+
+    @xoadon.autocomplete("ma_don")
+    async def xoadon_ma_don(self, interaction: discord.Interaction, current: str):
+        if not self.is_admin(interaction.user.id):
+            return []
+        return self._choices(["all"], current)
+
+    @giahan.autocomplete("ma_don")
+    async def giahan_ma_don(self, interaction: discord.Interaction, current: str):
+        uid = interaction.user.id
+        if self.is_admin(uid):
+            scopes = [("status", OrderStatus.DANG_XU_LY), ("status", OrderStatus.QUA_HAN)]
+        else:
+            scopes = [("worker_active", uid)]
+        return self._choices(scopes, current)
+
     @app_commands.command(name="tinhgia", description="💰 Tính giá trị đơn hàng")
     @app_commands.describe(hinh_thuc="SL/RP/Event/Modul", loai="Loại", so_luong="Số lượng", premium="RP premium? yes/no")
     async def tinhgia(self, interaction: discord.Interaction, hinh_thuc: str, loai: str="", so_luong: str="1", premium: str="yes"):
         try:
-            H, L, S, P = hinh_thuc.upper(), loai.upper(), int(''.join(filter(str.isdigit, so_luong)) or 1), premium.lower()
-            if H=="SL": price=(S/1_000_000)*100_000
-            elif H=="RP": price=(S/100_000)*(120_000 if P=="yes" else 140_000)
-            elif H=="EVENT": price=S*650_000
-            elif H=="MODUL":
-                if L in ("TANK","AIR"): price=S*300_000
-                elif L=="HELI": price=S*375_000
-                elif L=="SHIP": price=S*400_000
-                else: return await interaction.response.send_message("❌ Loại Modul sai.", ephemeral=True)
-            else:
-                return await interaction.response.send_message("❌ Hình thức sai.", ephemeral=True)
-            await interaction.response.send_message(f"💸 Giá: **{int(price):,} VNĐ**", ephemeral=True)
+            price = get_config().pricing.quote(hinh_thuc, loai, so_luong, premium=premium.lower() == "yes")
+        except ValueError as e:
+            return await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        try:
+            await interaction.response.send_message(f"💸 Giá: **{price:,} VNĐ**", ephemeral=True)
         except Exception as e:
             await interaction.response.send_message(f"❌ Lỗi: {e}", ephemeral=True)
 
     @app_commands.command(name="thongke", description="📈 Thống kê đơn hàng")
     async def thongke(self, interaction: discord.Interaction):
-        done = sum(1 for o in orders.values() if o["trang_thai"]=="✅ Đã hoàn thành")
-        late = sum(1 for o in orders.values() if o["trang_thai"]=="⚠️ Quá hạn")
-        processing = sum(1 for o in orders.values() if o["trang_thai"]=="🚀 Đang xử lý")
-        await interaction.response.send_message(
-            f"📦 Tổng đơn: `{len(orders)}`\n"
-            f"✅ Hoàn thành: `{done}`\n"
-            f"🚀 Đang xử lý: `{processing}`\n"
-            f"⏰ Quá hạn: `{late}`",
-            ephemeral=True
-        )
+        # Counters are maintained on every status change; nothing is scanned here
+        today = stats.day(fmt_time(now_ts())[:10])
+        lines = [
+            f"📦 Tổng đơn: `{stats.total}`",
+            f"⏳ Chờ duyệt: `{stats.count(OrderStatus.CHO_DUYET)}`",
+            f"✅ Hoàn thành: `{stats.count(OrderStatus.HOAN_THANH)}`",
+            f"🚀 Đang xử lý: `{stats.count(OrderStatus.DANG_XU_LY)}`",
+            f"⏰ Quá hạn: `{stats.count(OrderStatus.QUA_HAN)}`",
+            f"📅 Hôm nay: `{sum(today.values())}` đơn mới",
+        ]
+        busiest = stats.top_workers(OrderStatus.DANG_XU_LY)
+        if busiest:
+            lines.append("👷 Đang xử lý theo người nhận:")
+            lines += [f"> <@{uid}>: `{n}`" for n, uid in busiest]
+        me = stats.worker(interaction.user.id)
+        if me:
+            lines.append(f"🙋 Của bạn: `{me.get(OrderStatus.DANG_XU_LY, 0)}` đang xử lý, "
+                         f"`{me.get(OrderStatus.HOAN_THANH, 0)}` hoàn thành")
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
 
     @app_commands.command(name="danhsachdon", description="📋 Xem danh sách đơn hàng")
-    @app_commands.describe(trang_thai="Lọc theo trạng thái (vd: 'Chờ duyệt')")
-    async def danhsachdon(self, interaction: discord.Interaction, trang_thai: str = None):
+    @app_commands.describe(trang_thai="Lọc theo trạng thái", nguoi_nhan="Lọc theo người nhận", khach="Lọc theo khách")
+    @app_commands.choices(trang_thai=[app_commands.Choice(name=s.value, value=s.code) for s in OrderStatus])
+    async def danhsachdon(self, interaction: discord.Interaction, trang_thai: app_commands.Choice[int] = None,
+                          nguoi_nhan: discord.User = None, khach: discord.User = None):
         try:
-            filtered = []
-            for mid, o in orders.items():
-                if trang_thai is None or o['trang_thai'] == trang_thai:
-                    filtered.append((mid, o))
-            if not filtered:
+            filters = {
+                "trang_thai": OrderStatus.from_code(trang_thai.value) if trang_thai else None,
+                "nguoi_nhan_id": nguoi_nhan.id if nguoi_nhan else None,
+                "user_id": khach.id if khach else None,
+            }
+            view = DanhSachView(self.store, interaction.user.id, filters)
+            if not view.load():
                 return await interaction.response.send_message("❌ Không có đơn nào phù hợp", ephemeral=True)
-            filtered.sort(key=lambda x: x[1]['thoi_gian'], reverse=True)
-            filtered = filtered[:10]
-            embed = discord.Embed(title="📋 Danh sách đơn hàng", color=0x3498db)
-            for mid, o in filtered:
-                status = o['trang_thai']
-                customer = o['user']
-                embed.add_field(
-                    name=f"`{mid}` - {status}",
-                    value=f"👤 {customer}\n⏰ {o['thoi_gian']}",
-                    inline=False
-                )
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            await interaction.response.send_message(embed=view.embed(), view=view, ephemeral=True)
         except Exception as e:
             log(f"[LỖI] danhsachdon: {e}")
             await interaction.response.send_message("❌ Đã xảy ra lỗi khi lấy danh sách", ephemeral=True)
 
+    @app_commands.command(name="hieunang", description="📊 Số liệu hiệu năng (Admin)")
+    async def hieunang(self, interaction: discord.Interaction):
+        if not self.is_admin(interaction.user.id):
+            return await interaction.response.send_message("⛔ Không có quyền!", ephemeral=True)
+        if not metrics.enabled:
+            return await interaction.response.send_message(
+                "ℹ️ Chưa bật thu thập số liệu (METRICS_ENABLED trong config.json).", ephemeral=True)
+        lines = metrics.summary() or ["Chưa có số liệu."]
+        text = "\n".join(lines)
+        # Stay under Discord's 2000 character message limit
+        await interaction.response.send_message(f"```\n{text[:1900]}\n```", ephemeral=True)
+
+    @staticmethod
+    def _day_start(day: str) -> int:
+        return int(datetime.strptime(day.strip(), "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+    @app_commands.command(name="timdon", description="🔎 Tìm đơn theo nội dung (Admin)")
+    @app_commands.describe(tu_khoa="Từ khoá (không cần dấu)", trang_thai="Lọc theo trạng thái",
+                           tu_ngay="Đặt từ ngày (YYYY-MM-DD)", den_ngay="Đặt đến hết ngày (YYYY-MM-DD)")
+    @app_commands.choices(trang_thai=[app_commands.Choice(name=s.value, value=s.code) for s in OrderStatus])
+    async def timdon(self, interaction: discord.Interaction, tu_khoa: str,
+                     trang_thai: app_commands.Choice[int] = None, tu_ngay: str = None, den_ngay: str = None):
+        if not self.is_admin(interaction.user.id):
+            return await interaction.response.send_message("⛔ Không có quyền!", ephemeral=True)
+        try:
+            since = self._day_start(tu_ngay) if tu_ngay else None
+            until = self._day_start(den_ngay) + 86400 if den_ngay else None
+        except ValueError:
+            return await interaction.response.send_message("❌ Ngày phải có dạng YYYY-MM-DD.", ephemeral=True)
+        status = OrderStatus.from_code(trang_thai.value) if trang_thai else None
+        hits = search_index.search(tu_khoa, status, since, until, limit=PAGE_SIZE)
+        if not hits:
+            return await interaction.response.send_message("❌ Không tìm thấy đơn nào phù hợp", ephemeral=True)
+        embed = discord.Embed(title=f"🔎 Kết quả cho “{tu_khoa[:50]}”", color=0x3498db)
+        for score, mid in hits:
+            o = self.store.get(mid)
+            if o is None:
+                continue
+            detail = " · ".join(x for x in (o.hinh_thuc, o.loai, o.so_luong) if x)
+            embed.add_field(
+                name=f"`{mid}` - {o.trang_thai.value}",
+                value=f"👤 {o.user} · {detail}\n⏰ {o.thoi_gian_str}" + (f"\n📝 {o.ghi_chu[:100]}" if o.ghi_chu else ""),
+                inline=False,
+            )
+        log(f"[TÌM] {tu_khoa!r}: {len(hits)} kết quả", command="timdon", user=interaction.user.id)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="xuatbaocao", description="📤 Xuất danh sách đơn ra file (Admin)")
+    @app_commands.describe(dinh_dang="Định dạng file", trang_thai="Lọc theo trạng thái",
+                           tu_ngay="Đặt từ ngày (YYYY-MM-DD)", den_ngay="Đặt đến hết ngày (YYYY-MM-DD)")
+    @app_commands.choices(dinh_dang=[app_commands.Choice(name="CSV", value="csv"),
+                                     app_commands.Choice(name="JSON Lines", value="jsonl")],
+                          trang_thai=[app_commands.Choice(name=s.value, value=s.code) for s in OrderStatus])
+    async def xuatbaocao(self, interaction: discord.Interaction, dinh_dang: app_commands.Choice[str] = None,
+                         trang_thai: app_commands.Choice[int] = None, tu_ngay: str = None, den_ngay: str = None):
+        if not self.is_admin(interaction.user.id):
+            return await interaction.response.send_message("⛔ Không có quyền!", ephemeral=True)
+        try:
+            since = self._day_start(tu_ngay) if tu_ngay else None
+            until = self._day_start(den_ngay) + 86400 if den_ngay else None
+        except ValueError:
+            return await interaction.response.send_message("❌ Ngày phải có dạng YYYY-MM-DD.", ephemeral=True)
+        fmt = dinh_dang.value if dinh_dang else "csv"
+        status = OrderStatus.from_code(trang_thai.value) if trang_thai else None
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        # Rows are snapshotted here; formatting and file I/O happen off the event loop
+        rows = self.store.iter_export(status, since, until)
+        path, name, count = await asyncio.to_thread(export.write_export, rows, fmt)
+        try:
+            limit = interaction.guild.filesize_limit if interaction.guild else 8 * 1024 * 1024
+            size = os.path.getsize(path)
+            if size > limit:
+                return await interaction.followup.send(
+                    f"❌ File quá lớn ({size // 1024} KB), hãy thu hẹp khoảng ngày hoặc trạng thái.", ephemeral=True)
+            await interaction.followup.send(f"📤 Đã xuất {count} đơn", file=discord.File(path, filename=name),
+                                            ephemeral=True)
+        finally:
+            os.remove(path)
+        log(f"[XUẤT] {count} đơn ra {name}", command="xuatbaocao", user=interaction.user.id)
+
+    @staticmethod
+    def _duration(seconds) -> str:
+        if seconds is None:
+            return "—"
+        m = int(seconds) // 60
+        d, h, m = m // 1440, m // 60 % 24, m % 60
+        return f"{d}d{h}h" if d else f"{h}h{m:02d}m"
+
+    def _tally_line(self, t) -> str:
+        rate = f"{t.on_time_rate:.0%}" if t.on_time_rate is not None else "—"
+        return (f"`{t.done}` xong · {rate} đúng hạn · làm TB {self._duration(t.avg_work)}"
+                f" · gia hạn {t.extensions} · 💰 {t.revenue:,}đ" + (f" · ⚠️ {t.overdue} quá hạn" if t.overdue else ""))
+
+    @app_commands.command(name="baocao", description="📊 Báo cáo đúng hạn & năng suất (Admin)")
+    @app_commands.describe(so_ngay="Khoảng thời gian", nguoi_nhan="Chỉ xem một người nhận")
+    @app_commands.choices(so_ngay=[app_commands.Choice(name=f"{d} ngày", value=d) for d in (7, 30, 90)])
+    async def baocao(self, interaction: discord.Interaction, so_ngay: app_commands.Choice[int] = None,
+                     nguoi_nhan: discord.User = None):
+        if not self.is_admin(interaction.user.id):
+            return await interaction.response.send_message("⛔ Không có quyền!", ephemeral=True)
+        days = so_ngay.value if so_ngay else 7
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        r = await analytics.report(now_ts() - days * 86400, nguoi_nhan.id if nguoi_nhan else None)
+        total = r["total"]
+        embed = discord.Embed(title=f"📊 Báo cáo {days} ngày" + (f" · {nguoi_nhan}" if nguoi_nhan else ""),
+                              color=0x3498db)
+        embed.add_field(name="Tổng", inline=False, value=(
+            f"✅ {self._tally_line(total)}\n"
+            f"⏳ Chờ nhận TB: {self._duration(total.avg_wait)}\n"
+            f"🕒 Đơn phải gia hạn: `{total.extended}`"))
+        workers = sorted(r["workers"].items(), key=lambda kv: (kv[1].done, kv[1].overdue), reverse=True)
+        if workers and not nguoi_nhan:
+            embed.add_field(name="👷 Theo người nhận", inline=False, value="\n".join(
+                f"<@{uid}>: {self._tally_line(t)}" for uid, t in workers[:10])[:1024])
+        kinds = sorted(r["kinds"].items(), key=lambda kv: kv[1].done, reverse=True)
+        if kinds:
+            embed.add_field(name="📦 Theo hình thức", inline=False, value="\n".join(
+                f"**{name or '?'}**: {self._tally_line(t)}" for name, t in kinds[:10])[:1024])
+        embed.set_footer(text=f"{len(analytics)} đơn trong lịch sử (kể cả đã lưu trữ)")
+        log(f"[BÁO CÁO] {days} ngày bởi {interaction.user}", command="baocao", user=interaction.user.id)
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="taicauhinh", description="🔄 Tải lại config.json (Admin)")
+    async def taicauhinh(self, interaction: discord.Interaction):
+        if not self.is_admin(interaction.user.id):
+            return await interaction.response.send_message("⛔ Không có quyền!", ephemeral=True)
+        try:
+            config = reload_config()
+        except Exception as e:
+            return await interaction.response.send_message(f"❌ Lỗi cấu hình, giữ bản cũ: {e}", ephemeral=True)
+        log(f"[CẤU HÌNH] Tải lại bởi {interaction.user}", command="taicauhinh", user=interaction.user.id)
+        await interaction.response.send_message(
+            f"✅ Đã tải lại cấu hình ({len(config.admin_ids)} admin).", ephemeral=True)
+
 async def setup(bot):
     await bot.add_cog(OrderCommands(bot))
     print(f"[SETUP] OrderCommands cog loaded successfully with {len(bot.tree.get_commands())} commands")
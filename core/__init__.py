@@ -3,3 +3,4 @@
 from .config import *
 from .logger import *
 from .orders import *
+from .store import *
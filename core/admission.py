@@ -0,0 +1,114 @@
+import time
+from collections import OrderedDict
+from discord import app_commands
+from .config import get_config
+from .models import OrderStatus
+from .stats import stats
+from . import metrics
+
+# Orders a customer is still waiting on; MAX_PENDING_ORDERS caps these
+PENDING = (OrderStatus.CHO_DUYET, OrderStatus.DA_DUYET)
+
+
+class TooManyPending(app_commands.CheckFailure):
+    def __init__(self, pending: int, limit: int):
+        super().__init__(f"{pending} đơn đang chờ (tối đa {limit})")
+        self.pending = pending
+        self.limit = limit
+
+
+class Bucket:
+    """Token bucket holding up to `rate` tokens, refilled over `per` seconds."""
+
+    __slots__ = ("rate", "per", "tokens", "updated")
+
+    def __init__(self, rate: int, per: float, now: float):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = now
+
+    def refill(self, now: float, rate: int, per: float):
+        # Config reloads may change the limit of a live bucket
+        self.rate, self.per = rate, per
+        self.tokens = min(rate, self.tokens + (now - self.updated) * rate / per)
+        self.updated = now
+
+    def retry_after(self) -> float:
+        """0 if a token is available, else seconds until there is one."""
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) * self.per / self.rate
+
+    def idle(self, now: float) -> bool:
+        # Fully refilled: dropping it loses nothing
+        return now - self.updated >= self.per
+
+
+class Admission:
+    """Per-user and global token buckets in front of the order commands.
+
+    Limits come from RATE_LIMITS in config.json, per command with a
+    "default" fallback. A rejected call raises `CommandOnCooldown` (or
+    `TooManyPending`) and is answered by the tree's error handler. User
+    buckets are kept least recently used first, so idle ones are dropped
+    from the front in O(1) per check.
+    """
+
+    def __init__(self):
+        self.users = OrderedDict()  # (command, user_id) -> Bucket
+        self.globals = {}  # command -> Bucket
+
+    def _bucket(self, table, key, spec, now):
+        b = table.get(key)
+        if b is None:
+            b = table[key] = Bucket(*spec, now)
+        else:
+            b.refill(now, *spec)
+        return b
+
+    def _evict(self, now: float):
+        users = self.users
+        while users:
+            b = next(iter(users.values()))
+            if not b.idle(now):
+                break
+            users.popitem(last=False)
+
+    def pending(self, user_id: int) -> int:
+        counts = stats.customer(user_id)
+        return sum(counts.get(s, 0) for s in PENDING)
+
+    def check_pending(self, user_id: int):
+        limit = get_config().max_pending
+        if limit:
+            n = self.pending(user_id)
+            if n >= limit:
+                metrics.inc("admission_rejected", scope="pending")
+                raise TooManyPending(n, limit)
+
+    def admit(self, command: str, user_id: int):
+        """Take one token from each bucket that applies, or raise without taking any."""
+        cfg = get_config()
+        spec = cfg.rate_limits.get(command) or cfg.rate_limits.get("default")
+        if command == "donhang":
+            self.check_pending(user_id)
+        if not spec:
+            return
+        now = time.monotonic()
+        self._evict(now)
+        taken = []
+        if "user" in spec:
+            key = (command, user_id)
+            taken.append(("user", spec["user"], self._bucket(self.users, key, spec["user"], now)))
+            self.users.move_to_end(key)
+        if "global" in spec:
+            taken.append(("global", spec["global"], self._bucket(self.globals, command, spec["global"], now)))
+        for scope, (rate, per), b in taken:
+            wait = b.retry_after()
+            if wait > 0:
+                metrics.inc("admission_rejected", command=command, scope=scope)
+                raise app_commands.CommandOnCooldown(app_commands.Cooldown(rate, per), wait)
+        for _, _, b in taken:
+            b.tokens -= 1
+
+
+admission = Admission()
@@ -0,0 +1,190 @@
+import asyncio
+from array import array
+from itertools import compress, repeat
+from operator import and_, eq, ge
+from .config import get_config
+from .models import OrderStatus
+
+_DONE = OrderStatus.HOAN_THANH.code
+_OVERDUE = OrderStatus.QUA_HAN.code
+_FREE = -1  # status of a row whose order was deleted
+
+
+def row_of(o, gia=None) -> tuple:
+    """The analytics fields of an order, in the shape `OrderArchive.history()` yields.
+
+    `gia` is the price to count for an order that has none stamped.
+    """
+    return (o.ma_don, o.trang_thai.code, o.hinh_thuc, o.nguoi_nhan_id, o.thoi_gian, o.thoi_han,
+            o.thoi_gian_nhan, o.thoi_gian_xong, o.so_lan_gia_han, o.gia if o.gia is not None else gia)
+
+
+class Tally:
+    """Aggregates for one group of orders in a report window."""
+
+    __slots__ = ("done", "on_time", "work_s", "work_n", "wait_s", "wait_n", "extensions", "extended", "overdue",
+                 "revenue")
+
+    def __init__(self):
+        self.done = self.on_time = self.overdue = 0
+        self.work_s = self.work_n = self.wait_s = self.wait_n = 0
+        self.extensions = self.extended = 0
+        self.revenue = 0  # VNĐ of the completed orders
+
+    @property
+    def on_time_rate(self):
+        return self.on_time / self.done if self.done else None
+
+    @property
+    def avg_work(self):
+        """Mean seconds from claim to completion."""
+        return self.work_s / self.work_n if self.work_n else None
+
+    @property
+    def avg_wait(self):
+        """Mean seconds from order to claim."""
+        return self.wait_s / self.wait_n if self.wait_n else None
+
+
+class OrderAnalytics:
+    """Column store of order history for SLA and throughput reports.
+
+    One row per order, live or archived, in parallel `array` columns (epoch
+    times, status codes, worker ids, kind codes). Kept current as a store
+    listener; archiving does not remove rows. A report copies the columns on
+    the event loop and filters them with C-level map/compress passes in a
+    worker thread, so only rows inside the window are touched in Python.
+    """
+
+    keeps_archived = True
+    COLUMNS = ("status", "kind", "worker", "created", "deadline", "claimed", "finished", "extensions", "revenue")
+
+    def __init__(self):
+        self.slot = {}  # ma_don -> row
+        self.free = []  # rows of deleted orders, reused first
+        self.status = array("b")
+        self.kind = array("l")  # index into self.kinds
+        self.worker = array("q")  # nguoi_nhan_id, 0 if unassigned
+        self.created = array("q")  # thoi_gian
+        self.deadline = array("q")  # thoi_han, 0 if none
+        self.claimed = array("q")  # thoi_gian_nhan, 0 if unknown
+        self.finished = array("q")  # thoi_gian_xong, 0 if unknown
+        self.extensions = array("l")  # so_lan_gia_han
+        self.revenue = array("q")  # gia, 0 if the order has no price
+        self.kinds = []
+        self._kind_code = {}
+
+    def __len__(self) -> int:
+        return len(self.slot)
+
+    def _code(self, hinh_thuc) -> int:
+        name = (hinh_thuc or "").strip().upper()
+        code = self._kind_code.get(name)
+        if code is None:
+            code = self._kind_code[name] = len(self.kinds)
+            self.kinds.append(name)
+        return code
+
+    def _set(self, mid, status, hinh_thuc, nid, tg, th, nl, xl, gh, gia):
+        values = (status, self._code(hinh_thuc), nid or 0, tg or 0, th or 0, nl or 0, xl or 0, gh or 0, gia or 0)
+        row = self.slot.get(mid)
+        if row is None and self.free:
+            row = self.slot[mid] = self.free.pop()
+        if row is None:
+            self.slot[mid] = len(self.status)
+            for name, v in zip(self.COLUMNS, values):
+                getattr(self, name).append(v)
+        else:
+            for name, v in zip(self.COLUMNS, values):
+                getattr(self, name)[row] = v
+
+    def rebuild(self, rows):
+        """Load (ma_don, status code, hinh_thuc, nguoi_nhan_id, thoi_gian, thoi_han,
+        thoi_gian_nhan, thoi_gian_xong, so_lan_gia_han, gia) rows."""
+        self.__init__()
+        rows = list(rows)
+        self.slot = dict(zip((r[0] for r in rows), range(len(rows))))
+        if len(self.slot) < len(rows):
+            # Same id twice (archived, then live after a crash mid-archive): keep the later one
+            rows = [rows[i] for i in sorted(self.slot.values())]
+            self.slot = dict(zip((r[0] for r in rows), range(len(rows))))
+        if not rows:
+            return
+        # Column-wise: one bulk conversion per array instead of a loop per row
+        _, status, kinds, *rest = zip(*rows)
+        self.status.extend(status)
+        self.kind.extend(map(self._code, kinds))
+        for name, values in zip(self.COLUMNS[2:], rest):
+            getattr(self, name).extend([v or 0 for v in values])
+
+    def on_change(self, ma_don, old, new, order):
+        if order is not None:
+            # Orders placed before prices were stamped are quoted with the current rules
+            self._set(*row_of(order, None if order.gia is not None else get_config().pricing.price_of(order)))
+            return
+        row = self.slot.pop(ma_don, None)
+        if row is not None:
+            self.status[row] = _FREE
+            self.free.append(row)
+
+    def snapshot(self) -> tuple:
+        """Copies of the columns, safe to read from another thread."""
+        return tuple(array(c.typecode, c) for c in (getattr(self, n) for n in self.COLUMNS)), list(self.kinds)
+
+    async def report(self, since: int, worker: int = None) -> dict:
+        """Aggregates over orders finished (or gone overdue) at or after `since`."""
+        cols, kinds = self.snapshot()
+        return await asyncio.to_thread(aggregate, cols, kinds, since, worker)
+
+
+def aggregate(cols, kinds, since: int, worker: int = None) -> dict:
+    """{"total": Tally, "workers": {id: Tally}, "kinds": {name: Tally}} for one window."""
+    status, kind, wk, created, deadline, claimed, finished, extensions, revenue = cols
+    n = len(status)
+
+    # Row masks built in C: finished in the window, and overdue with a deadline in it
+    done = map(and_, map(eq, status, repeat(_DONE, n)), map(ge, finished, repeat(since, n)))
+    late = map(and_, map(eq, status, repeat(_OVERDUE, n)), map(ge, deadline, repeat(since, n)))
+    if worker:
+        done = map(and_, done, map(eq, wk, repeat(worker, n)))
+        late = map(and_, late, map(eq, wk, repeat(worker, n)))
+    done_rows = list(compress(range(n), done))
+    late_rows = list(compress(range(n), late))
+
+    total, workers, by_kind = Tally(), {}, {}
+
+    def groups(i):
+        w = workers.get(wk[i])
+        if w is None:
+            w = workers[wk[i]] = Tally()
+        k = by_kind.get(kinds[kind[i]])
+        if k is None:
+            k = by_kind[kinds[kind[i]]] = Tally()
+        return total, w, k
+
+    for i in done_rows:
+        th, nl, xl, gh = deadline[i], claimed[i], finished[i], extensions[i]
+        on_time = not th or xl <= th
+        for t in groups(i):
+            t.done += 1
+            t.on_time += on_time
+            t.revenue += revenue[i]
+            if nl:
+                t.work_s += xl - nl
+                t.work_n += 1
+                t.wait_s += nl - created[i]
+                t.wait_n += 1
+            if gh:
+                t.extensions += gh
+                t.extended += 1
+    for i in late_rows:
+        for t in groups(i):
+            t.overdue += 1
+            if extensions[i]:
+                t.extensions += extensions[i]
+                t.extended += 1
+    workers.pop(0, None)
+    return {"total": total, "workers": workers, "kinds": by_kind}
+
+
+analytics = OrderAnalytics()
@@ -0,0 +1,276 @@
+import os, io, gzip, json, time, asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone
+from .logger import log
+from .journal import Journal, encode_record
+from .models import Order, OrderStatus, OrderKey
+
+# Orders in these states no longer change on their own and can leave the live set
+TERMINAL = (OrderStatus.HOAN_THANH, OrderStatus.QUA_HAN)
+ARCHIVE_EVERY = 3600  # seconds between archive passes
+
+
+def _month(ts) -> str:
+    return datetime.fromtimestamp(ts or 0, timezone.utc).strftime("%Y-%m")
+
+
+def _segment(o: Order) -> str:
+    """Monthly segment name ("2026-10") from the order's creation time."""
+    return _month(o.thoi_gian)
+
+
+class OrderArchive:
+    """Finished orders moved out of the store into monthly gzip segments.
+
+    Each segment `orders-YYYY-MM.jsonl.gz` is append-only: one gzip member per
+    archive pass, one `[ma_don, compact]` line per order. `index.jsonl` maps
+    every archived id to its segment and keeps the indexed fields so counters
+    can be rebuilt without opening any segment. Segments are only read when an
+    archived order is actually looked up, and the last few are kept decoded.
+    """
+
+    def __init__(self, path: str = "archive", cache_segments: int = 2):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.journal = Journal(os.path.join(path, "index.jsonl"))
+        self.index = {}  # ma_don -> segment
+        self.segments = {}  # segment -> {ma_don: (status code, thoi_gian)}
+        self.ends = {}  # segment -> size covered by the index
+        self.cache_segments = cache_segments
+        self._cache = OrderedDict()  # segment -> {ma_don: compact}
+        # Read only: with a shared ARCHIVE_PATH the archiver may be appending
+        self._offset = 0
+        self.refresh()
+
+    def _apply(self, rec):
+        if rec[0] == "a":
+            mid, seg = rec[1], rec[2]
+            old = self.index.get(mid)
+            if old is not None and old != seg:
+                self.segments[old].pop(mid, None)
+            self.index[mid] = seg
+            self.segments.setdefault(seg, {})[mid] = (rec[3], rec[6])
+        elif rec[0] == "d":
+            seg = self.index.pop(rec[1], None)
+            if seg is not None:
+                self.segments[seg].pop(rec[1], None)
+        elif rec[0] == "end":
+            self.ends[rec[1]] = rec[2]
+
+    def _repair(self):
+        """Cut a torn index line and unindexed bytes (possibly a torn gzip member) off segment ends.
+
+        A crash in the middle of a pass leaves them. Only the archiver may do
+        this, right before its own pass: with a shared ARCHIVE_PATH another
+        instance's pass could be half written, not torn.
+        """
+        path = self.journal.path
+        if os.path.exists(path) and os.path.getsize(path) > self._offset:
+            # refresh() stops at the last complete line
+            log(f"⚠️ Bản ghi cuối trong {path} bị cắt dở, đã khôi phục tới offset {self._offset}")
+            self.journal.close()
+            with open(path, "r+b") as f:
+                f.truncate(self._offset)
+        for seg, end in self.ends.items():
+            p = self._file(seg)
+            if os.path.exists(p) and os.path.getsize(p) > end:
+                with open(p, "r+b") as f:
+                    f.truncate(end)
+
+    def refresh(self):
+        """Pick up index lines appended by another instance since we last looked."""
+        path = self.journal.path
+        if not os.path.exists(path) or os.path.getsize(path) <= self._offset:
+            return
+        with open(path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        # Only whole lines; a line still being written is read next time
+        data = data[:data.rfind(b"\n") + 1]
+        self._offset += len(data)
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                log(f"⚠️ Bỏ qua bản ghi hỏng trong {path}")
+                continue
+            self._apply(rec)
+
+    def _file(self, seg: str) -> str:
+        return os.path.join(self.path, f"orders-{seg}.jsonl.gz")
+
+    def __contains__(self, ma_don) -> bool:
+        return ma_don in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _latest(self) -> dict:
+        latest = {}
+        for rec in self.journal.replay(repair=False):
+            if rec[0] == "a":
+                latest[rec[1]] = rec
+            elif rec[0] == "d":
+                latest.pop(rec[1], None)
+        return latest
+
+    def keys(self):
+        """(ma_don, OrderKey) for every archived order, read from the index file."""
+        for mid, rec in self._latest().items():
+            code, uid, nid, tg, th = rec[3:8]
+            yield mid, OrderKey(OrderStatus.from_code(code), uid, nid, tg, th)
+
+    def history(self):
+        """Analytics rows (see `analytics.row_of`) for every archived order, from the index file.
+
+        Orders archived before these fields were indexed have no kind,
+        claim/completion times or price.
+        """
+        for mid, rec in self._latest().items():
+            code, uid, nid, tg, th = rec[3:8]
+            ht, nl, xl, gh = rec[8:12] if len(rec) >= 12 else ("", None, None, 0)
+            gia = rec[12] if len(rec) >= 13 else None
+            yield mid, code, ht or "", nid, tg, th, nl, xl, gh or 0, gia
+
+    def _read(self, seg: str, end: int = None) -> dict:
+        rows = {}
+        with open(self._file(seg), "rb") as raw:
+            # Only the indexed part: another pass may be appending a member right now
+            data = raw.read(end) if end is not None else raw.read()
+        with gzip.GzipFile(fileobj=io.BytesIO(data)) as f:
+            for line in f:
+                mid, row = json.loads(line)
+                rows[mid] = row  # a later copy of the same order wins
+        return rows
+
+    async def get(self, ma_don: str) -> Order:
+        seg = self.index.get(ma_don)
+        if seg is None:
+            self.refresh()
+            seg = self.index.get(ma_don)
+            if seg is None:
+                return None
+        rows = self._cache.get(seg)
+        # Not in a cached copy: the segment may have grown since it was read
+        if rows is None or ma_don not in rows:
+            rows = await asyncio.to_thread(self._read, seg, self.ends.get(seg))
+            self._cache[seg] = rows
+            while len(self._cache) > self.cache_segments:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(seg)
+        row = rows.get(ma_don)
+        return Order.decode(ma_don, row) if row is not None else None
+
+    def export_rows(self, trang_thai=None, since: int = None, until: int = None, exclude=None):
+        """Archived orders for `OrderStore.iter_export`: a zero-argument callable for a worker thread.
+
+        Only segments whose month overlaps [since, until) are opened, each
+        once, in month order; orders come out oldest first. `exclude` is a
+        zero-argument callable, run in the thread, returning ids to skip
+        (orders that are live again).
+        """
+        self.refresh()
+        lo = _month(since) if since is not None else ""
+        hi = _month(until - 1) if until is not None else "~"
+        # Copied here, on the loop: an archive pass may change these meanwhile
+        picked = {seg: dict(ids) for seg, ids in self.segments.items() if ids and lo <= seg <= hi}
+        ends = {seg: self.ends.get(seg) for seg in picked}
+        code = OrderStatus(trang_thai).code if trang_thai is not None else None
+
+        def rows():
+            skip = exclude() if exclude is not None else ()
+            for seg in sorted(picked):
+                wanted = sorted(
+                    (tg or 0, mid) for mid, (c, tg) in picked[seg].items()
+                    if (code is None or c == code) and (since is None or (tg or 0) >= since)
+                    and (until is None or (tg or 0) < until) and mid not in skip)
+                if not wanted:
+                    continue
+                data = self._read(seg, ends[seg])
+                for _, mid in wanted:
+                    row = data.get(mid)
+                    if row is not None:
+                        yield Order.decode(mid, row)
+        return rows
+
+    def _write(self, batches: dict) -> dict:
+        """Append one gzip member per segment and index it. Runs in a thread."""
+        index = []
+        for seg, lines in batches.items():
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode="wb") as gz:
+                gz.write(b"".join(line for _, _, line in lines))
+            with open(self._file(seg), "ab") as f:
+                f.write(buf.getvalue())
+                f.flush()
+                os.fsync(f.fileno())
+                end = f.tell()
+            for mid, fields, _ in lines:
+                index.append(encode_record(["a", mid, seg] + fields))
+            index.append(encode_record(["end", seg, end]))
+        self.journal.write(b"".join(index), len(index), fsync=True)
+        return {seg: [mid for mid, _, _ in lines] for seg, lines in batches.items()}
+
+    def _collect(self, candidates, older_than: int) -> tuple:
+        """Pick the candidates whose deadline (or creation) is before `older_than`. Runs in a thread."""
+        picked, batches = {}, {}
+        for o in candidates():
+            if (o.thoi_han or o.thoi_gian or 0) >= older_than:
+                continue
+            row = o.to_compact()
+            line = (json.dumps([o.ma_don, row], ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+            picked[o.ma_don] = row
+            # Indexed fields: enough to rebuild counters and analytics without the segment
+            fields = [o.trang_thai.code, o.user_id, o.nguoi_nhan_id, o.thoi_gian, o.thoi_han,
+                      o.hinh_thuc, o.thoi_gian_nhan, o.thoi_gian_xong, o.so_lan_gia_han, o.gia]
+            batches.setdefault(_segment(o), []).append((o.ma_don, fields, line))
+        return picked, batches
+
+    async def archive(self, store, older_than: int) -> int:
+        """Move terminal orders whose deadline (or creation) is before `older_than`.
+
+        With several instances only the lease holder calls this.
+        """
+        self.refresh()
+        self._repair()
+        # A deadline is never before creation, so only orders created before the
+        # cutoff can qualify; the store selects those by index and they are
+        # decoded in the thread, never on the loop
+        candidates = store.iter_created_before(TERMINAL, older_than)
+        picked, batches = await asyncio.to_thread(self._collect, candidates, older_than)
+        if not picked:
+            return 0
+        written = await asyncio.to_thread(self._write, batches)
+        n = 0
+        for seg, ids in written.items():
+            self._cache.pop(seg, None)
+            for mid in ids:
+                o = store.get(mid)
+                if o is None or o.to_compact() != picked[mid]:
+                    # Changed while the segment was being written: the live copy
+                    # wins and is archived again on a later pass
+                    self.journal.append(["d", mid])
+                    continue
+                store.evict(mid)
+                n += 1
+        # Index, segment and end records were appended in the thread; load them
+        self.refresh()
+        return n
+
+    def close(self):
+        self.journal.close()
+
+
+async def run_archiver(store, after_days: float, every: float = ARCHIVE_EVERY):
+    """Archive finished orders older than `after_days` every `every` seconds."""
+    while True:
+        try:
+            n = await store.archive.archive(store, int(time.time() - after_days * 86400))
+            if n:
+                log(f"[LƯU TRỮ] Đã chuyển {n} đơn đã xong vào {store.archive.path}")
+        except Exception as e:
+            log(f"[LỖI LƯU TRỮ] {e}")
+        await asyncio.sleep(every)
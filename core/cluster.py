@@ -0,0 +1,74 @@
+import asyncio, os, socket, time, uuid
+from .logger import log
+
+# Unique per process, also across restarts of the same pid
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class Lease:
+    """Time-limited leadership stored in the shared database.
+
+    The holder renews every `ttl / 3` seconds; if it dies, another instance
+    takes over once `ttl` has passed. `held` turns False a little before the
+    lease can expire, so a stalled leader stops acting before anyone else may
+    start.
+    """
+
+    def __init__(self, store, name: str = "leader", ttl: float = 6.0):
+        self.store = store
+        self.name = name
+        self.ttl = ttl
+        self._until = 0.0
+        self.released = False
+
+    @property
+    def held(self) -> bool:
+        return time.monotonic() < self._until - self.ttl / 3
+
+    def try_acquire(self) -> bool:
+        t = time.monotonic()
+        try:
+            ok = self.store.acquire_lease(self.name, INSTANCE_ID, self.ttl)
+        except Exception as e:
+            log(f"[CLUSTER] Lỗi gia hạn lease {self.name}: {e}")
+            ok = False
+        self._until = t + self.ttl if ok else 0.0
+        return ok
+
+    def release(self):
+        # Final: hold() must not take it back while the process shuts down
+        self.released = True
+        if self._until:
+            self._until = 0.0
+            self.store.release_lease(self.name, INSTANCE_ID)
+
+
+async def wait_for_lease(lease: Lease):
+    """Block until this instance holds `lease`; a standby waits here."""
+    while not lease.try_acquire():
+        await asyncio.sleep(lease.ttl / 3)
+
+
+async def hold(lease: Lease):
+    """Keep renewing a lease this instance holds; returns once a renewal fails."""
+    while True:
+        await asyncio.sleep(lease.ttl / 3)
+        if lease.released:
+            return
+        if not lease.try_acquire():
+            log(f"[CLUSTER] {INSTANCE_ID} mất lease {lease.name}, dừng lại")
+            return
+
+
+async def follow_changes(store, every: float = 1.0, prune_every: float = 600):
+    """Keep local listeners in step with writes from the other instances."""
+    last_prune = time.monotonic()
+    while True:
+        try:
+            store.poll_changes()
+            if time.monotonic() - last_prune >= prune_every:
+                store.prune_changes()
+                last_prune = time.monotonic()
+        except Exception as e:
+            log(f"[CLUSTER] Lỗi đọc thay đổi: {e}")
+        await asyncio.sleep(every)
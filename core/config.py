@@ -1,13 +1,152 @@
-import json, os, sys
+import json, os, sys, threading, time
+from dataclasses import dataclass
+from types import MappingProxyType
+from .logger import log
+from .pricing import DEFAULT_RULES, PriceTable
 
-def load_config():
+config_file = "config.json"
+# How often get_config() may stat the file to look for edits
+CHECK_EVERY = 2.0
+
+
+@dataclass(frozen=True)
+class Config:
+    """Validated, read-only view of config.json with IDs already parsed."""
+    token: str
+    guild_id: int
+    log_channel_id: int
+    admin_channel_id: int
+    notify_channel_id: int
+    admin_ids: frozenset
+    prefix: str
+    pricing: PriceTable
+    rate_limits: MappingProxyType  # command -> {"user"/"global": (rate, per)}
+    max_pending: int
+    raw: MappingProxyType
+
+    # dict-style access keeps older `config["X"]` / `config.get("X")` code working
+    def get(self, key, default=None):
+        return self.raw.get(key, default)
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self.admin_ids
+
+
+def _id(raw: dict, key: str, required: bool = False):
+    value = raw.get(key)
+    if value in (None, ""):
+        if required:
+            raise ValueError(f"Thiếu {key}")
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} không phải số: {value!r}")
+
+
+def _rate_limits(raw: dict) -> MappingProxyType:
+    limits = raw.get("RATE_LIMITS") or {}
+    if not isinstance(limits, dict):
+        raise ValueError("RATE_LIMITS phải là object {lệnh: {user/global: [số lần, giây]}}")
+    parsed = {}
+    for command, spec in limits.items():
+        if not isinstance(spec, dict) or not set(spec) <= {"user", "global"}:
+            raise ValueError(f"RATE_LIMITS.{command} chỉ nhận user / global")
+        parsed[command] = {}
+        for scope, value in spec.items():
+            try:
+                rate, per = value
+                rate, per = int(rate), float(per)
+            except (TypeError, ValueError):
+                raise ValueError(f"RATE_LIMITS.{command}.{scope} phải là [số lần, giây]: {value!r}")
+            if rate <= 0 or per <= 0:
+                raise ValueError(f"RATE_LIMITS.{command}.{scope} phải dương: {value!r}")
+            parsed[command][scope] = (rate, per)
+    return MappingProxyType(parsed)
+
+
+def parse_config(raw: dict) -> Config:
+    admins = raw.get("ADMIN_ID", [])
+    if not isinstance(admins, list):
+        admins = [admins]
     try:
-        with open("config.json", "r", encoding="utf-8") as f:
-            config = json.load(f)
-    except FileNotFoundError:
-        print("❌ Không tìm thấy file config.json. Vui lòng tạo file cấu hình.")
-        sys.exit(1)
-    except json.JSONDecodeError as e:
-        print(f"❌ Lỗi đọc config.json: {e}")
-        sys.exit(1)
-    return config
+        admin_ids = frozenset(int(a) for a in admins)
+    except (TypeError, ValueError):
+        raise ValueError(f"ADMIN_ID phải là danh sách số: {admins!r}")
+    rules = raw.get("PRICING") or DEFAULT_RULES
+    if not isinstance(rules, (list, tuple)):
+        raise ValueError("PRICING phải là danh sách quy tắc giá")
+    return Config(
+        token=raw.get("TOKEN") or "",
+        guild_id=_id(raw, "GUILD_ID"),
+        log_channel_id=_id(raw, "LOG_CHANNEL_ID"),
+        admin_channel_id=_id(raw, "ADMIN_CHANNEL_ID"),
+        notify_channel_id=_id(raw, "NOTIFY_CHANNEL_ID"),
+        admin_ids=admin_ids,
+        prefix=raw.get("PREFIX", "!"),
+        pricing=PriceTable(rules),
+        rate_limits=_rate_limits(raw),
+        max_pending=int(raw.get("MAX_PENDING_ORDERS", 0) or 0),
+        raw=MappingProxyType(dict(raw)),
+    )
+
+
+_current = None
+_mtime = None
+_checked = 0.0
+_lock = threading.Lock()
+
+
+def _read():
+    mtime = os.stat(config_file).st_mtime_ns
+    with open(config_file, "r", encoding="utf-8") as f:
+        return parse_config(json.load(f)), mtime
+
+
+def reload_config() -> Config:
+    """Re-read config.json now. On any error the previous config stays active and the error is raised."""
+    global _current, _mtime, _checked
+    with _lock:
+        cfg, mtime = _read()
+        # Single reference swap: readers see either the old or the new object
+        _current, _mtime, _checked = cfg, mtime, time.monotonic()
+    return cfg
+
+
+def get_config() -> Config:
+    """Current config, loaded once and refreshed when config.json's mtime changes."""
+    global _checked, _mtime
+    if _current is None:
+        try:
+            return reload_config()
+        except FileNotFoundError:
+            print("❌ Không tìm thấy file config.json. Vui lòng tạo file cấu hình.")
+            sys.exit(1)
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"❌ Lỗi đọc config.json: {e}")
+            sys.exit(1)
+    now = time.monotonic()
+    if now - _checked >= CHECK_EVERY:
+        _checked = now
+        try:
+            mtime = os.stat(config_file).st_mtime_ns
+        except OSError:
+            # Editors may briefly remove the file while saving
+            return _current
+        if mtime != _mtime:
+            try:
+                reload_config()
+                log("[CẤU HÌNH] Đã tải lại config.json")
+            except (OSError, json.JSONDecodeError, ValueError) as e:
+                # Don't retry (and re-log) the same broken edit every few seconds
+                _mtime = mtime
+                log(f"⚠️ Không tải lại được config.json, giữ cấu hình cũ: {e}")
+    return _current
+
+
+def load_config():
+    """Kept for older callers; same cached object as get_config()."""
+    return get_config()
@@ -0,0 +1,153 @@
+import asyncio, random, time
+import discord
+from .logger import log
+from .journal import Journal
+from . import metrics
+
+dead_letter_file = "dm_dead_letter.jsonl"
+
+
+class _Bucket:
+    """Token bucket: `rate` sends per `per` seconds, awaited rather than rejected."""
+
+    __slots__ = ("rate", "per", "tokens", "updated")
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """Take a token and return how long the caller must wait for it."""
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens * self.per / self.rate
+
+
+class DMDispatcher:
+    """Queue of outgoing DMs served by a few worker tasks.
+
+    Users are looked up in the gateway cache first, then a small TTL cache,
+    and only then over REST. Sends are paced per recipient (their DM channel
+    is its own rate-limit route) and globally, retried with exponential
+    backoff on 429/5xx, and written to `dm_dead_letter.jsonl` once they give up.
+    """
+
+    def __init__(self, bot, workers: int = 3, maxsize: int = 1000, cache_ttl: float = 600,
+                 retries: int = 4, per_user=(5, 5.0), global_rate=(40, 1.0)):
+        self.bot = bot
+        self.workers = workers
+        self.retries = retries
+        self.cache_ttl = cache_ttl
+        self.per_user = per_user
+        self.queue = asyncio.Queue(maxsize)
+        self._global = _Bucket(*global_rate)
+        self._routes = {}  # user_id -> _Bucket
+        self._users = {}  # user_id -> (user, expires_at)
+        self._tasks = []
+        self.dead_letters = Journal(dead_letter_file)
+        self.stats = {"queued": 0, "sent": 0, "retries": 0, "failed": 0, "dropped": 0,
+                      "cache_hits": 0, "rest_lookups": 0}
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10):
+        """Give queued DMs a chance to go out, then stop the workers."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            log(f"[DM] Dừng khi còn {self.queue.qsize()} tin chưa gửi")
+        for t in self._tasks:
+            t.cancel()
+        self._tasks = []
+
+    def send(self, user_id: int, content: str) -> bool:
+        """Queue a DM without waiting. Returns False if the queue is full."""
+        try:
+            self.queue.put_nowait((user_id, content))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            self._dead_letter(user_id, content, "queue full")
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    async def _user(self, user_id: int):
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            self.stats["cache_hits"] += 1
+            return user
+        now = time.monotonic()
+        hit = self._users.get(user_id)
+        if hit and hit[1] > now:
+            self.stats["cache_hits"] += 1
+            return hit[0]
+        self.stats["rest_lookups"] += 1
+        user = await self.bot.fetch_user(user_id)
+        if len(self._users) > 5000:
+            self._users = {k: v for k, v in self._users.items() if v[1] > now}
+        self._users[user_id] = (user, now + self.cache_ttl)
+        return user
+
+    async def _pace(self, user_id: int):
+        route = self._routes.get(user_id)
+        if route is None:
+            route = self._routes[user_id] = _Bucket(*self.per_user)
+            if len(self._routes) > 5000:
+                # Buckets that have fully refilled carry no state worth keeping
+                now = time.monotonic()
+                self._routes = {k: b for k, b in self._routes.items() if now - b.updated < b.per}
+                self._routes[user_id] = route
+        wait = max(route.delay(), self._global.delay())
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _deliver(self, user_id: int, content: str):
+        for attempt in range(self.retries + 1):
+            try:
+                await self._pace(user_id)
+                user = await self._user(user_id)
+                with metrics.timed("discord_rest_ms", route="dm"):
+                    await user.send(content)
+                self.stats["sent"] += 1
+                return
+            except (discord.Forbidden, discord.NotFound) as e:
+                # DMs closed / unknown user: retrying will not help
+                error = e
+                break
+            except (discord.HTTPException, OSError, asyncio.TimeoutError) as e:
+                error = e
+                status = getattr(e, "status", None)
+                if status is not None and status < 500 and status != 429:
+                    break
+                if attempt == self.retries:
+                    break
+                self.stats["retries"] += 1
+                retry_after = getattr(e, "retry_after", None)
+                await asyncio.sleep(retry_after or (2 ** attempt) + random.random())
+        self.stats["failed"] += 1
+        self._dead_letter(user_id, content, error)
+
+    def _dead_letter(self, user_id, content, error):
+        log(f"[DM] Không gửi được cho {user_id}: {error}")
+        try:
+            self.dead_letters.append({"t": int(time.time()), "user_id": user_id,
+                                      "content": content, "error": str(error)})
+        except OSError as e:
+            log(f"[DM] Không ghi được dead-letter: {e}")
+
+    async def _worker(self):
+        while True:
+            user_id, content = await self.queue.get()
+            try:
+                await self._deliver(user_id, content)
+            except Exception as e:
+                self.stats["failed"] += 1
+                self._dead_letter(user_id, content, e)
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,76 @@
+import csv, gzip, io, json, os, shutil, tempfile
+from .models import fmt_time
+from .config import get_config
+
+COLUMNS = ("ma_don", "thoi_gian", "trang_thai", "user", "user_id", "hinh_thuc", "loai", "so_luong",
+           "ghi_chu", "nguoi_nhan", "nguoi_nhan_id", "thoi_han", "gia")
+# Files bigger than this are sent gzip-compressed
+GZIP_OVER = 1024 * 1024
+
+
+def _record(o, gia) -> dict:
+    return {
+        "ma_don": o.ma_don,
+        "thoi_gian": fmt_time(o.thoi_gian),
+        "trang_thai": o.trang_thai.value,
+        "user": o.user,
+        "user_id": o.user_id,
+        "hinh_thuc": o.hinh_thuc,
+        "loai": o.loai,
+        "so_luong": o.so_luong,
+        "ghi_chu": o.ghi_chu,
+        "nguoi_nhan": o.nguoi_nhan,
+        "nguoi_nhan_id": o.nguoi_nhan_id,
+        "thoi_han": fmt_time(o.thoi_han),
+        "gia": gia,
+    }
+
+
+def csv_lines(priced):
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, COLUMNS)
+    w.writeheader()
+    for o, gia in priced:
+        w.writerow(_record(o, gia))
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():  # header only: nothing matched
+        yield buf.getvalue()
+
+
+def jsonl_lines(priced):
+    for o, gia in priced:
+        yield json.dumps(_record(o, gia), ensure_ascii=False) + "\n"
+
+
+FORMATS = {"csv": csv_lines, "jsonl": jsonl_lines}
+
+
+def write_export(rows, fmt: str) -> tuple:
+    """Stream `rows()` into a temp file, gzip it if large. Runs in a worker thread.
+
+    Returns (path, filename, order count); the caller deletes the file.
+    """
+    # Orders from before prices were stamped are quoted with the current rules
+    prices = get_config().pricing
+    fd, path = tempfile.mkstemp(prefix="baocao-", suffix=f".{fmt}")
+    count = 0
+
+    def counted():
+        nonlocal count
+        for o in rows():
+            count += 1
+            yield o
+
+    # utf-8-sig so spreadsheet apps read the Vietnamese text correctly
+    with os.fdopen(fd, "w", encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline="") as f:
+        for line in FORMATS[fmt](prices.priced(counted())):
+            f.write(line)
+    name = f"baocao.{fmt}"
+    if os.path.getsize(path) > GZIP_OVER:
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+        path, name = path + ".gz", name + ".gz"
+    return path, name, count
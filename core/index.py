@@ -0,0 +1,166 @@
+from bisect import bisect_left, bisect_right, insort
+from .models import OrderStatus
+
+
+def _buckets(key):
+    """Index lists an order with this OrderKey belongs to."""
+    yield None
+    yield ("status", key.trang_thai)
+    if key.nguoi_nhan_id:
+        yield ("worker", key.nguoi_nhan_id)
+    if key.user_id:
+        yield ("customer", key.user_id)
+
+
+class OrderIndex:
+    """Sorted (thoi_gian, ma_don) arrays per status, worker and customer.
+
+    Kept current as a store listener. A page is read by bisecting to the
+    cursor and walking `limit` entries, so it costs O(log n + page size)
+    when one filter is given (more filters are checked while walking the
+    smallest matching list).
+    """
+
+    def __init__(self):
+        self.lists = {}
+
+    def rebuild(self, keys):
+        self.lists = {}
+        for mid, key in keys:
+            for b in _buckets(key):
+                self.lists.setdefault(b, []).append((key.thoi_gian or 0, mid))
+        for lst in self.lists.values():
+            lst.sort()
+
+    def on_change(self, ma_don, old, new, order):
+        if old == new:
+            return
+        if old is not None:
+            entry = (old.thoi_gian or 0, ma_don)
+            for b in _buckets(old):
+                lst = self.lists.get(b)
+                if lst:
+                    i = bisect_left(lst, entry)
+                    if i < len(lst) and lst[i] == entry:
+                        del lst[i]
+                    if not lst and b is not None:
+                        del self.lists[b]
+        if new is not None:
+            entry = (new.thoi_gian or 0, ma_don)
+            for b in _buckets(new):
+                insort(self.lists.setdefault(b, []), entry)
+
+    def page(self, keys: dict, trang_thai=None, nguoi_nhan_id=None, user_id=None,
+             before=None, after=None, limit: int = 10) -> list:
+        """ma_don list, newest first, strictly older than `before` / newer than `after`.
+
+        `keys` maps ma_don -> OrderKey and is used to check the filters that
+        the chosen list does not cover.
+        """
+        candidates = [None]
+        if trang_thai is not None:
+            candidates.append(("status", trang_thai))
+        if nguoi_nhan_id is not None:
+            candidates.append(("worker", nguoi_nhan_id))
+        if user_id is not None:
+            candidates.append(("customer", user_id))
+        if len(candidates) > 1:
+            candidates = candidates[1:]
+        lists = [self.lists.get(b, []) for b in candidates]
+        lst = min(lists, key=len)
+
+        def match(mid):
+            k = keys.get(mid)
+            return k is not None and (
+                (trang_thai is None or k.trang_thai == trang_thai)
+                and (nguoi_nhan_id is None or k.nguoi_nhan_id == nguoi_nhan_id)
+                and (user_id is None or k.user_id == user_id))
+
+        out = []
+        if after is not None:
+            i = bisect_right(lst, tuple(after))
+            while i < len(lst) and len(out) < limit:
+                if match(lst[i][1]):
+                    out.append(lst[i][1])
+                i += 1
+            out.reverse()
+            return out
+        i = len(lst) if before is None else bisect_left(lst, tuple(before))
+        while i > 0 and len(out) < limit:
+            i -= 1
+            if match(lst[i][1]):
+                out.append(lst[i][1])
+        return out
+
+    def between(self, trang_thai=None, since: int = None, until: int = None) -> list:
+        """ma_don created in [since, until), oldest first, from one bisected slice."""
+        lst = self.lists.get(None if trang_thai is None else ("status", trang_thai), [])
+        lo = 0 if since is None else bisect_left(lst, (since,))
+        hi = len(lst) if until is None else bisect_left(lst, (until,))
+        return [mid for _, mid in lst[lo:hi]]
+
+
+def _scopes(key):
+    """Autocomplete scopes an order with this OrderKey is listed under."""
+    status = key.trang_thai
+    yield "all"
+    yield ("status", status)
+    if key.user_id:
+        yield ("customer", key.user_id)
+        yield ("customer", key.user_id, status)
+    if key.nguoi_nhan_id:
+        yield ("worker", key.nguoi_nhan_id)
+        if status in (OrderStatus.DANG_XU_LY, OrderStatus.QUA_HAN):
+            yield ("worker_active", key.nguoi_nhan_id)
+    elif status in (OrderStatus.CHO_DUYET, OrderStatus.DA_DUYET):
+        yield "unassigned"
+
+
+class PrefixIndex:
+    """Sorted arrays of order ids per scope, for `ma_don` autocomplete.
+
+    A lookup bisects to the typed prefix and reads at most `limit` ids, so it
+    is O(log n + limit) whatever the number of orders.
+    """
+
+    def __init__(self):
+        self.lists = {}
+
+    def rebuild(self, keys):
+        self.lists = {}
+        for mid, key in keys:
+            for sc in _scopes(key):
+                self.lists.setdefault(sc, []).append(mid)
+        for lst in self.lists.values():
+            lst.sort()
+
+    def on_change(self, ma_don, old, new, order):
+        old_scopes = set(_scopes(old)) if old is not None else set()
+        new_scopes = set(_scopes(new)) if new is not None else set()
+        for sc in old_scopes - new_scopes:
+            lst = self.lists.get(sc)
+            if lst:
+                i = bisect_left(lst, ma_don)
+                if i < len(lst) and lst[i] == ma_don:
+                    del lst[i]
+                if not lst:
+                    del self.lists[sc]
+        for sc in new_scopes - old_scopes:
+            insort(self.lists.setdefault(sc, []), ma_don)
+
+    def complete(self, scopes, prefix: str, limit: int = 25) -> list:
+        """Ids starting with `prefix` in any of `scopes`, sorted, at most `limit`."""
+        out = set()
+        for sc in scopes:
+            lst = self.lists.get(sc)
+            if not lst:
+                continue
+            i = bisect_left(lst, prefix)
+            end = min(len(lst), i + limit)
+            while i < end and lst[i].startswith(prefix):
+                out.add(lst[i])
+                i += 1
+        return sorted(out)[:limit]
+
+
+autocomplete = PrefixIndex()
@@ -0,0 +1,107 @@
+import os, json
+from .logger import log
+
+
+class Journal:
+    """Append-only JSON-lines file. One compact record per line.
+
+    A crash in the middle of `append` can leave a partial last line; `replay`
+    detects it, truncates the file back to the last complete record and keeps
+    going instead of throwing the whole history away.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = 0  # records currently in the file (since last truncate)
+        self._f = None
+
+    def _open(self):
+        if self._f is None:
+            self._f = open(self.path, "ab")
+        return self._f
+
+    def append(self, record: dict, fsync: bool = False):
+        self.write(encode_record(record), 1, fsync)
+
+    def write(self, data: bytes, count: int, fsync: bool = False):
+        """Append `count` already encoded records in a single write."""
+        f = self._open()
+        f.write(data)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+        self.records += count
+
+    def replay(self, repair: bool = True):
+        """Yield every complete record in the file, repairing a torn tail.
+
+        With `repair=False` the file is only read: for a reader of a file
+        another process may be appending to right now.
+        """
+        self.records = 0
+        if not os.path.exists(self.path):
+            return
+        good_end = 0
+        torn = False
+        with open(self.path, "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos < len(data):
+            nl = data.find(b"\n", pos)
+            end = len(data) if nl == -1 else nl + 1
+            line = data[pos:end]
+            pos = end
+            if not line.strip():
+                good_end = end
+                continue
+            try:
+                record = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                if pos >= len(data):
+                    torn = True
+                    break
+                # Corruption in the middle of the file: skip the record but keep
+                # everything after it.
+                log(f"⚠️ Bỏ qua bản ghi hỏng trong {self.path} (offset {pos - len(line)})")
+                good_end = end
+                continue
+            good_end = end
+            self.records += 1
+            yield record
+        if not repair:
+            return
+        if not torn and data and not data.endswith(b"\n"):
+            # Last record is complete but lost its newline; terminate it so the
+            # next append does not glue onto it.
+            with open(self.path, "ab") as f:
+                f.write(b"\n")
+        if torn:
+            log(f"⚠️ Bản ghi cuối trong {self.path} bị cắt dở, đã khôi phục tới offset {good_end}")
+            self.close()
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+
+    def truncate(self):
+        self.close()
+        with open(self.path, "wb"):
+            pass
+        self.records = 0
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def encode_record(record: dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def write_atomic(path: str, data: bytes):
+    """Write `data` to `path` via a temp file + rename so readers never see a half file."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
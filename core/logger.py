@@ -1,6 +1,157 @@
+import os, json, glob, gzip, shutil, queue, threading, time, atexit
 from datetime import datetime, timezone
 
-def log(message: str):
-    with open("log.txt", "a", encoding="utf-8") as f:
-        t = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-        f.write(f"[{t}] {message}\n")
+# Writer settings; change them with configure_logger()
+settings = {
+    "path": "log.txt",
+    "json": False,  # JSON lines instead of "[time] message"
+    "max_bytes": 0,  # rotate when the file would grow past this (0 = never)
+    "rotate": None,  # "daily" / "hourly" time-based rotation
+    "backups": 14,  # compressed rotated files to keep
+    "flush_interval": 1.0,  # seconds a line may sit in the buffer
+    "buffer_bytes": 64 * 1024,  # flush early once this much is buffered
+}
+
+_queue = queue.SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+_FLUSH = object()
+
+
+def configure_logger(**kwargs):
+    unknown = set(kwargs) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown logger settings: {', '.join(sorted(unknown))}")
+    flush_logs()
+    settings.update(kwargs)
+
+
+def log(message: str, **fields):
+    """Queue one log line. Never touches the disk on the caller's thread.
+
+    Extra keyword fields (ma_don, command, user, latency_ms, ...) are kept
+    as-is in JSON output and appended as key=value in text output.
+    """
+    _queue.put((time.time(), message, fields))
+    if _writer is None:
+        _start()
+
+
+def flush_logs(timeout: float = 5.0):
+    """Block until everything logged so far is on disk."""
+    if _writer is None or not _writer.is_alive():
+        return
+    done = threading.Event()
+    _queue.put((_FLUSH, done, None))
+    done.wait(timeout)
+
+
+def _start():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_run, name="log-writer", daemon=True)
+            _writer.start()
+            atexit.register(flush_logs)
+
+
+def _format(ts: float, message: str, fields: dict) -> str:
+    t = datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    if settings["json"]:
+        rec = {"t": t, "msg": message}
+        rec.update(fields)
+        return json.dumps(rec, ensure_ascii=False, default=str) + "\n"
+    if fields:
+        extra = " ".join(f"{k}={v}" for k, v in fields.items())
+        return f"[{t}] {message} {extra}\n"
+    return f"[{t}] {message}\n"
+
+
+def _period(ts: float):
+    when = settings["rotate"]
+    if when == "daily":
+        return time.strftime("%Y%m%d", time.gmtime(ts))
+    if when == "hourly":
+        return time.strftime("%Y%m%d%H", time.gmtime(ts))
+    return None
+
+
+class _File:
+    def __init__(self):
+        self.f = None
+        self.size = 0
+        self.period = None
+
+    def open(self):
+        path = settings["path"]
+        self.f = open(path, "a", encoding="utf-8")
+        self.size = self.f.tell()
+        started = os.path.getmtime(path) if self.size else time.time()
+        self.period = _period(started)
+
+    def write(self, data: str):
+        if self.f is None:
+            self.open()
+        n = len(data.encode("utf-8"))
+        max_bytes = settings["max_bytes"]
+        if self.size and ((max_bytes and self.size + n > max_bytes)
+                          or (settings["rotate"] and _period(time.time()) != self.period)):
+            self.rotate()
+        self.f.write(data)
+        self.f.flush()
+        self.size += n
+
+    def rotate(self):
+        path = settings["path"]
+        self.f.close()
+        self.f = None
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime())
+        rotated, n = f"{path}.{stamp}", 0
+        while os.path.exists(rotated + ".gz"):
+            n += 1
+            rotated = f"{path}.{stamp}-{n}"
+        os.replace(path, rotated)
+        with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+        old = sorted(glob.glob(f"{glob.escape(path)}.*.gz"))
+        for p in old[:max(0, len(old) - settings["backups"])]:
+            os.remove(p)
+        self.open()
+
+
+def _run():
+    out = _File()
+    buf, size, last = [], 0, time.monotonic()
+    waiters = []
+    while True:
+        try:
+            item = _queue.get(timeout=settings["flush_interval"])
+        except queue.Empty:
+            item = None
+        batch = [] if item is None else [item]
+        # Drain whatever else is already queued into the same batch
+        while len(batch) < 1000:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        for ts, message, fields in batch:
+            if ts is _FLUSH:
+                waiters.append(message)
+                continue
+            line = _format(ts, message, fields)
+            buf.append(line)
+            size += len(line)
+        now = time.monotonic()
+        if buf and (waiters or size >= settings["buffer_bytes"] or now - last >= settings["flush_interval"]):
+            try:
+                out.write("".join(buf))
+            except OSError as e:
+                print(f"❌ Không ghi được log: {e}")
+            buf, size, last = [], 0, now
+        elif not buf:
+            last = now
+        for w in waiters:
+            w.set()
+        waiters = []
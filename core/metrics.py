@@ -0,0 +1,184 @@
+import asyncio, time
+from bisect import bisect_left
+from .logger import log
+
+# Off until configure_metrics(enabled=True); every recording call is then a
+# single flag check
+enabled = False
+# Upper bounds (ms) of the latency histogram buckets; the last one is +Inf
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum += ms
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf past the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else float("inf")
+        return float("inf")
+
+
+histograms = {}  # (name, labels) -> Histogram
+counters = {}  # (name, labels) -> int
+gauges = {}  # name -> callable returning a number
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def configure_metrics(enabled_: bool):
+    global enabled
+    enabled = bool(enabled_)
+
+
+def observe(name: str, ms: float, **labels):
+    """Record a duration in milliseconds."""
+    if not enabled:
+        return
+    key = _key(name, labels)
+    h = histograms.get(key)
+    if h is None:
+        h = histograms[key] = Histogram()
+    h.observe(ms)
+
+
+def inc(name: str, n: int = 1, **labels):
+    if not enabled:
+        return
+    key = _key(name, labels)
+    counters[key] = counters.get(key, 0) + n
+
+
+def gauge(name: str, fn):
+    """Register a callable read at export time (queue depths and the like)."""
+    gauges[name] = fn
+
+
+class timed:
+    """`with timed("name", label=...):` records the block's duration."""
+
+    __slots__ = ("name", "labels", "t0")
+
+    def __init__(self, name: str, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, (time.perf_counter() - self.t0) * 1000, **self.labels)
+        if exc_type is not None:
+            inc(f"{self.name}_errors", **self.labels)
+        return False
+
+
+async def watch_loop_lag(interval: float = 0.5):
+    """Sample how late the event loop wakes a sleeping task."""
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        if enabled:
+            observe("loop_lag_ms", max(0.0, (time.perf_counter() - t0 - interval) * 1000))
+
+
+def _labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _gauge_values():
+    for name, fn in sorted(gauges.items()):
+        try:
+            yield name, float(fn())
+        except Exception:
+            continue
+
+
+def render_prometheus() -> str:
+    """Everything recorded so far in the Prometheus text exposition format."""
+    out, typed = [], set()
+    for (name, labels), h in sorted(histograms.items()):
+        if name not in typed:
+            out.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        seen = 0
+        for bound, n in zip(BUCKETS_MS + ("+Inf",), h.counts):
+            seen += n
+            le = 'le="%s"' % bound
+            out.append(f"{name}_bucket{_labels(labels, le)} {seen}")
+        out.append(f"{name}_sum{_labels(labels)} {h.sum:.3f}")
+        out.append(f"{name}_count{_labels(labels)} {h.count}")
+    for (name, labels), n in sorted(counters.items()):
+        if name not in typed:
+            out.append(f"# TYPE {name} counter")
+            typed.add(name)
+        out.append(f"{name}{_labels(labels)} {n}")
+    for name, value in _gauge_values():
+        out.append(f"# TYPE {name} gauge")
+        out.append(f"{name} {value:g}")
+    return "\n".join(out) + "\n"
+
+
+def summary(limit: int = 20) -> list:
+    """Short human-readable lines for the admin command, slowest p99 first."""
+    rows = sorted(histograms.items(), key=lambda kv: kv[1].quantile(0.99), reverse=True)
+    lines = []
+    for (name, labels), h in rows[:limit]:
+        tag = ",".join(f"{v}" for _, v in labels)
+        lines.append(f"{name}{f'[{tag}]' if tag else ''}: n={h.count} "
+                     f"p50≤{h.quantile(0.5):g}ms p99≤{h.quantile(0.99):g}ms avg={h.sum / h.count:.1f}ms")
+    nonzero = [(k, n) for k, n in counters.items() if n]
+    for (name, labels), n in sorted(nonzero)[:limit]:
+        tag = ",".join(f"{v}" for _, v in labels)
+        lines.append(f"{name}{f'[{tag}]' if tag else ''}: {n}")
+    lines += [f"{name}: {value:g}" for name, value in _gauge_values()]
+    return lines
+
+
+async def _handle(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), 5)
+        # Drain the headers; the path does not matter
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        if request.startswith(b"GET "):
+            body = render_prometheus().encode("utf-8")
+            head = (f"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n")
+        else:
+            body = b""
+            head = "HTTP/1.1 405 Method Not Allowed\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+        writer.write(head.encode("ascii") + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(port: int, host: str = "127.0.0.1"):
+    """Plain-HTTP Prometheus endpoint. Bound to localhost unless told otherwise."""
+    server = await asyncio.start_server(_handle, host, port)
+    log(f"[METRICS] Đang phục vụ http://{host}:{port}/metrics")
+    return server
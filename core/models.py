@@ -0,0 +1,194 @@
+import sys, time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from enum import Enum
+from typing import NamedTuple
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S UTC"
+
+
+class OrderStatus(str, Enum):
+    CHO_DUYET = "⏳ Chờ duyệt"
+    DA_DUYET = "✅ Đã duyệt"
+    DANG_XU_LY = "🚀 Đang xử lý"
+    HOAN_THANH = "✅ Đã hoàn thành"
+    QUA_HAN = "⚠️ Quá hạn"
+
+    def __str__(self):
+        return self.value
+
+    @property
+    def code(self) -> int:
+        return _STATUS_CODE[self]
+
+    @classmethod
+    def from_code(cls, code: int) -> "OrderStatus":
+        return _STATUS_BY_CODE[code]
+
+
+# Codes are persisted in the compact format: only ever append to this tuple
+_STATUS_BY_CODE = (
+    OrderStatus.CHO_DUYET,
+    OrderStatus.DA_DUYET,
+    OrderStatus.DANG_XU_LY,
+    OrderStatus.HOAN_THANH,
+    OrderStatus.QUA_HAN,
+)
+_STATUS_CODE = {s: i for i, s in enumerate(_STATUS_BY_CODE)}
+
+_REMINDED = 1
+_OVERDUE = 2
+
+
+def now_ts() -> int:
+    return int(time.time())
+
+
+def fmt_time(ts) -> str:
+    """Display form used everywhere (and by the old JSON format)."""
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).strftime(TIME_FORMAT)
+
+
+def parse_time(s):
+    """Epoch seconds for an old `"%Y-%m-%d %H:%M:%S UTC"` string (suffix optional)."""
+    if not s:
+        return None
+    if " UTC" not in s:
+        s += " UTC"
+    return int(datetime.strptime(s, "%Y-%m-%d %H:%M:%S %Z").replace(tzinfo=timezone.utc).timestamp())
+
+
+def _name(s):
+    # Customer/worker names and form choices repeat across many orders
+    return sys.intern(s) if s else s
+
+
+@dataclass(slots=True, eq=False)
+class Order:
+    ma_don: str
+    user: str
+    user_id: int
+    hinh_thuc: str
+    loai: str = ""
+    so_luong: str = ""
+    ghi_chu: str = ""
+    trang_thai: OrderStatus = OrderStatus.CHO_DUYET
+    nguoi_nhan: str = None
+    nguoi_nhan_id: int = None
+    thoi_han: int = None  # epoch seconds
+    thoi_gian: int = 0  # epoch seconds
+    da_nhac_het_gio: bool = False
+    qua_han: bool = False
+    gia: int = None  # VNĐ quoted when the order was placed
+    thoi_gian_nhan: int = None  # epoch seconds the worker claimed it
+    thoi_gian_xong: int = None  # epoch seconds it was completed
+    so_lan_gia_han: int = 0
+    # Row version the SQLite store read it at; 0 for an order never stored. Not persisted
+    version: int = 0
+
+    def __post_init__(self):
+        self.user = _name(self.user)
+        self.nguoi_nhan = _name(self.nguoi_nhan)
+        self.hinh_thuc = _name(self.hinh_thuc)
+        self.loai = _name(self.loai)
+
+    @property
+    def thoi_gian_str(self) -> str:
+        return fmt_time(self.thoi_gian)
+
+    @property
+    def thoi_han_str(self) -> str:
+        return fmt_time(self.thoi_han)
+
+    # -- old JSON format: dict of strings, as written before the Order model
+
+    @classmethod
+    def from_dict(cls, ma_don: str, d: dict) -> "Order":
+        return cls(
+            ma_don=ma_don,
+            user=d.get("user", ""),
+            user_id=d.get("user_id"),
+            hinh_thuc=d.get("hinh_thuc", ""),
+            loai=d.get("loai") or "",
+            so_luong=d.get("so_luong") or "",
+            ghi_chu=d.get("ghi_chu") or "",
+            trang_thai=OrderStatus(d.get("trang_thai", OrderStatus.CHO_DUYET.value)),
+            nguoi_nhan=d.get("nguoi_nhan"),
+            nguoi_nhan_id=d.get("nguoi_nhan_id"),
+            thoi_han=parse_time(d.get("thoi_han")),
+            thoi_gian=parse_time(d.get("thoi_gian")) or 0,
+            da_nhac_het_gio=bool(d.get("da_nhac_het_gio", False)),
+            qua_han=bool(d.get("qua_han", False)),
+            gia=d.get("gia"),
+            thoi_gian_nhan=parse_time(d.get("thoi_gian_nhan")),
+            thoi_gian_xong=parse_time(d.get("thoi_gian_xong")),
+            so_lan_gia_han=d.get("so_lan_gia_han") or 0,
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "user": self.user,
+            "user_id": self.user_id,
+            "hinh_thuc": self.hinh_thuc,
+            "loai": self.loai,
+            "so_luong": self.so_luong,
+            "ghi_chu": self.ghi_chu,
+            "trang_thai": self.trang_thai.value,
+            "nguoi_nhan": self.nguoi_nhan,
+            "nguoi_nhan_id": self.nguoi_nhan_id,
+            "thoi_han": fmt_time(self.thoi_han),
+            "thoi_gian": fmt_time(self.thoi_gian),
+            "da_nhac_het_gio": self.da_nhac_het_gio,
+            "qua_han": self.qua_han,
+            "gia": self.gia,
+            "thoi_gian_nhan": fmt_time(self.thoi_gian_nhan),
+            "thoi_gian_xong": fmt_time(self.thoi_gian_xong),
+            "so_lan_gia_han": self.so_lan_gia_han,
+        }
+
+    # -- compact format: positional list, status code and flag bits.
+    # New fields are only ever appended so older rows still decode.
+
+    def to_compact(self) -> list:
+        return [
+            self.user, self.user_id, self.hinh_thuc, self.loai, self.so_luong,
+            self.ghi_chu, self.trang_thai.code, self.nguoi_nhan, self.nguoi_nhan_id,
+            self.thoi_han, self.thoi_gian,
+            (_REMINDED if self.da_nhac_het_gio else 0) | (_OVERDUE if self.qua_han else 0),
+            self.gia, self.thoi_gian_nhan, self.thoi_gian_xong, self.so_lan_gia_han,
+        ]
+
+    @classmethod
+    def from_compact(cls, ma_don: str, row: list) -> "Order":
+        flags = row[11]
+        return cls(
+            ma_don, row[0], row[1], row[2], row[3], row[4], row[5],
+            _STATUS_BY_CODE[row[6]], row[7], row[8], row[9], row[10],
+            bool(flags & _REMINDED), bool(flags & _OVERDUE),
+            row[12] if len(row) > 12 else None,
+            row[13] if len(row) > 13 else None,
+            row[14] if len(row) > 14 else None,
+            row[15] if len(row) > 15 else 0,
+        )
+
+    @classmethod
+    def decode(cls, ma_don: str, value) -> "Order":
+        """Accept either stored format."""
+        if isinstance(value, list):
+            return cls.from_compact(ma_don, value)
+        return cls.from_dict(ma_don, value)
+
+
+class OrderKey(NamedTuple):
+    """The indexed fields of an order, as seen by store listeners."""
+    trang_thai: OrderStatus
+    user_id: int
+    nguoi_nhan_id: int
+    thoi_gian: int
+    thoi_han: int
+
+    @classmethod
+    def of(cls, o: Order) -> "OrderKey":
+        return cls(o.trang_thai, o.user_id, o.nguoi_nhan_id, o.thoi_gian, o.thoi_han)
@@ -1,23 +1,164 @@
-import os, json, uuid
+import os, json, uuid, threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from .logger import log
+from .journal import Journal, encode_record, write_atomic
+from .persistence import PersistenceWriter
+from .models import Order
+from . import metrics
 
 order_file = "orders.json"
+journal_file = "orders.journal"
+# Fold the journal into a fresh snapshot once it holds this many records
+COMPACT_EVERY = 1000
+
+journal = Journal(journal_file)
+# Serializes journal/snapshot I/O between the writer thread and sync callers
+_io_lock = threading.Lock()
+# Keys saved inside batch() while the background writer is not running
+_batch = None
+
+
+def _read_snapshot():
+    """Raw snapshot: ma_don -> stored value (old dict or compact list)."""
+    with open(order_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    # An empty store has been shipped as `[]`
+    return data if isinstance(data, dict) else {}
+
+
+def _load_snapshot():
+    if not os.path.exists(order_file):
+        return {}
+    try:
+        return _read_snapshot()
+    except json.JSONDecodeError as e:
+        # Never overwrite a snapshot we could not read: move it aside so the
+        # data can still be recovered by hand.
+        bad = f"{order_file}.corrupt-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}"
+        os.replace(order_file, bad)
+        log(f"⚠️ Lỗi đọc {order_file} ({e}), đã chuyển sang {bad}")
+        print(f"❌ Lỗi đọc {order_file}, bản lỗi được giữ tại {bad}")
+        return {}
+
+
+def _apply(target: dict, rec: dict):
+    op, mid = rec.get("op"), rec.get("id")
+    if op == "put":
+        target[mid] = rec["o"]
+    elif op == "del":
+        target.pop(mid, None)
+
+
+# ma_don -> Order. Filled by load_orders(); the dict object never changes identity
 orders = {}
-if os.path.exists(order_file):
+
+
+def load_orders() -> dict:
+    """Load the snapshot, replay the journal on top and return `orders`."""
+    raw = _load_snapshot()
+    for rec in journal.replay():
+        _apply(raw, rec)
+    orders.clear()
+    for mid, value in raw.items():
+        orders[mid] = Order.decode(mid, value)
+    # A long journal left over from the last run is folded in right away
+    if journal.records >= COMPACT_EVERY:
+        save_orders()
+    return orders
+
+
+def _record(ma_don: str) -> dict:
+    if ma_don in orders:
+        return {"op": "put", "id": ma_don, "o": orders[ma_don].to_compact()}
+    return {"op": "del", "id": ma_don}
+
+
+def _compact_files():
+    """Rebuild the snapshot from snapshot + journal on disk.
+
+    Runs in the writer thread and never touches the live `orders` dict.
+    """
+    state = _read_snapshot() if os.path.exists(order_file) else {}
+    for rec in journal.replay():
+        _apply(state, rec)
+    write_atomic(order_file, json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    journal.truncate()
+
+
+def _prepare(keys) -> tuple:
+    # Encode on the loop: the Order objects may change once we hand off
+    return b"".join(encode_record(_record(k)) for k in keys), len(keys)
+
+
+def _write(payload: tuple):
+    data, count = payload
+    with _io_lock:
+        journal.write(data, count, fsync=True)
+        if journal.records >= COMPACT_EVERY:
+            _compact_files()
+
+
+writer = PersistenceWriter(_prepare, _write, name="orders")
+
+
+def save_order(ma_don: str):
+    """Record the current state of one order (or its deletion).
+
+    With the background writer running this only marks the order dirty;
+    otherwise the record is appended synchronously.
+    """
+    if writer.running:
+        writer.mark(ma_don)
+    elif _batch is not None:
+        _batch.add(ma_don)
+    else:
+        _write(_prepare([ma_don]))
+
+
+@contextmanager
+def batch():
+    """Record every save_order() made inside the block in one journal append.
+
+    The background writer already group-commits marks made without an await
+    in between; this gives the synchronous path the same single commit.
+    """
+    global _batch
+    if _batch is not None or writer.running:
+        yield
+        return
+    _batch = set()
     try:
-        with open(order_file, "r", encoding="utf-8") as f:
-            orders = json.load(f)
-    except json.JSONDecodeError:
-        log("⚠️ Lỗi đọc orders.json, khởi tạo lại dữ liệu")
-        orders = {}
+        yield
+    finally:
+        keys, _batch = _batch, None
+        if keys:
+            _write(_prepare(keys))
+
+
+def delete_order(ma_don: str):
+    """Remove an order and record the deletion in the journal."""
+    orders.pop(ma_don, None)
+    save_order(ma_don)
 
-for o in orders.values():
-    o.setdefault("da_nhac_het_gio", False)
-    o.setdefault("qua_han", False)
 
 def save_orders():
-    with open(order_file, "w", encoding="utf-8") as f:
-        json.dump(orders, f, indent=4, ensure_ascii=False)
+    """Write a full snapshot from memory and compact the journal into it."""
+    with metrics.timed("save_orders_ms"):
+        snap = {mid: o.to_compact() for mid, o in orders.items()}
+        data = json.dumps(snap, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with _io_lock:
+            write_atomic(order_file, data)
+            # Snapshot is durable before the journal goes away; replaying a journal
+            # over a newer snapshot is harmless since every record carries full state.
+            journal.truncate()
+
+
+async def flush_orders():
+    """Commit every pending change; call before shutting down."""
+    await writer.flush()
+
 
 def generate_order_id() -> str:
     return str(uuid.uuid4())[:8]
+
@@ -0,0 +1,161 @@
+import asyncio, uuid
+import discord
+from .logger import log
+from .journal import Journal, encode_record, write_atomic
+from .persistence import PersistenceWriter
+from . import metrics
+
+outbox_file = "outbox.jsonl"
+
+
+class Outbox:
+    """Durable queue of channel posts, sent concurrently in the background.
+
+    `post()` queues the post and returns at once, so interactions can be
+    acknowledged before any channel fan-out. Its `add` record is
+    group-committed (appended and fsynced in a worker thread) within
+    `delay` seconds; a crash inside that window can still lose the post.
+    A sent post gets an `ack` record; on startup every `add` without an
+    `ack` is sent again.
+    """
+
+    def __init__(self, bot, path: str = outbox_file, concurrency: int = 4, retries: int = 3,
+                 delay: float = 0.05):
+        self.bot = bot
+        self.journal = Journal(path)
+        self.retries = retries
+        self.pending = {}  # id -> record
+        self.logged = set()  # ids whose `add` is on disk and not yet acked there
+        self.writer = PersistenceWriter(self._prepare, self._write, delay=delay, name="outbox")
+        self.queue = asyncio.Queue()
+        self._sem = asyncio.Semaphore(concurrency)
+        self._task = None
+        self._inflight = set()
+        self.stats = {"posted": 0, "sent": 0, "retries": 0, "failed": 0, "replayed": 0}
+
+    def start(self):
+        if self._task is not None:
+            return
+        queued = set(self.pending)
+        for rec in self.journal.replay():
+            if rec["op"] == "add":
+                self.pending[rec["id"]] = rec
+            elif rec["op"] == "ack":
+                self.pending.pop(rec["id"], None)
+        self._compact()
+        self.logged = set(self.pending)
+        replay = [rec for mid, rec in self.pending.items() if mid not in queued]
+        for rec in replay:
+            self.queue.put_nowait(rec)
+        self.stats["replayed"] = len(replay)
+        if replay:
+            log(f"[OUTBOX] Gửi lại {len(replay)} thông báo còn tồn")
+        self._task = asyncio.create_task(self._run())
+        self.writer.start()
+
+    async def stop(self, timeout: float = 10):
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            log(f"[OUTBOX] Dừng khi còn {len(self.pending)} thông báo, sẽ gửi lại khi khởi động")
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.writer.stop()
+        self.journal.close()
+
+    def post(self, channel_id: int, content: str = None, embed: discord.Embed = None) -> str:
+        rec = {"op": "add", "id": uuid.uuid4().hex[:12], "ch": int(channel_id)}
+        if content is not None:
+            rec["content"] = content
+        if embed is not None:
+            rec["embed"] = embed.to_dict()
+        self.pending[rec["id"]] = rec
+        self.writer.mark(rec["id"])
+        self.queue.put_nowait(rec)
+        self.stats["posted"] += 1
+        return rec["id"]
+
+    def _ack(self, rec: dict):
+        self.pending.pop(rec["id"], None)
+        self.writer.mark(rec["id"])
+
+    def _prepare(self, ids) -> tuple:
+        # On the loop: an id still pending needs its `add` on disk, a sent one
+        # its `ack`. A post sent before its `add` was written needs neither.
+        adds = [self.pending[i] for i in ids if i in self.pending and i not in self.logged]
+        acks = [i for i in ids if i not in self.pending and i in self.logged]
+        return adds, acks
+
+    def _write(self, payload: tuple):
+        adds, acks = payload
+        data = b"".join(encode_record(r) for r in adds) + b"".join(encode_record({"op": "ack", "id": i}) for i in acks)
+        if data:
+            self.journal.write(data, len(adds) + len(acks), fsync=True)
+        # Commits never overlap, so the next _prepare sees this
+        self.logged.update(r["id"] for r in adds)
+        self.logged.difference_update(acks)
+        if self.journal.records > 2 * len(self.logged) + 200:
+            self._compact_file()
+
+    def _compact(self):
+        """Rewrite the file with only the posts that are still pending."""
+        self.journal.close()
+        write_atomic(self.journal.path, b"".join(encode_record(r) for r in self.pending.values()))
+        self.journal.records = len(self.pending)
+
+    def _compact_file(self):
+        # Writer thread: rebuilt from the file, never from the live `pending`
+        pending = {}
+        for rec in self.journal.replay():
+            if rec["op"] == "add":
+                pending[rec["id"]] = rec
+            else:
+                pending.pop(rec["id"], None)
+        self.journal.close()
+        write_atomic(self.journal.path, b"".join(encode_record(r) for r in pending.values()))
+        self.journal.records = len(pending)
+
+    async def _channel(self, cid: int):
+        ch = self.bot.get_channel(cid)
+        if ch is None:
+            try:
+                ch = await self.bot.fetch_channel(cid)
+            except (discord.NotFound, discord.Forbidden):
+                return None
+        return ch
+
+    async def _send(self, rec: dict):
+        try:
+            async with self._sem:
+                for attempt in range(self.retries + 1):
+                    try:
+                        ch = await self._channel(rec["ch"])
+                        if ch is None:
+                            log(f"⚠️ Không tìm thấy kênh {rec['ch']}")
+                            self.stats["failed"] += 1
+                            break
+                        embed = discord.Embed.from_dict(rec["embed"]) if "embed" in rec else None
+                        with metrics.timed("discord_rest_ms", route="channel"):
+                            await ch.send(content=rec.get("content"), embed=embed)
+                        self.stats["sent"] += 1
+                        break
+                    except (discord.HTTPException, OSError, asyncio.TimeoutError) as e:
+                        status = getattr(e, "status", None)
+                        if attempt == self.retries or (status is not None and status < 500 and status != 429):
+                            log(f"[OUTBOX] Bỏ thông báo tới kênh {rec['ch']}: {e}")
+                            self.stats["failed"] += 1
+                            break
+                        self.stats["retries"] += 1
+                        await asyncio.sleep(getattr(e, "retry_after", None) or 2 ** attempt)
+            self._ack(rec)
+        finally:
+            self.queue.task_done()
+
+    async def _run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            rec = await self.queue.get()
+            t = asyncio.create_task(self._send(rec))
+            self._inflight.add(t)
+            t.add_done_callback(self._inflight.discard)
@@ -0,0 +1,110 @@
+import asyncio
+from time import perf_counter
+from .logger import log
+from . import metrics
+
+
+class PersistenceWriter:
+    """Collects dirty keys from the event loop and group-commits them in a worker thread.
+
+    `prepare(keys)` runs on the event loop and must capture everything the
+    write needs (it sees the live data); `write(payload)` runs in a thread and
+    does the actual disk I/O. Marks that arrive while a commit is in flight
+    are picked up by the next one.
+    """
+
+    def __init__(self, prepare, write, delay: float = 0.25, name: str = "persistence"):
+        self.prepare = prepare
+        self.write = write
+        self.delay = delay
+        self.name = name
+        self._dirty = set()
+        self._wake = None
+        self._lock = None
+        self._task = None
+        self.stats = {
+            "marks": 0,
+            "coalesced": 0,
+            "commits": 0,
+            "records": 0,
+            "errors": 0,
+            "last_ms": 0.0,
+            "max_ms": 0.0,
+            "total_ms": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def start(self):
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        if self._dirty:
+            self._wake.set()
+        self._task = asyncio.create_task(self._run())
+
+    def mark(self, key):
+        self.stats["marks"] += 1
+        if key in self._dirty:
+            self.stats["coalesced"] += 1
+        self._dirty.add(key)
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            # Debounce window: let a burst of marks land in one commit
+            await asyncio.sleep(self.delay)
+            # Shielded so stop() never abandons a half-finished commit
+            await asyncio.shield(self._commit())
+
+    async def _commit(self):
+        async with self._lock:
+            self._wake.clear()
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            payload = self.prepare(keys)
+            t0 = perf_counter()
+            try:
+                await asyncio.to_thread(self.write, payload)
+            except Exception as e:
+                self.stats["errors"] += 1
+                metrics.inc("persist_errors", writer=self.name)
+                log(f"[LỖI GHI] {self.name}: {e}")
+                # Keep the keys dirty so the next commit retries them
+                self._dirty |= keys
+                self._wake.set()
+                return
+            ms = (perf_counter() - t0) * 1000
+            st = self.stats
+            st["commits"] += 1
+            st["records"] += len(keys)
+            st["last_ms"] = ms
+            st["max_ms"] = max(st["max_ms"], ms)
+            st["total_ms"] += ms
+            metrics.observe("persist_commit_ms", ms, writer=self.name)
+
+    async def flush(self):
+        """Commit everything marked so far, bypassing the debounce window."""
+        if self._lock is None:
+            return
+        await self._commit()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,106 @@
+import math
+from itertools import islice
+
+# Used when config.json has no PRICING list. A rule prices `don_gia` VNĐ per
+# `don_vi` units; `loai` / `premium` left out match any value.
+DEFAULT_RULES = (
+    {"hinh_thuc": "SL", "don_gia": 100_000, "don_vi": 1_000_000},
+    {"hinh_thuc": "RP", "premium": True, "don_gia": 120_000, "don_vi": 100_000},
+    {"hinh_thuc": "RP", "premium": False, "don_gia": 140_000, "don_vi": 100_000},
+    {"hinh_thuc": "Event", "don_gia": 650_000},
+    {"hinh_thuc": "Modul", "loai": "Tank", "don_gia": 300_000},
+    {"hinh_thuc": "Modul", "loai": "Air", "don_gia": 300_000},
+    {"hinh_thuc": "Modul", "loai": "Heli", "don_gia": 375_000},
+    {"hinh_thuc": "Modul", "loai": "Ship", "don_gia": 400_000},
+)
+
+
+def parse_quantity(so_luong) -> int:
+    """Digits of the free-text quantity ("1.000.000 SL" -> 1000000), 1 if there are none."""
+    return int("".join(filter(str.isdigit, str(so_luong or ""))) or 1)
+
+
+class PriceTable:
+    """Pricing rules compiled into a dict keyed by (HINH_THUC, LOAI, premium).
+
+    Wildcards are stored as "" / None, so a quote is at most four dict
+    lookups and no rule is re-parsed. Built once per config load; a bad rule
+    raises ValueError and the previous config stays active.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES):
+        self.table = {}
+        self.kinds = {}  # HINH_THUC -> name as written in the rules, for messages
+        for i, r in enumerate(rules):
+            try:
+                hinh_thuc = r["hinh_thuc"].strip().upper()
+                loai = (r.get("loai") or "").strip().upper()
+                premium = r.get("premium")
+                don_gia = r["don_gia"]
+                don_vi = r.get("don_vi", 1)
+            except (KeyError, TypeError, AttributeError):
+                raise ValueError(f"PRICING[{i}] cần hinh_thuc (chuỗi) và don_gia")
+            if not isinstance(don_gia, (int, float)) or don_gia < 0 or not math.isfinite(don_gia):
+                raise ValueError(f"PRICING[{i}].don_gia không hợp lệ: {don_gia!r}")
+            if not isinstance(don_vi, int) or don_vi <= 0:
+                raise ValueError(f"PRICING[{i}].don_vi phải là số nguyên dương: {don_vi!r}")
+            if premium is not None and not isinstance(premium, bool):
+                raise ValueError(f"PRICING[{i}].premium phải là true/false: {premium!r}")
+            key = (hinh_thuc, loai, premium)
+            if key in self.table:
+                raise ValueError(f"PRICING[{i}] trùng quy tắc với một dòng trước")
+            self.table[key] = (don_gia, don_vi)
+            self.kinds.setdefault(hinh_thuc, r["hinh_thuc"].strip())
+
+    def rule(self, hinh_thuc: str, loai: str = "", premium: bool = True):
+        """(don_gia, don_vi) for a kind, the most specific rule first. Raises ValueError if none."""
+        H, L = (hinh_thuc or "").strip().upper(), (loai or "").strip().upper()
+        table = self.table
+        found = (table.get((H, L, premium)) or table.get((H, L, None))
+                 or table.get((H, "", premium)) or table.get((H, "", None)))
+        if found is None:
+            raise ValueError(f"Loại {self.kinds[H]} sai." if H in self.kinds else "Hình thức sai.")
+        return found
+
+    def quote(self, hinh_thuc: str, loai: str = "", so_luong="1", premium: bool = True) -> int:
+        """Price in VNĐ. Raises ValueError for a kind with no rule."""
+        don_gia, don_vi = self.rule(hinh_thuc, loai, premium)
+        return int(parse_quantity(so_luong) / don_vi * don_gia)
+
+    def price_of(self, order, premium: bool = True):
+        """Quote for an order's fields, or None if its kind has no rule."""
+        try:
+            return self.quote(order.hinh_thuc, order.loai, order.so_luong, premium)
+        except ValueError:
+            return None
+
+    def quote_many(self, orders, premium: bool = True) -> list:
+        """Prices for many orders, None where no rule applies.
+
+        Orders repeat a handful of (hinh_thuc, loai) pairs, so each pair is
+        resolved once and the rest is one multiply per order.
+        """
+        rules = {}
+        out = []
+        for o in orders:
+            k = (o.hinh_thuc, o.loai)
+            r = rules.get(k, False)
+            if r is False:
+                try:
+                    r = self.rule(o.hinh_thuc, o.loai, premium)
+                except ValueError:
+                    r = None
+                rules[k] = r
+            out.append(None if r is None else int(parse_quantity(o.so_luong) / r[1] * r[0]))
+        return out
+
+    def priced(self, orders, chunk: int = 500):
+        """(order, price) pairs: the stamped `gia`, else a quote made in batches of `chunk`."""
+        it = iter(orders)
+        while True:
+            batch = list(islice(it, chunk))
+            if not batch:
+                return
+            quoted = iter(self.quote_many([o for o in batch if o.gia is None]))
+            for o in batch:
+                yield o, o.gia if o.gia is not None else next(quoted)
@@ -0,0 +1,109 @@
+import asyncio, heapq, itertools, time
+from .models import OrderStatus
+
+# Reminder DM goes out this many seconds before the deadline
+REMIND_BEFORE = 3600
+
+REMIND = "nhac"
+OVERDUE = "qua_han"
+
+
+class DeadlineScheduler:
+    """Min-heap of pending reminder/overdue events keyed by fire time.
+
+    Cancelling or rescheduling only drops the entry from `_live`; the stale
+    heap entry is skipped when it reaches the top (and the heap is rebuilt
+    once stale entries outnumber live ones).
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._live = {}  # (ma_don, kind) -> seq of the current heap entry
+        self._deadline = {}  # ma_don -> deadline epoch it was scheduled for
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def _push(self, when: float, ma_don: str, kind: str):
+        seq = next(self._seq)
+        self._live[(ma_don, kind)] = seq
+        heapq.heappush(self._heap, (when, seq, ma_don, kind))
+        if self._heap[0][1] == seq:
+            # New earliest event: the waiter must re-arm its timer
+            self._changed.set()
+
+    def schedule(self, ma_don: str, deadline: float, remind: bool = True):
+        """(Re)schedule the reminder and overdue events for an order."""
+        self.cancel(ma_don)
+        self._deadline[ma_don] = deadline
+        if remind:
+            self._push(max(deadline - REMIND_BEFORE, time.time()), ma_don, REMIND)
+        self._push(deadline, ma_don, OVERDUE)
+
+    def cancel(self, ma_don: str):
+        self._deadline.pop(ma_don, None)
+        self._live.pop((ma_don, REMIND), None)
+        self._live.pop((ma_don, OVERDUE), None)
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._live):
+            self._heap = [e for e in self._heap if self._live.get((e[2], e[3])) == e[1]]
+            heapq.heapify(self._heap)
+
+    def deadline(self, ma_don: str):
+        return self._deadline.get(ma_don)
+
+    def on_change(self, ma_don, old, new, order):
+        """Store listener: follows deadline changes made by any command or instance."""
+        if (new is None or new.thoi_han is None or not new.nguoi_nhan_id
+                or new.trang_thai == OrderStatus.HOAN_THANH or order.qua_han):
+            if ma_don in self._deadline:
+                self.cancel(ma_don)
+            return
+        if (old is None or old.thoi_han != new.thoi_han or old.nguoi_nhan_id != new.nguoi_nhan_id
+                or ma_don not in self._deadline):
+            self.schedule(ma_don, new.thoi_han, remind=not order.da_nhac_het_gio)
+
+    def _top(self):
+        heap = self._heap
+        while heap and self._live.get((heap[0][2], heap[0][3])) != heap[0][1]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def next_due(self):
+        top = self._top()
+        return top[0] if top else None
+
+    def pop_due(self, now: float) -> list:
+        """Remove and return every (ma_don, kind) whose time has come."""
+        due = []
+        while True:
+            top = self._top()
+            if top is None or top[0] > now:
+                break
+            heapq.heappop(self._heap)
+            _, _, ma_don, kind = top
+            del self._live[(ma_don, kind)]
+            if kind == OVERDUE:
+                self._deadline.pop(ma_don, None)
+            due.append((ma_don, kind))
+        return due
+
+    async def wait(self):
+        """Sleep until the earliest event is due, re-arming whenever it changes."""
+        while True:
+            self._changed.clear()
+            when = self.next_due()
+            if when is None:
+                await self._changed.wait()
+                continue
+            delay = when - time.time()
+            if delay <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._changed.wait(), delay)
+            except asyncio.TimeoutError:
+                return
+
+
+scheduler = DeadlineScheduler()
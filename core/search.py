@@ -0,0 +1,132 @@
+import math, re, heapq, unicodedata
+from bisect import bisect_left, insort
+
+# Weight of a word by the field it came from; a word found in several fields keeps the highest
+FIELDS = (("hinh_thuc", 3), ("loai", 2), ("user", 2), ("nguoi_nhan", 2), ("ghi_chu", 1))
+# Prefix expansion of the last query word stops after this many vocabulary terms
+MAX_EXPAND = 50
+_WORD = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Lowercase without Vietnamese diacritics: "Đã Hoàn Thành" -> "da hoan thanh"."""
+    text = text.lower().replace("đ", "d")
+    return "".join(c for c in unicodedata.normalize("NFD", text) if not unicodedata.combining(c))
+
+
+def tokens(text: str) -> list:
+    return _WORD.findall(fold(text)) if text else []
+
+
+class SearchIndex:
+    """Inverted index over the text fields of live orders.
+
+    Kept current as a store listener: a changed order only touches the
+    posting sets of words it gained or lost, and the sorted vocabulary used
+    for prefix matches only gains or loses those words. A query intersects
+    the posting sets of its words (the last one also matches as a prefix)
+    and ranks by field weight x idf, newest first on ties.
+    """
+
+    def __init__(self):
+        self.postings = {}  # word -> set(ma_don)
+        self.docs = {}  # ma_don -> {word: weight}
+        self.meta = {}  # ma_don -> (trang_thai, thoi_gian)
+        self.vocab = []  # sorted words of `postings`, for prefix lookups
+
+    @staticmethod
+    def _words(order) -> dict:
+        words = {}
+        for field, weight in FIELDS:
+            for w in tokens(getattr(order, field) or ""):
+                if words.get(w, 0) < weight:
+                    words[w] = weight
+        return words
+
+    def rebuild(self, orders):
+        self.__init__()
+        for o in orders:
+            self._add(o.ma_don, self._words(o))
+            self.meta[o.ma_don] = (o.trang_thai, o.thoi_gian)
+        self.vocab = sorted(self.postings)
+
+    def _add(self, ma_don, words: dict):
+        self.docs[ma_don] = words
+        for w in words:
+            posting = self.postings.get(w)
+            if posting is None:
+                posting = self.postings[w] = set()
+                insort(self.vocab, w)
+            posting.add(ma_don)
+
+    def _remove(self, ma_don):
+        for w in self.docs.pop(ma_don, ()):
+            posting = self.postings.get(w)
+            if posting is not None:
+                posting.discard(ma_don)
+                if not posting:
+                    del self.postings[w]
+                    del self.vocab[bisect_left(self.vocab, w)]
+        self.meta.pop(ma_don, None)
+
+    def on_change(self, ma_don, old, new, order):
+        if order is None:
+            self._remove(ma_don)
+            return
+        words = self._words(order)
+        if self.docs.get(ma_don) != words:
+            self._remove(ma_don)
+            self._add(ma_don, words)
+        self.meta[ma_don] = (order.trang_thai, order.thoi_gian)
+
+    def _expand(self, prefix: str) -> list:
+        out = []
+        i = bisect_left(self.vocab, prefix)
+        while i < len(self.vocab) and len(out) < MAX_EXPAND and self.vocab[i].startswith(prefix):
+            out.append(self.vocab[i])
+            i += 1
+        return out
+
+    def search(self, query: str, trang_thai=None, since: int = None, until: int = None, limit: int = 10) -> list:
+        """[(score, ma_don)] best first. Every query word must match."""
+        words = tokens(query)
+        if not words:
+            return []
+        # Each query word becomes the group of indexed words it may match
+        groups = [[w] if w in self.postings else [] for w in words[:-1]]
+        groups.append(self._expand(words[-1]))
+        if not all(groups):
+            return []
+        sets = []
+        for group in groups:
+            if len(group) == 1:
+                sets.append(self.postings[group[0]])
+            else:
+                sets.append(set().union(*(self.postings[w] for w in group)))
+        sets.sort(key=len)
+        hits = sets[0].intersection(*sets[1:]) if len(sets) > 1 else sets[0]
+
+        n = len(self.docs) or 1
+        weighted = [[(w, math.log(1 + n / len(self.postings[w]))) for w in g] for g in groups]
+        single = [g[0] for g in weighted if len(g) == 1]
+        multi = [g for g in weighted if len(g) > 1]
+        filtered = trang_thai is not None or since is not None or until is not None
+
+        def ranked():
+            docs, meta = self.docs, self.meta
+            for mid in hits:
+                status, ts = meta.get(mid, (None, 0))
+                ts = ts or 0
+                if filtered and ((trang_thai is not None and status != trang_thai)
+                                 or (since is not None and ts < since) or (until is not None and ts >= until)):
+                    continue
+                doc = docs[mid]
+                score = sum(doc[w] * f for w, f in single)
+                for g in multi:
+                    score += max(doc.get(w, 0) * f for w, f in g)
+                yield round(score, 3), ts, mid
+
+        return [(score, mid) for score, _, mid in heapq.nlargest(limit, ranked())]
+
+
+search_index = SearchIndex()
@@ -0,0 +1,82 @@
+from collections import Counter
+from datetime import datetime, timezone
+
+
+def _day(ts) -> str:
+    return datetime.fromtimestamp(ts or 0, timezone.utc).strftime("%Y-%m-%d")
+
+
+class OrderStats:
+    """Order counters kept up to date from store change notifications.
+
+    Every put/delete moves one order between buckets, so reading any count
+    is O(1) and nothing ever scans the store after `rebuild()`. Archived
+    orders stay counted.
+    """
+
+    keeps_archived = True
+
+    def __init__(self, per_day: bool = True):
+        self.per_day = per_day
+        self.total = 0
+        self.by_status = Counter()
+        self.by_worker = {}  # nguoi_nhan_id -> Counter(status)
+        self.by_customer = {}  # user_id -> Counter(status)
+        self.by_day = {}  # "YYYY-MM-DD" of thoi_gian -> Counter(status)
+
+    def rebuild(self, keys):
+        self.__init__(self.per_day)
+        for _, key in keys:
+            self._add(key, 1)
+
+    @staticmethod
+    def _bump(table: dict, who, status, n: int):
+        c = table.get(who)
+        if c is None:
+            c = table[who] = Counter()
+        c[status] += n
+        if c[status] <= 0:
+            del c[status]
+            if not c:
+                del table[who]
+
+    def _add(self, key, n: int):
+        status = key.trang_thai
+        self.total += n
+        self.by_status[status] += n
+        if self.by_status[status] <= 0:
+            del self.by_status[status]
+        if key.nguoi_nhan_id:
+            self._bump(self.by_worker, key.nguoi_nhan_id, status, n)
+        if key.user_id:
+            self._bump(self.by_customer, key.user_id, status, n)
+        if self.per_day:
+            self._bump(self.by_day, _day(key.thoi_gian), status, n)
+
+    def on_change(self, ma_don, old, new, order):
+        if old == new:
+            return
+        if old is not None:
+            self._add(old, -1)
+        if new is not None:
+            self._add(new, 1)
+
+    def count(self, status) -> int:
+        return self.by_status.get(status, 0)
+
+    def worker(self, user_id: int) -> Counter:
+        return self.by_worker.get(user_id, Counter())
+
+    def customer(self, user_id: int) -> Counter:
+        return self.by_customer.get(user_id, Counter())
+
+    def day(self, day: str) -> Counter:
+        return self.by_day.get(day, Counter())
+
+    def top_workers(self, status, n: int = 5) -> list:
+        """Workers with the most orders in `status`. O(workers), not O(orders)."""
+        ranked = ((c.get(status, 0), uid) for uid, c in self.by_worker.items())
+        return sorted((r for r in ranked if r[0]), reverse=True)[:n]
+
+
+stats = OrderStats()
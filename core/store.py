@@ -0,0 +1,843 @@
+import os, json, sqlite3, heapq, time, asyncio
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from .logger import log
+from .models import Order, OrderStatus, OrderKey, now_ts
+from .index import OrderIndex
+from .orders import orders as _orders, load_orders, save_order, delete_order, writer, order_file, journal_file
+from .orders import batch as _orders_batch
+
+# Orders copied per event-loop hop while a JSON-store export runs in a thread
+EXPORT_CHUNK = 500
+
+
+def _loop_caller():
+    """`call(fn, *args)` that runs `fn` on the current event loop from a worker thread and waits.
+
+    Outside a running loop there is nothing to hand off to, so it calls directly.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return lambda fn, *args: fn(*args)
+
+    def call(fn, *args):
+        fut = Future()
+
+        def run():
+            try:
+                fut.set_result(fn(*args))
+            except BaseException as e:
+                fut.set_exception(e)
+        loop.call_soon_threadsafe(run)
+        return fut.result()
+    return call
+
+
+class OrderStore(ABC):
+    """Interface shared by every order backend.
+
+    Orders are `Order` records. Callers fetch with `get()`, change the
+    record and hand it back with `put()`; nothing is persisted until
+    `put()`/`delete()` is called.
+
+    Listeners registered with `add_listener()` get
+    `on_change(ma_don, old_key, new_key, order)` after every put/delete,
+    where the keys are `OrderKey`s (None for created/deleted orders).
+    Listeners with `keeps_archived = True` are not told about orders that
+    only moved to the archive.
+
+    Backends must implement every abstract method; one that misses any
+    fails when it is constructed rather than on first use.
+    """
+
+    def __init__(self):
+        self.listeners = []
+        self.archive = None  # OrderArchive, when ARCHIVE_AFTER_DAYS is set
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _notify(self, ma_don: str, old: OrderKey, order: Order, evicted: bool = False):
+        new = OrderKey.of(order) if order is not None else None
+        for listener in self.listeners:
+            if evicted and getattr(listener, "keeps_archived", False):
+                continue
+            listener.on_change(ma_don, old, new, order)
+
+    @abstractmethod
+    def keys(self):
+        """(ma_don, OrderKey) for every order; used to rebuild listeners at startup."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def all_orders(self):
+        """Every order, in no particular order; for listeners that need full records."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, ma_don: str) -> Order:
+        raise NotImplementedError
+
+    @abstractmethod
+    def put(self, order: Order):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, ma_don: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def evict(self, ma_don: str):
+        """Drop an order that has been copied to the archive."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def batch(self):
+        """Context manager committing every put/delete made inside the block together."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim(self, ma_don: str, nguoi_nhan: str, nguoi_nhan_id: int, deadline: int) -> Order:
+        """Assign an unclaimed order to a worker, atomically.
+
+        Returns the updated order, or None if it does not exist or someone
+        else already holds it.
+        """
+        raise NotImplementedError
+
+    async def lookup(self, ma_don: str) -> Order:
+        """Live order, or the archived copy if it has been archived. Read-only use."""
+        o = self.get(ma_don)
+        if o is None and self.archive is not None:
+            o = await self.archive.get(ma_don)
+        return o
+
+    def __contains__(self, ma_don) -> bool:
+        return self.get(ma_don) is not None
+
+    @abstractmethod
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def find(self, trang_thai=None, nguoi_nhan_id=None, user_id=None, limit=None) -> list:
+        """Orders matching every given filter, newest `thoi_gian` first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_orders(self, trang_thai=None, nguoi_nhan_id=None, user_id=None,
+                    before=None, after=None, limit: int = 10) -> list:
+        """One page of orders, newest first.
+
+        `before`/`after` are `(thoi_gian, ma_don)` cursors taken from the last
+        or first order of the current page.
+        """
+        raise NotImplementedError
+
+    def iter_export(self, trang_thai=None, since: int = None, until: int = None):
+        """A zero-argument callable yielding matching orders, live and archived, oldest first.
+
+        The callable is meant to run in a worker thread: it must not touch
+        anything the event loop may be using at the same time.
+        """
+        live = self._export_live(trang_thai, since, until)
+        if self.archive is None:
+            return live
+        archived = self.archive.export_rows(trang_thai, since, until, self._live_ids(since, until))
+        return lambda: heapq.merge(live(), archived(), key=lambda o: (o.thoi_gian or 0, o.ma_don))
+
+    def iter_created_before(self, statuses, before: int):
+        """A zero-argument callable yielding live orders in `statuses` created before `before`.
+
+        Meant for a worker thread, like `iter_export`: the matches are picked
+        through the status index (or SQL) and only they are decoded.
+        """
+        parts = [self._export_live(s, None, before) for s in statuses]
+        return lambda: (o for part in parts for o in part())
+
+    @abstractmethod
+    def _export_live(self, trang_thai, since, until):
+        """`iter_export` over live orders only, ordered by (thoi_gian, ma_don)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _live_ids(self, since, until):
+        """Zero-argument callable, safe in a worker thread, returning the live ids created in [since, until)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_due(self, before: int = None) -> list:
+        """Assigned orders not yet flagged overdue whose `thoi_han` is <= `before` (any, if None)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_by_status(self) -> dict:
+        raise NotImplementedError
+
+    def start(self):
+        """Start background work; needs a running event loop."""
+
+    async def close(self):
+        """Flush and release resources."""
+
+
+class JsonOrderStore(OrderStore):
+    """The journaled `orders.json` dict from `core.orders`. Queries are scans."""
+
+    def __init__(self):
+        super().__init__()
+        self.orders = load_orders()
+        # Orders are mutated in place before put(), so the previous indexed
+        # fields have to be remembered here for listeners
+        self._keys = {mid: OrderKey.of(o) for mid, o in self.orders.items()}
+        self.index = OrderIndex()
+        self.index.rebuild(self._keys.items())
+        self.add_listener(self.index)
+
+    def keys(self):
+        return self._keys.items()
+
+    def all_orders(self):
+        return self.orders.values()
+
+    def get(self, ma_don):
+        return self.orders.get(ma_don)
+
+    def put(self, order):
+        self.orders[order.ma_don] = order
+        save_order(order.ma_don)
+        old = self._keys.get(order.ma_don)
+        self._keys[order.ma_don] = OrderKey.of(order)
+        self._notify(order.ma_don, old, order)
+
+    def delete(self, ma_don, evicted=False):
+        delete_order(ma_don)
+        old = self._keys.pop(ma_don, None)
+        if old is not None:
+            self._notify(ma_don, old, None, evicted)
+
+    def evict(self, ma_don):
+        self.delete(ma_don, evicted=True)
+
+    def batch(self):
+        # Listeners still hear about each change as it happens; only the
+        # journal write is held back until the block ends
+        return _orders_batch()
+
+    def claim(self, ma_don, nguoi_nhan, nguoi_nhan_id, deadline):
+        # Single process, no await in between: check-then-set cannot interleave
+        o = self.orders.get(ma_don)
+        if o is None or o.nguoi_nhan_id:
+            return None
+        _assign(o, nguoi_nhan, nguoi_nhan_id, deadline)
+        self.put(o)
+        return o
+
+    def __contains__(self, ma_don):
+        return ma_don in self.orders
+
+    def __len__(self):
+        return len(self.orders)
+
+    def find(self, trang_thai=None, nguoi_nhan_id=None, user_id=None, limit=None):
+        it = (
+            o for o in self.orders.values()
+            if (trang_thai is None or o.trang_thai == trang_thai)
+            and (nguoi_nhan_id is None or o.nguoi_nhan_id == nguoi_nhan_id)
+            and (user_id is None or o.user_id == user_id)
+        )
+        key = lambda o: o.thoi_gian
+        if limit is not None:
+            return heapq.nlargest(limit, it, key=key)
+        return sorted(it, key=key, reverse=True)
+
+    def list_orders(self, trang_thai=None, nguoi_nhan_id=None, user_id=None,
+                    before=None, after=None, limit=10):
+        ids = self.index.page(self._keys, trang_thai, nguoi_nhan_id, user_id, before, after, limit)
+        return [self.orders[mid] for mid in ids]
+
+    def _live_ids(self, since, until):
+        ids = frozenset(self.orders)
+        return lambda: ids
+
+    def _export_live(self, trang_thai, since, until):
+        # The id slice is taken here, on the loop. The live Order objects keep
+        # changing while the thread runs, so each chunk is copied to compact
+        # rows back on the loop and only those copies are decoded in the thread
+        ids = self.index.between(trang_thai, since, until)
+        orders = self.orders
+        call = _loop_caller()
+
+        def copy(chunk):
+            out = []
+            for mid in chunk:
+                o = orders.get(mid)
+                if o is not None:
+                    out.append((mid, o.to_compact()))
+            return out
+
+        def rows():
+            for i in range(0, len(ids), EXPORT_CHUNK):
+                for mid, row in call(copy, ids[i:i + EXPORT_CHUNK]):
+                    yield Order.decode(mid, row)
+        return rows
+
+    def find_due(self, before=None):
+        return [
+            o for o in self.orders.values()
+            if o.thoi_han is not None and o.nguoi_nhan_id
+            and not o.qua_han and (before is None or o.thoi_han <= before)
+        ]
+
+    def count_by_status(self):
+        counts = {}
+        for o in self.orders.values():
+            counts[o.trang_thai] = counts.get(o.trang_thai, 0) + 1
+        return counts
+
+    def start(self):
+        writer.start()
+
+    async def close(self):
+        await writer.stop()
+
+
+# user_version 2: status codes and epoch timestamps in the indexed columns,
+# compact rows in `data`. Version 1 (text columns, old dict rows) is upgraded
+# in place on open. user_version 3 adds the per-row `version` counter.
+_SCHEMA_VERSION = 3
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    ma_don        TEXT PRIMARY KEY,
+    trang_thai    INTEGER NOT NULL,
+    user_id       INTEGER,
+    nguoi_nhan_id INTEGER,
+    thoi_gian     INTEGER,
+    thoi_han      INTEGER,
+    qua_han       INTEGER NOT NULL DEFAULT 0,
+    data          TEXT NOT NULL,
+    version       INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_orders_trang_thai ON orders(trang_thai, thoi_gian);
+CREATE INDEX IF NOT EXISTS idx_orders_nguoi_nhan ON orders(nguoi_nhan_id, thoi_gian);
+CREATE INDEX IF NOT EXISTS idx_orders_user       ON orders(user_id, thoi_gian);
+CREATE INDEX IF NOT EXISTS idx_orders_thoi_gian  ON orders(thoi_gian);
+CREATE INDEX IF NOT EXISTS idx_orders_thoi_han   ON orders(thoi_han) WHERE thoi_han IS NOT NULL;
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+# Only created when several bot processes share the database (MULTI_INSTANCE)
+_SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq    INTEGER PRIMARY KEY AUTOINCREMENT,
+    ma_don TEXT NOT NULL,
+    kind   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name    TEXT PRIMARY KEY,
+    holder  TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+_INDEXES = ("idx_orders_trang_thai", "idx_orders_nguoi_nhan", "idx_orders_user",
+            "idx_orders_thoi_gian", "idx_orders_thoi_han")
+# The columns `_row()` fills; `version` is left to its default or bumped in SQL
+_COLUMNS = "ma_don, trang_thai, user_id, nguoi_nhan_id, thoi_gian, thoi_han, qua_han, data"
+_INSERT = f"INSERT INTO orders ({_COLUMNS}) VALUES (?,?,?,?,?,?,?,?)"
+
+
+class OrderConflict(RuntimeError):
+    """The order changed (or was deleted) in the database after it was read."""
+
+    def __init__(self, ma_don: str):
+        super().__init__(f"Đơn {ma_don} vừa được thay đổi ở nơi khác")
+        self.ma_don = ma_don
+
+
+def _row(o: Order) -> tuple:
+    return (
+        o.ma_don, o.trang_thai.code, o.user_id, o.nguoi_nhan_id,
+        o.thoi_gian, o.thoi_han, int(o.qua_han),
+        json.dumps(o.to_compact(), ensure_ascii=False, separators=(",", ":")),
+    )
+
+
+def _decode(ma_don: str, data: str, version: int = 0) -> Order:
+    o = Order.decode(ma_don, json.loads(data))
+    o.version = version
+    return o
+
+
+def _assign(o: Order, nguoi_nhan: str, nguoi_nhan_id: int, deadline: int):
+    o.nguoi_nhan = nguoi_nhan
+    o.nguoi_nhan_id = nguoi_nhan_id
+    o.trang_thai = OrderStatus.DANG_XU_LY
+    o.thoi_han = deadline
+    o.thoi_gian_nhan = now_ts()
+    o.da_nhac_het_gio = False
+    o.qua_han = False
+
+
+class SqliteOrderStore(OrderStore):
+    """SQLite in WAL mode. Indexed columns are copied out of the order on write.
+
+    Writes are single-row statements in autocommit mode; with WAL and
+    synchronous=NORMAL they cost O(log n) and do not fsync per commit.
+
+    With `shared=True` several processes use the same file: every write also
+    appends to a `changes` table in the same transaction, and `poll_changes()`
+    replays other processes' writes to this process's listeners.
+
+    Every row carries a `version`. `put()` only lands over the version the
+    order was read at and raises `OrderConflict` otherwise, so a write made
+    from a stale read never silently undoes another instance's change.
+    """
+
+    def __init__(self, path: str = "orders.db", shared: bool = False):
+        super().__init__()
+        self.path = path
+        self.shared = shared
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA busy_timeout=5000")
+        self._upgrade()
+        if shared:
+            self.db.executescript(_SHARED_SCHEMA)
+            # Last indexed state of every order as this process's listeners saw it
+            self._known = {}
+            self._own = set()  # change-log rows written by this process
+            self._seq = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        self._batch = None  # changes waiting for the open batch() to commit
+
+    def _upgrade(self):
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        exists = self.db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'orders'").fetchone()
+        if exists and version < 2:
+            self.db.execute("BEGIN")
+            for name in _INDEXES:
+                self.db.execute(f"DROP INDEX IF EXISTS {name}")
+            self.db.execute("ALTER TABLE orders RENAME TO orders_v1")
+            # executescript() would commit early; run the DDL inside this transaction
+            for stmt in _SCHEMA.split(";"):
+                if stmt.strip():
+                    self.db.execute(stmt)
+            old = self.db.execute("SELECT ma_don, data FROM orders_v1").fetchall()
+            self.db.executemany(_INSERT,
+                                (_row(_decode(mid, data)) for mid, data in old))
+            self.db.execute("DROP TABLE orders_v1")
+            self.db.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            self.db.execute("COMMIT")
+            log(f"[DI CHUYỂN] Đã nâng cấp {len(old)} đơn trong {self.path} lên schema v{_SCHEMA_VERSION}")
+        else:
+            if exists and version < 3:
+                self.db.execute("ALTER TABLE orders ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            self.db.executescript(_SCHEMA)
+            self.db.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    def keys(self):
+        rows = self.db.execute("SELECT ma_don, trang_thai, user_id, nguoi_nhan_id, thoi_gian, thoi_han FROM orders")
+        for mid, code, uid, nid, tg, th in rows:
+            key = OrderKey(OrderStatus.from_code(code), uid, nid, tg, th)
+            if self.shared:
+                self._known[mid] = key
+            yield mid, key
+
+    def all_orders(self):
+        for mid, data in self.db.execute("SELECT ma_don, data FROM orders"):
+            yield _decode(mid, data)
+
+    def _key(self, ma_don):
+        if self.shared:
+            return self._known.get(ma_don)
+        if not self.listeners:
+            return None
+        row = self.db.execute(
+            "SELECT trang_thai, user_id, nguoi_nhan_id, thoi_gian, thoi_han FROM orders WHERE ma_don = ?",
+            (ma_don,)).fetchone()
+        return OrderKey(OrderStatus.from_code(row[0]), *row[1:]) if row else None
+
+    def get(self, ma_don):
+        row = self.db.execute("SELECT data, version FROM orders WHERE ma_don = ?", (ma_don,)).fetchone()
+        return _decode(ma_don, *row) if row else None
+
+    def _write(self, ma_don: str, kind: str, sql: str, args) -> int:
+        """Run one row change; in shared mode log it to `changes` in the same transaction."""
+        if not self.shared:
+            return self.db.execute(sql, args).rowcount
+        if self._batch is not None:
+            n = self.db.execute(sql, args).rowcount
+            if n:
+                cur = self.db.execute("INSERT INTO changes (ma_don, kind) VALUES (?, ?)", (ma_don, kind))
+                self._own.add(cur.lastrowid)
+            return n
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            n = self.db.execute(sql, args).rowcount
+            if n:
+                cur = self.db.execute("INSERT INTO changes (ma_don, kind) VALUES (?, ?)", (ma_don, kind))
+                self._own.add(cur.lastrowid)
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+        return n
+
+    def _written(self, ma_don, old, order, evicted=False):
+        """Listener bookkeeping for a committed row change; held back while a batch is open."""
+        if self._batch is not None:
+            self._batch.append((ma_don, old, order, evicted))
+            return
+        if self.shared:
+            if order is None:
+                self._known.pop(ma_don, None)
+            else:
+                self._known[ma_don] = OrderKey.of(order)
+        if old is not None or order is not None:
+            self._notify(ma_don, old, order, evicted)
+
+    @contextmanager
+    def batch(self):
+        # One transaction; listeners only hear about the changes once it commits
+        if self._batch is not None:
+            yield
+            return
+        self.db.execute("BEGIN IMMEDIATE")
+        self._batch = []
+        try:
+            yield
+        except BaseException:
+            self._batch = None
+            self.db.execute("ROLLBACK")
+            raise
+        done, self._batch = self._batch, None
+        self.db.execute("COMMIT")
+        for change in done:
+            self._written(*change)
+
+    def put(self, order):
+        """Write `order` back over the row version it was read at.
+
+        Raises `OrderConflict` if the row changed or went away since (another
+        instance wrote it first); nothing is written then.
+        """
+        old = self._key(order.ma_don)
+        row = _row(order)
+        if order.version:
+            n = self._write(order.ma_don, "put",
+                            "UPDATE orders SET trang_thai = ?, user_id = ?, nguoi_nhan_id = ?, thoi_gian = ?,"
+                            " thoi_han = ?, qua_han = ?, data = ?, version = version + 1"
+                            " WHERE ma_don = ? AND version = ?",
+                            row[1:] + (order.ma_don, order.version))
+        else:
+            try:
+                n = self._write(order.ma_don, "put", _INSERT, row)
+            except sqlite3.IntegrityError:
+                n = 0
+        if not n:
+            raise OrderConflict(order.ma_don)
+        order.version += 1
+        self._written(order.ma_don, old, order)
+
+    def claim(self, ma_don, nguoi_nhan, nguoi_nhan_id, deadline):
+        # Compare-and-set on the row version. Another write landing between the
+        # read and the update means reading again; an order someone holds is
+        # given up right away
+        while True:
+            o = self.get(ma_don)
+            if o is None or o.nguoi_nhan_id:
+                return None
+            old = self._key(ma_don) or OrderKey.of(o)
+            _assign(o, nguoi_nhan, nguoi_nhan_id, deadline)
+            row = _row(o)
+            n = self._write(ma_don, "put",
+                            "UPDATE orders SET trang_thai = ?, nguoi_nhan_id = ?, thoi_han = ?, qua_han = ?, data = ?,"
+                            " version = version + 1 WHERE ma_don = ? AND version = ?",
+                            (row[1], row[3], row[5], row[6], row[7], ma_don, o.version))
+            if n:
+                o.version += 1
+                self._written(ma_don, old, o)
+                return o
+
+    def put_many(self, items):
+        """Bulk import in one transaction. Listeners are not notified."""
+        self.db.execute("BEGIN")
+        try:
+            self.db.executemany(f"INSERT OR REPLACE INTO orders ({_COLUMNS}) VALUES (?,?,?,?,?,?,?,?)",
+                                (_row(o) for o in items))
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def delete(self, ma_don, evicted=False):
+        old = self._key(ma_don)
+        self._write(ma_don, "evict" if evicted else "del", "DELETE FROM orders WHERE ma_don = ?", (ma_don,))
+        self._written(ma_don, old, None, evicted)
+
+    def evict(self, ma_don):
+        self.delete(ma_don, evicted=True)
+
+    def __contains__(self, ma_don):
+        return self.db.execute("SELECT 1 FROM orders WHERE ma_don = ?", (ma_don,)).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    def find(self, trang_thai=None, nguoi_nhan_id=None, user_id=None, limit=None):
+        where, args = [], []
+        if trang_thai is not None:
+            trang_thai = OrderStatus(trang_thai).code
+        for col, val in (("trang_thai", trang_thai), ("nguoi_nhan_id", nguoi_nhan_id), ("user_id", user_id)):
+            if val is not None:
+                where.append(f"{col} = ?")
+                args.append(val)
+        sql = "SELECT ma_don, data, version FROM orders"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY thoi_gian DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        return [_decode(*r) for r in self.db.execute(sql, args)]
+
+    def list_orders(self, trang_thai=None, nguoi_nhan_id=None, user_id=None,
+                    before=None, after=None, limit=10):
+        where, args = [], []
+        if trang_thai is not None:
+            trang_thai = OrderStatus(trang_thai).code
+        for col, val in (("trang_thai", trang_thai), ("nguoi_nhan_id", nguoi_nhan_id), ("user_id", user_id)):
+            if val is not None:
+                where.append(f"{col} = ?")
+                args.append(val)
+        if before is not None:
+            where.append("(thoi_gian, ma_don) < (?, ?)")
+            args += list(before)
+        if after is not None:
+            where.append("(thoi_gian, ma_don) > (?, ?)")
+            args += list(after)
+        sql = "SELECT ma_don, data, version FROM orders"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        # Walking up from an `after` cursor, then flipping, keeps pages stable
+        sql += " ORDER BY thoi_gian {0}, ma_don {0} LIMIT ?".format("ASC" if after is not None else "DESC")
+        args.append(limit)
+        rows = [_decode(*r) for r in self.db.execute(sql, args)]
+        if after is not None:
+            rows.reverse()
+        return rows
+
+    def _live_ids(self, since, until):
+        path = self.path
+
+        def ids():
+            # thoi_gian never changes, so a live copy of an archived order is in the same range
+            db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                return {mid for (mid,) in db.execute(
+                    "SELECT ma_don FROM orders WHERE thoi_gian >= ? AND thoi_gian < ?",
+                    (since if since is not None else -2**63, until if until is not None else 2**63 - 1))}
+            finally:
+                db.close()
+        return ids
+
+    def _export_live(self, trang_thai, since, until):
+        where, args = [], []
+        if trang_thai is not None:
+            where.append("trang_thai = ?")
+            args.append(OrderStatus(trang_thai).code)
+        if since is not None:
+            where.append("thoi_gian >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("thoi_gian < ?")
+            args.append(until)
+        sql = "SELECT ma_don, data FROM orders"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY thoi_gian, ma_don"
+        path = self.path
+
+        def rows():
+            # Own read-only connection: sqlite3 connections stay on their thread,
+            # and a WAL reader sees one consistent snapshot without blocking writers
+            db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                for mid, data in db.execute(sql, args):
+                    yield _decode(mid, data)
+            finally:
+                db.close()
+        return rows
+
+    def find_due(self, before=None):
+        rows = self.db.execute(
+            "SELECT ma_don, data, version FROM orders WHERE thoi_han IS NOT NULL AND thoi_han <= ?"
+            " AND nguoi_nhan_id IS NOT NULL AND qua_han = 0",
+            (2 ** 63 - 1 if before is None else before,),
+        )
+        return [_decode(*r) for r in rows]
+
+    def count_by_status(self):
+        rows = self.db.execute("SELECT trang_thai, COUNT(*) FROM orders GROUP BY trang_thai")
+        return {OrderStatus.from_code(code): n for code, n in rows}
+
+    def poll_changes(self) -> int:
+        """Replay writes made by other processes to the local listeners. Returns how many orders changed."""
+        rows = self.db.execute("SELECT seq, ma_don, kind FROM changes WHERE seq > ? ORDER BY seq",
+                               (self._seq,)).fetchall()
+        if not rows:
+            return 0
+        first = self.db.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+        if first > self._seq + 1:
+            # Fell behind the pruned log: compare against every row instead
+            self._seq = rows[-1][0]
+            self._own.clear()
+            return self._resync()
+        self._seq = rows[-1][0]
+        last = {}
+        for seq, mid, kind in rows:
+            if seq in self._own:
+                self._own.discard(seq)
+            else:
+                last[mid] = kind
+        n = 0
+        for mid, kind in last.items():
+            order = self.get(mid)
+            new = OrderKey.of(order) if order is not None else None
+            old = self._known.get(mid)
+            if old is None and new is None:
+                continue
+            if new is None:
+                self._known.pop(mid, None)
+            else:
+                self._known[mid] = new
+            self._notify(mid, old, order, evicted=kind == "evict")
+            n += 1
+        return n
+
+    def _resync(self) -> int:
+        seen, n = set(), 0
+        for mid, data in self.db.execute("SELECT ma_don, data FROM orders").fetchall():
+            seen.add(mid)
+            order = _decode(mid, data)
+            new, old = OrderKey.of(order), self._known.get(mid)
+            if old != new:
+                self._known[mid] = new
+                self._notify(mid, old, order)
+                n += 1
+        for mid in [m for m in self._known if m not in seen]:
+            self._notify(mid, self._known.pop(mid), None)
+            n += 1
+        return n
+
+    def prune_changes(self, keep: int = 100000):
+        """Drop old change-log rows; processes that fall further behind resync in full."""
+        self.db.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (keep,))
+
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """Take or renew lease `name` for `ttl` seconds unless another live holder has it."""
+        now = time.time()
+        cur = self.db.execute(
+            "INSERT INTO leases (name, holder, expires) VALUES (?, ?, ?)"
+            " ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires"
+            " WHERE leases.holder = excluded.holder OR leases.expires < ?",
+            (name, holder, now + ttl, now))
+        return cur.rowcount == 1
+
+    def release_lease(self, name: str, holder: str):
+        self.db.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+    def meta(self, key: str, value=None):
+        if value is None:
+            row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    async def close(self):
+        self.db.close()
+
+
+def migrate_json_to_sqlite(db: SqliteOrderStore) -> int:
+    """Copy `orders.json` (+ journal) into `db` once. Returns the number of orders copied."""
+    if db.meta("migrated_from_json"):
+        return 0
+    if not (os.path.exists(order_file) or os.path.exists(journal_file)):
+        db.meta("migrated_from_json", "none")
+        return 0
+    data = load_orders()
+    n = len(data)
+    db.put_many(data.values())
+    db.meta("migrated_from_json", datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC"))
+    # The dict is not used by the SQLite backend; don't keep it around
+    _orders.clear()
+    log(f"[DI CHUYỂN] Đã chép {n} đơn từ {order_file} sang {db.path}")
+    return n
+
+
+_store = None
+
+
+def get_store() -> OrderStore:
+    """The process-wide order store, created from config on first use."""
+    global _store
+    if _store is None:
+        from .config import get_config
+        config = get_config()
+        backend = str(config.get("STORE_BACKEND", "json")).lower()
+        shared = bool(config.get("MULTI_INSTANCE", False))
+        if shared and backend != "sqlite":
+            raise RuntimeError("MULTI_INSTANCE cần STORE_BACKEND=sqlite (orders.json chỉ dùng được cho một tiến trình)")
+        if backend == "sqlite":
+            _store = SqliteOrderStore(config.get("STORE_PATH", "orders.db"), shared=shared)
+            n = migrate_json_to_sqlite(_store)
+            if n:
+                print(f"✅ Đã chuyển {n} đơn từ {order_file} sang SQLite")
+        elif backend == "json":
+            _store = JsonOrderStore()
+        else:
+            raise RuntimeError(f"STORE_BACKEND không hợp lệ: {backend}")
+        if float(config.get("ARCHIVE_AFTER_DAYS", 0) or 0) > 0:
+            from .archive import OrderArchive
+            _store.archive = OrderArchive(config.get("ARCHIVE_PATH", "archive"))
+        _wire(_store)
+    return _store
+
+
+def _wire(store: OrderStore):
+    """Attach the in-memory views that follow every store change."""
+    from itertools import chain
+    from .stats import stats
+    from .index import autocomplete
+    from .scheduler import scheduler
+    from .search import search_index
+    from .analytics import analytics, row_of
+    # Counters cover archived orders too; autocomplete only offers live ones
+    archived = store.archive.keys() if store.archive is not None else ()
+    stats.rebuild(chain(store.keys(), archived))
+    autocomplete.rebuild(store.keys())
+    store.add_listener(stats)
+    store.add_listener(autocomplete)
+    search_index.rebuild(store.all_orders())
+    store.add_listener(search_index)
+    from .config import get_config
+    history = store.archive.history() if store.archive is not None else ()
+    # Unstamped live orders are quoted in batches rather than one by one
+    live = (row_of(o, gia) for o, gia in get_config().pricing.priced(store.all_orders()))
+    analytics.rebuild(chain(history, live))
+    store.add_listener(analytics)
+    # Seeded by the monitor (load_deadlines); from then on follows every change
+    store.add_listener(scheduler)
+
+
+if __name__ == "__main__":
+    # python -m core.store orders.db  -> one-shot migration without starting the bot
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else "orders.db"
+    n = migrate_json_to_sqlite(SqliteOrderStore(path))
+    print(f"Đã chuyển {n} đơn sang {path}")
@@ -2,57 +2,88 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import asyncio
-from datetime import datetime, timezone
-from core.orders import orders, save_orders
+import time
+from core.store import get_store, OrderConflict
+from core.scheduler import scheduler, REMIND, OVERDUE
+from core.models import OrderStatus
 from core.logger import log
-from core.config import load_config
+from core.config import get_config
+from core import metrics
 import discord
 
-async def don_giam_sat(bot):
-    config = load_config()
-    NOTIFY_CHANNEL_ID = int(config["NOTIFY_CHANNEL_ID"])
+
+def load_deadlines(store):
+    """Seed the scheduler with every assigned order that can still fire."""
+    n = 0
+    for o in store.find_due():
+        if o.trang_thai == OrderStatus.HOAN_THANH:
+            continue
+        scheduler.schedule(o.ma_don, o.thoi_han, remind=not o.da_nhac_het_gio)
+        n += 1
+    return n
+
+
+async def _fire_once(bot, store, notify_channel_id, mid, kind):
+    o = store.get(mid)
+    # Finished, deleted or re-assigned since it was scheduled: nothing to do
+    if o is None or o.thoi_han is None or not o.nguoi_nhan_id:
+        return
+    if o.trang_thai == OrderStatus.HOAN_THANH:
+        return
+    time_left = o.thoi_han - time.time()
+    if kind == REMIND and 0 < time_left <= 3600 and not o.da_nhac_het_gio:
+        o.da_nhac_het_gio = True
+        store.put(o)
+        mins_left = int(time_left // 60)
+        bot.dm.send(o.nguoi_nhan_id, f"⏰ Đơn `{mid}` còn {mins_left} phút! Hãy hoàn thành sớm!")
+    elif kind == OVERDUE and time_left <= 0 and not o.qua_han:
+        o.trang_thai = OrderStatus.QUA_HAN
+        o.qua_han = True
+        store.put(o)
+        # Queued: a burst of expirations must not hold up the loop
+        bot.dm.send(o.nguoi_nhan_id, f"❗ ĐƠN `{mid}` ĐÃ QUÁ HẠN! Vui lòng hoàn thành ngay!")
+        if notify_channel_id:
+            bot.outbox.post(
+                notify_channel_id,
+                f"⏰ **THÔNG BÁO QUÁ HẠN**\n"
+                f"> Người nhận: <@{o.nguoi_nhan_id}>\n"
+                f"> Mã đơn: `{mid}`\n"
+                f"> Khách hàng: <@{o.user_id}>"
+            )
+
+
+
+async def _fire(bot, store, notify_channel_id, mid, kind):
+    # put() raises before anything is sent if another instance changed the
+    # order since it was read (completed, extended...): re-read and re-check
+    while True:
+        try:
+            return await _fire_once(bot, store, notify_channel_id, mid, kind)
+        except OrderConflict:
+            continue
+
+
+async def don_giam_sat(bot, lease=None):
+    """Fire reminders and overdue notices. With several instances, only while `lease` is held."""
+    store = get_store()
     await bot.wait_until_ready()
+    log(f"[GIÁM SÁT] Đã nạp {load_deadlines(store)} hạn chót")
     while not bot.is_closed():
         try:
-            now = datetime.now(timezone.utc)
-            notif_channel = bot.get_channel(NOTIFY_CHANNEL_ID)
-            for mid, o in list(orders.items()):
-                try:
-                    if not o.get("thoi_han") or not o.get("nguoi_nhan_id"):
-                        continue
-                    deadline_str = o["thoi_han"]
-                    if " UTC" not in deadline_str:
-                        deadline_str += " UTC"
-                    deadline = datetime.strptime(deadline_str, "%Y-%m-%d %H:%M:%S %Z").replace(tzinfo=timezone.utc)
-                    time_left = (deadline - now).total_seconds()
-                    if 0 < time_left <= 3600 and not o["da_nhac_het_gio"]:
-                        try:
-                            user = await bot.fetch_user(o["nguoi_nhan_id"])
-                            mins_left = int(time_left // 60)
-                            await user.send(f"⏰ Đơn `{mid}` còn {mins_left} phút! Hãy hoàn thành sớm!")
-                        except Exception as e:
-                            log(f"[Cảnh báo] Không gửi được nhắc nhở cho {o['nguoi_nhan_id']}: {e}")
-                        o["da_nhac_het_gio"] = True
-                        save_orders()
-                    elif time_left <= 0 and not o["qua_han"]:
-                        o["trang_thai"] = "⚠️ Quá hạn"
-                        o["qua_han"] = True
-                        save_orders()
-                        try:
-                            user = await bot.fetch_user(o["nguoi_nhan_id"])
-                            await user.send(f"❗ ĐƠN `{mid}` ĐÃ QUÁ HẠN! Vui lòng hoàn thành ngay!")
-                        except:
-                            log(f"[Cảnh báo] Không gửi được thông báo quá hạn cho {o['nguoi_nhan_id']}")
-                        if notif_channel:
-                            await notif_channel.send(
-                                f"⏰ **THÔNG BÁO QUÁ HẠN**\n"
-                                f"> Người nhận: <@{o['nguoi_nhan_id']}>\n"
-                                f"> Mã đơn: `{mid}`\n"
-                                f"> Khách hàng: <@{o['user_id']}>"
-                            )
-                except Exception as e:
-                    log(f"[LỖI GIÁM SÁT] {mid}: {e}")
-            await asyncio.sleep(60)
+            # Sleeps exactly until the next reminder/deadline (or until a
+            # command schedules an earlier one)
+            await scheduler.wait()
+            if lease is not None and not lease.held:
+                # About to lose (or lost) leadership: leave the events for the next leader
+                await asyncio.sleep(1)
+                continue
+            with metrics.timed("monitor_tick_ms"):
+                for mid, kind in scheduler.pop_due(time.time()):
+                    try:
+                        await _fire(bot, store, get_config().notify_channel_id, mid, kind)
+                    except Exception as e:
+                        metrics.inc("monitor_errors")
+                        log(f"[LỖI GIÁM SÁT] {mid}: {e}")
         except Exception as e:
             log(f"[LỖI NẶNG GIÁM SÁT] {e}")
-            await asyncio.sleep(60)
+            await asyncio.sleep(5)
@@ -0,0 +1,47 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import reload_config
+from core.journal import Journal
+from core.logger import configure_logger, settings
+
+# core/__init__ re-exports the `orders` dict over the submodule attribute
+orders_module = sys.modules["core.orders"]
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _log_file(tmp_path_factory):
+    # Recovery warnings are logged; keep them out of the repo's log.txt
+    path = settings["path"]
+    configure_logger(path=str(tmp_path_factory.mktemp("log") / "log.txt"))
+    yield
+    configure_logger(path=path)
+
+
+def write_config(path, **extra):
+    """Write a minimal config.json at `path` and make it the active config."""
+    (path / "config.json").write_text(json.dumps({"TOKEN": "", "ADMIN_ID": [], **extra}), encoding="utf-8")
+    return reload_config()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in a fresh directory with its own config.json and order journal.
+
+    core.orders keeps one module-level Journal whose file handle stays open;
+    each test gets its own, closed on teardown, so no test appends into the
+    directory of an earlier one.
+    """
+    monkeypatch.chdir(tmp_path)
+    write_config(tmp_path)
+    journal = Journal(orders_module.journal_file)
+    monkeypatch.setattr(orders_module, "journal", journal)
+    orders_module.orders.clear()
+    yield tmp_path
+    journal.close()
+    orders_module.orders.clear()
@@ -0,0 +1,114 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+from discord import app_commands
+
+from conftest import write_config
+from core.admission import Admission, Bucket, TooManyPending
+from core.models import OrderKey, OrderStatus
+from core.stats import OrderStats
+
+admission_module = sys.modules["core.admission"]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable time.monotonic() for the admission module."""
+    now = SimpleNamespace(t=1000.0)
+    monkeypatch.setattr(admission_module, "time", SimpleNamespace(monotonic=lambda: now.t))
+    return now
+
+
+@pytest.fixture
+def pending(monkeypatch):
+    """Fresh order counters; `add(user_id, status)` records one order."""
+    counts = OrderStats(per_day=False)
+    monkeypatch.setattr(admission_module, "stats", counts)
+
+    def add(user_id, status=OrderStatus.CHO_DUYET, n=1):
+        for _ in range(n):
+            counts.on_change(None, None, OrderKey(status, user_id, None, 0, None), None)
+    return add
+
+
+def test_bucket_refills_at_rate_over_period():
+    b = Bucket(4, 60.0, now=0.0)
+    b.tokens = 0
+    assert b.retry_after() == pytest.approx(15.0)
+    b.refill(7.5, 4, 60.0)
+    assert b.tokens == pytest.approx(0.5)
+    assert b.retry_after() == pytest.approx(7.5)
+    b.refill(15.0, 4, 60.0)
+    assert b.retry_after() == 0.0
+    # Never holds more than `rate` tokens however long it sits idle
+    b.refill(10_000.0, 4, 60.0)
+    assert b.tokens == 4
+    assert b.idle(10_060.0) and not b.idle(10_059.0)
+
+
+def test_bucket_takes_new_limit_on_refill():
+    b = Bucket(10, 10.0, now=0.0)
+    b.refill(0.0, 2, 10.0)
+    assert b.tokens == 2
+
+
+def test_user_bucket_rejects_then_refills(workdir, clock):
+    write_config(workdir, RATE_LIMITS={"donhang": {"user": [2, 10]}})
+    adm = Admission()
+    adm.admit("donhang", 1)
+    adm.admit("donhang", 1)
+    with pytest.raises(app_commands.CommandOnCooldown) as e:
+        adm.admit("donhang", 1)
+    assert e.value.retry_after == pytest.approx(5.0)
+    # Other users have their own bucket
+    adm.admit("donhang", 2)
+    clock.t += 5
+    adm.admit("donhang", 1)
+    with pytest.raises(app_commands.CommandOnCooldown):
+        adm.admit("donhang", 1)
+
+
+def test_global_bucket_is_shared_and_rejection_takes_nothing(workdir, clock):
+    write_config(workdir, RATE_LIMITS={"default": {"user": [5, 10], "global": [2, 10]}})
+    adm = Admission()
+    adm.admit("timdon", 1)
+    adm.admit("timdon", 2)
+    with pytest.raises(app_commands.CommandOnCooldown):
+        adm.admit("timdon", 3)
+    # The rejected call did not spend user 3's token
+    assert adm.users[("timdon", 3)].tokens == 5
+
+
+def test_idle_user_buckets_are_dropped(workdir, clock):
+    write_config(workdir, RATE_LIMITS={"donhang": {"user": [1, 10]}})
+    adm = Admission()
+    adm.admit("donhang", 1)
+    clock.t += 5
+    adm.admit("donhang", 2)
+    clock.t += 6
+    adm.admit("donhang", 3)
+    assert [uid for _, uid in adm.users] == [2, 3]
+
+
+def test_pending_cap_is_per_user(workdir, clock, pending):
+    write_config(workdir, MAX_PENDING_ORDERS=2)
+    adm = Admission()
+    pending(1, OrderStatus.CHO_DUYET)
+    pending(1, OrderStatus.DA_DUYET)
+    pending(2, OrderStatus.CHO_DUYET)
+    with pytest.raises(TooManyPending) as e:
+        adm.admit("donhang", 1)
+    assert (e.value.pending, e.value.limit) == (2, 2)
+    adm.admit("donhang", 2)
+    # Orders already being worked on or finished do not count
+    pending(2, OrderStatus.DANG_XU_LY, n=3)
+    pending(2, OrderStatus.HOAN_THANH, n=3)
+    adm.admit("donhang", 2)
+    # Only order placement is capped
+    adm.admit("timdon", 1)
+
+
+def test_pending_cap_off_by_default(workdir, clock, pending):
+    pending(1, n=50)
+    Admission().admit("donhang", 1)
@@ -0,0 +1,185 @@
+import asyncio
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from core.archive import OrderArchive
+from core.models import Order, OrderStatus
+from core.store import OrderConflict, SqliteOrderStore
+
+store_module = sys.modules["core.store"]
+
+
+class Recorder:
+    def __init__(self):
+        self.changes = []
+
+    def on_change(self, ma_don, old, new, order):
+        self.changes.append((ma_don, old and old.trang_thai, new and new.trang_thai))
+
+
+@pytest.fixture
+def pair(workdir):
+    """Two instances sharing one database file, as with MULTI_INSTANCE."""
+    path = str(workdir / "orders.db")
+    a, b = SqliteOrderStore(path, shared=True), SqliteOrderStore(path, shared=True)
+    for s in (a, b):
+        # As at startup: listeners start from the current rows
+        list(s.keys())
+    yield a, b
+    for s in (a, b):
+        asyncio.run(s.close())
+
+
+def _claimed(store, mid="don00001") -> Order:
+    store.put(Order(mid, "khách", 1, "SL"))
+    return store.claim(mid, "thợ", 2, 2_000_000_000)
+
+
+def test_stale_write_is_rejected_not_lost(pair):
+    a, b = pair
+    _claimed(a)
+    on_a, on_b = a.get("don00001"), b.get("don00001")
+    on_a.trang_thai = OrderStatus.HOAN_THANH
+    a.put(on_a)
+    # B extends from its read made before A's completion
+    on_b.thoi_han += 600
+    with pytest.raises(OrderConflict):
+        b.put(on_b)
+    assert b.get("don00001").trang_thai == OrderStatus.HOAN_THANH
+    # Read again, B's write goes through on top of A's
+    fresh = b.get("don00001")
+    fresh.ghi_chu = "ghi chú"
+    b.put(fresh)
+    assert (a.get("don00001").trang_thai, a.get("don00001").ghi_chu) == (OrderStatus.HOAN_THANH, "ghi chú")
+
+
+def test_write_over_deleted_order_is_rejected(pair):
+    a, b = pair
+    _claimed(a)
+    stale = b.get("don00001")
+    a.delete("don00001")
+    with pytest.raises(OrderConflict):
+        b.put(stale)
+    assert "don00001" not in a
+
+
+def test_conflict_rolls_back_the_whole_batch(pair):
+    a, b = pair
+    a.put(Order("don00001", "khách", 1, "SL"))
+    a.put(Order("don00002", "khách", 1, "SL"))
+    first, second = b.get("don00001"), b.get("don00002")
+    changed = a.get("don00002")
+    changed.ghi_chu = "sửa trên A"
+    a.put(changed)
+    with pytest.raises(OrderConflict):
+        with b.batch():
+            for o in (first, second):
+                o.trang_thai = OrderStatus.DA_DUYET
+                b.put(o)
+    assert a.get("don00001").trang_thai == OrderStatus.CHO_DUYET
+
+
+def test_claim_is_compare_and_set(pair):
+    a, b = pair
+    a.put(Order("don00001", "khách", 1, "SL"))
+    assert a.claim("don00001", "thợ A", 2, 2_000_000_000) is not None
+    assert b.claim("don00001", "thợ B", 3, 2_000_000_000) is None
+    assert b.get("don00001").nguoi_nhan_id == 2
+    assert b.claim("khongco", "thợ B", 3, 2_000_000_000) is None
+
+
+def test_claim_keeps_concurrent_edit(pair):
+    a, b = pair
+    a.put(Order("don00001", "khách", 1, "SL"))
+    note = b.get("don00001")
+    note.ghi_chu = "gấp"
+    b.put(note)
+    o = a.claim("don00001", "thợ", 2, 2_000_000_000)
+    assert (o.ghi_chu, b.get("don00001").ghi_chu) == ("gấp", "gấp")
+
+
+def test_lease_expiry_and_renewal(pair, monkeypatch):
+    a, b = pair
+    clock = SimpleNamespace(t=1000.0)
+    monkeypatch.setattr(store_module, "time", SimpleNamespace(time=lambda: clock.t))
+    assert a.acquire_lease("monitor", "A", 6)
+    assert not b.acquire_lease("monitor", "B", 6)
+    clock.t += 5
+    # Renewing pushes the expiry out again
+    assert a.acquire_lease("monitor", "A", 6)
+    clock.t += 5
+    assert not b.acquire_lease("monitor", "B", 6)
+    clock.t += 2
+    assert b.acquire_lease("monitor", "B", 6)
+    assert not a.acquire_lease("monitor", "A", 6)
+    b.release_lease("monitor", "B")
+    assert a.acquire_lease("monitor", "A", 6)
+
+
+def test_poll_changes_replays_other_instance_writes(pair):
+    a, b = pair
+    seen = Recorder()
+    b.add_listener(seen)
+    a.put(Order("don00001", "khách", 1, "SL"))
+    a.claim("don00001", "thợ", 2, 2_000_000_000)
+    a.put(Order("don00002", "khách", 1, "SL"))
+    a.delete("don00002")
+    assert seen.changes == []
+    # One notification per order, from what B last saw to the current row;
+    # an order created and deleted in between is never reported
+    assert b.poll_changes() == 1
+    assert seen.changes == [("don00001", None, OrderStatus.DANG_XU_LY)]
+    # B's own writes are not replayed back to it
+    o = b.get("don00001")
+    o.trang_thai = OrderStatus.HOAN_THANH
+    b.put(o)
+    seen.changes.clear()
+    assert b.poll_changes() == 0 and seen.changes == []
+    a.poll_changes()
+    assert a.get("don00001").trang_thai == OrderStatus.HOAN_THANH
+
+
+def test_poll_changes_resyncs_after_log_pruned(pair):
+    a, b = pair
+    seen = Recorder()
+    b.add_listener(seen)
+    a.put(Order("don00001", "khách", 1, "SL"))
+    b.poll_changes()
+    seen.changes.clear()
+    a.delete("don00001")
+    for i in range(2, 6):
+        a.put(Order(f"don0000{i}", "khách", 1, "SL"))
+    # B fell behind the pruned log: it compares every row instead
+    a.prune_changes(keep=1)
+    assert b.poll_changes() == 5
+    assert ("don00001", OrderStatus.CHO_DUYET, None) in seen.changes
+    assert {c[0] for c in seen.changes} == {f"don0000{i}" for i in range(1, 6)}
+
+
+def test_opening_archive_never_cuts_a_pass_in_progress(pair, workdir):
+    a, _ = pair
+    a.archive = OrderArchive(str(workdir / "archive"))
+    done = Order("don00001", "khách", 1, "SL", trang_thai=OrderStatus.HOAN_THANH, thoi_gian=1_000_000)
+    a.put(done)
+    assert asyncio.run(a.archive.archive(a, 2_000_000)) == 1
+    segment, index = workdir / "archive" / "orders-1970-01.jsonl.gz", workdir / "archive" / "index.jsonl"
+    # The leader's next pass, caught between the segment write and the index append
+    with open(segment, "ab") as f:
+        f.write(b"\x1f\x8b half a member")
+    with open(index, "ab") as f:
+        f.write(b'["a","don00002"')
+    sizes = segment.stat().st_size, index.stat().st_size
+
+    follower = OrderArchive(str(workdir / "archive"))
+    assert "don00001" in follower and "don00002" not in follower
+    assert [mid for mid, _ in follower.keys()] == ["don00001"]
+    assert (segment.stat().st_size, index.stat().st_size) == sizes
+    assert asyncio.run(follower.get("don00001")).trang_thai == OrderStatus.HOAN_THANH
+
+    # Only an archive pass (run by the lease holder) repairs a torn tail
+    assert asyncio.run(follower.archive(a, 2_000_000)) == 0
+    assert segment.stat().st_size < sizes[0] and index.read_bytes().endswith(b"\n")
+    follower.close()
+    a.archive.close()
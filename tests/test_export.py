@@ -0,0 +1,80 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from core.archive import OrderArchive
+from core.export import write_export
+from core.models import Order, OrderStatus
+from core.store import JsonOrderStore, SqliteOrderStore
+
+
+def _ts(day: str) -> int:
+    return int(datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, workdir):
+    s = JsonOrderStore() if request.param == "json" else SqliteOrderStore(str(workdir / "orders.db"))
+    s.archive = OrderArchive(str(workdir / "archive"))
+    yield s
+    asyncio.run(s.close())
+
+
+def _export(store, **filters) -> list:
+    async def run():
+        # Called on the loop, consumed in a thread: the same split as /xuatbaocao
+        rows = store.iter_export(**filters)
+        path, _, count = await asyncio.to_thread(write_export, rows, "jsonl")
+        try:
+            with open(path, encoding="utf-8") as f:
+                out = [json.loads(line) for line in f]
+        finally:
+            os.remove(path)
+        assert count == len(out)
+        return out
+    return asyncio.run(run())
+
+
+def _seed(store):
+    done = Order("old00001", "khách", 1, "SL", so_luong="2000000", trang_thai=OrderStatus.HOAN_THANH,
+                 nguoi_nhan="thợ", nguoi_nhan_id=2, thoi_han=_ts("2026-01-06"), thoi_gian=_ts("2026-01-05"))
+    store.put(done)
+    store.put(Order("new00001", "khách", 1, "SL", thoi_gian=_ts("2026-03-01")))
+    store.put(Order("new00002", "khách", 1, "Event", so_luong="1", thoi_gian=_ts("2026-03-02")))
+    assert asyncio.run(store.archive.archive(store, _ts("2026-02-01"))) == 1
+    assert "old00001" not in store and "old00001" in store.archive
+    return done
+
+
+def test_export_includes_archived_orders(store):
+    _seed(store)
+    rows = _export(store)
+    assert [r["ma_don"] for r in rows] == ["old00001", "new00001", "new00002"]
+    # Archived row is complete, priced by the current rules since it was never stamped
+    assert rows[0]["trang_thai"] == OrderStatus.HOAN_THANH.value
+    assert rows[0]["nguoi_nhan"] == "thợ"
+    assert rows[0]["gia"] == 200000
+
+
+def test_export_filters_apply_to_archive(store):
+    _seed(store)
+    assert [r["ma_don"] for r in _export(store, since=_ts("2026-02-01"))] == ["new00001", "new00002"]
+    assert [r["ma_don"] for r in _export(store, until=_ts("2026-02-01"))] == ["old00001"]
+    assert [r["ma_don"] for r in _export(store, trang_thai=OrderStatus.HOAN_THANH)] == ["old00001"]
+    assert [r["ma_don"] for r in _export(store, trang_thai=OrderStatus.CHO_DUYET)] == ["new00001", "new00002"]
+
+
+def test_export_prefers_live_copy_of_archived_order(store):
+    done = _seed(store)
+    # A crash between archiving and evicting leaves the order in both places
+    live = Order.decode(done.ma_don, done.to_compact())
+    live.trang_thai = OrderStatus.QUA_HAN
+    store.put(live)
+    rows = _export(store)
+    assert [r["ma_don"] for r in rows] == ["old00001", "new00001", "new00002"]
+    assert rows[0]["trang_thai"] == OrderStatus.QUA_HAN.value
+    # Its live status no longer matches: the stale archived copy must not stand in for it
+    assert _export(store, trang_thai=OrderStatus.HOAN_THANH) == []